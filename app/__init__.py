@@ -69,7 +69,8 @@ def create_app():
     app.logger.info("Khởi tạo ứng dụng bắt đầu...")
     
     # Khởi tạo Trình quản lý dữ liệu
-    data_manager = DataManager()
+    from config import Config
+    data_manager = DataManager(backend=Config.DATA_BACKEND)
     app.config['DATA_MANAGER'] = data_manager
     
     # Khởi tạo ứng dụng(Bao gồm cả lịch trình)
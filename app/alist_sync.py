@@ -1,13 +1,50 @@
+import contextvars
+import hashlib
 import http.client
+import itertools
 import json
 import re
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 import os
 import logging
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Union, Iterable, Iterator
 from logging.handlers import TimedRotatingFileHandler
 from typing import List, Tuple, Pattern
-from urllib.parse import unquote
+from urllib.parse import quote, unquote
+
+# Số tên tối đa trong một yêu cầu copy/move/remove
+DEFAULT_BATCH_SIZE = 100
+# Số luồng liệt kê thư mục song song
+DEFAULT_WALK_CONCURRENCY = 4
+# Số kết nối tối đa tới mỗi máy chủ trong nhóm kết nối
+DEFAULT_POOL_SIZE = 16
+# Kết nối rảnh lâu hơn thời gian này（giây）sẽ bị đóng
+DEFAULT_POOL_IDLE_TIMEOUT = 30
+# Thời gian chờ của một yêu cầu（giây）
+DEFAULT_REQUEST_TIMEOUT = 120
+# Thời gian sống của token trong bộ nhớ đệm（giây）
+DEFAULT_TOKEN_TTL = 3600
+# Chu kỳ làm mới ảnh chụp hàng đợi sao chép chưa hoàn thành（giây）
+DEFAULT_TASK_REFRESH_INTERVAL = 30
+# Ngưỡng trên/dưới của hàng đợi sao chép：tạm dừng gửi khi đạt ngưỡng trên，tiếp tục khi giảm về ngưỡng dưới（0 = tắt）
+DEFAULT_QUEUE_HIGH_WATER = 1000
+DEFAULT_QUEUE_LOW_WATER = 500
+# Chu kỳ kiểm tra lại hàng đợi khi đang tạm dừng（giây）
+DEFAULT_QUEUE_POLL_INTERVAL = 5
+# Thời gian tối đa tin cậy một thư mục trong manifest mà không liệt kê lại（giây，0 = không giới hạn）
+DEFAULT_MANIFEST_MAX_AGE = 86400
+# Số kết quả mỗi trang khi liệt kê nguồn bằng chỉ mục tìm kiếm
+DEFAULT_SEARCH_PAGE_SIZE = 1000
+# Độ cũ tối đa của chỉ mục tìm kiếm để được dùng thay cho liệt kê（giây）
+DEFAULT_SEARCH_MAX_STALENESS = 3600
+# Số mục mỗi trang khi liệt kê thư mục
+DEFAULT_LIST_PAGE_SIZE = 1000
+
 
 def normalize_filename(name: str) -> str:
     return unquote(name.strip())
@@ -58,6 +95,18 @@ def setup_logger():
 logger = setup_logger()
 
 
+def parse_iso_timestamp(date_str: str) -> Optional[float]:
+    """Phân tích thời gian ISO 8601 có múi giờ thành dấu thời gian Unix"""
+    if not date_str:
+        return None
+    # Python chỉ nhận tối đa 6 chữ số phần giây lẻ
+    value = re.sub(r"(\.\d{6})\d+", r"\1", str(date_str).replace("Z", "+00:00"))
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
 def parse_time_and_adjust_utc(date_str: str) -> datetime:
     """
     Chuỗi thời gian phân tích cú pháp，trong trường hợp củaUTCĐịnh dạng（Bao gồm'Z'）Thêm 8Giờ
@@ -84,11 +133,610 @@ def parse_time_and_adjust_utc(date_str: str) -> datetime:
     return None
 
 
+class _TLSSession:
+    """Lưu phiên TLS gần nhất của một máy chủ để tái sử dụng khi bắt tay"""
+
+    def __init__(self):
+        self.session = None
+
+
+class _ReusableHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPSConnection tái sử dụng phiên TLS của máy chủ khi kết nối lại"""
+
+    def __init__(self, host, port, tls_state: _TLSSession, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._tls_state = tls_state
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname,
+                                              session=self._tls_state.session)
+        if self.sock.session is not None:
+            self._tls_state.session = self.sock.session
+
+
+class ConnectionPool:
+    """
+    Nhóm kết nối keep-alive dùng chung trong tiến trình，theo từng máy chủ
+
+    - Giới hạn số kết nối đồng thời tới mỗi máy chủ
+    - Đóng các kết nối rảnh quá idle_timeout
+    - Tự kết nối lại một lần khi kết nối tái sử dụng đã bị máy chủ đóng
+    - Tái sử dụng phiên TLS giữa các kết nối tới cùng máy chủ
+    """
+
+    _RETRY_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                     BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+    def __init__(self, max_per_host: int = DEFAULT_POOL_SIZE, idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._semaphores = {}
+        self._tls_sessions = {}
+        self._ssl_context = ssl.create_default_context()
+
+    @staticmethod
+    def parse_base_url(base_url: str) -> Tuple[str, str, int]:
+        """Phân tích địa chỉ máy chủ thành (scheme, host, port)"""
+        match = re.match(r"(?:http[s]?://)?([^:/]+)(?::(\d+))?", base_url or "")
+        if not match:
+            raise ValueError("Invalid base URL format")
+        scheme = "https" if base_url.startswith("https://") else "http"
+        port_part = match.group(2)
+        port = int(port_part) if port_part else (443 if scheme == "https" else 80)
+        return scheme, match.group(1), port
+
+    def _create_connection(self, key: Tuple[str, str, int]) -> http.client.HTTPConnection:
+        """Tạo HTTP(S)kết nối"""
+        scheme, host, port = key
+        logger.info(f"Tạo một kết nối - Máy chủ: {host}, Cổng: {port}")
+        if scheme == "https":
+            with self._lock:
+                tls_state = self._tls_sessions.setdefault(key, _TLSSession())
+            return _ReusableHTTPSConnection(host, port, tls_state, timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _evict_idle(self):
+        """Đóng các kết nối rảnh quá lâu（gọi khi đang giữ khóa）"""
+        deadline = time.monotonic() - self.idle_timeout
+        for key, idle in self._idle.items():
+            while idle and idle[0][1] < deadline:
+                connection, _ = idle.pop(0)
+                connection.close()
+
+    def _checkout(self, key) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            self._evict_idle()
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()[0], True
+        return self._create_connection(key), False
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            self._idle.setdefault(key, []).append((connection, time.monotonic()))
+
+    def _semaphore(self, key) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(key)
+            if semaphore is None:
+                semaphore = self._semaphores[key] = threading.BoundedSemaphore(self.max_per_host)
+            return semaphore
+
+    def request(self, base_url: str, method: str, path: str, body: str = None,
+                headers: Dict = None) -> Tuple[int, bytes]:
+        """Gửi một yêu cầu qua kết nối trong nhóm，trả về (mã trạng thái HTTP, nội dung)"""
+        key = self.parse_base_url(base_url)
+        semaphore = self._semaphore(key)
+        if not semaphore.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Hết thời gian chờ kết nối rảnh tới {key[1]}:{key[2]}")
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                connection, reused = self._checkout(key)
+                try:
+                    connection.request(method, path, body=body, headers=headers or {})
+                    response = connection.getresponse()
+                    data = response.read()
+                except self._RETRY_ERRORS as e:
+                    connection.close()
+                    # Chỉ gửi lại khi kết nối tái sử dụng đã bị máy chủ đóng trong lúc rảnh
+                    if reused and attempt == 1:
+                        logger.info(f"Kết nối tới {key[1]}:{key[2]} đã bị đóng（{type(e).__name__}），Kết nối lại")
+                        continue
+                    raise
+                except Exception:
+                    connection.close()
+                    raise
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._checkin(key, connection)
+                return response.status, data
+        finally:
+            semaphore.release()
+
+    def close_all(self):
+        """Đóng tất cả các kết nối rảnh"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+
+class TokenCache:
+    """
+    Bộ nhớ đệm token dùng chung giữa các phiên bản AlistSync
+
+    Mỗi khóa có một khóa riêng để chỉ một luồng đăng nhập/xác minh tại một thời điểm，
+    các luồng khác chờ rồi dùng lại token vừa được lưu
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TOKEN_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._key_locks = {}
+
+    def get(self, key) -> Optional[str]:
+        """Lấy token còn hạn"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                return entry[0]
+            self._entries.pop(key, None)
+            return None
+
+    def set(self, key, token: str):
+        with self._lock:
+            self._entries[key] = (token, time.monotonic() + self.ttl)
+
+    def invalidate(self, key, token: str = None):
+        """Xóa token khỏi bộ nhớ đệm；nếu có token，chỉ xóa khi token đó vẫn là token được lưu"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (token is None or entry[0] == token):
+                del self._entries[key]
+
+    def lock_for(self, key) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+
+class DirectoryListingError(Exception):
+    """Không thể liệt kê（hết）một thư mục"""
+
+
+class SyncCancelled(Exception):
+    """Lần đồng bộ đã bị hủy qua CancelToken"""
+
+
+class CancelToken:
+    """
+    Mã hủy hợp tác của một lần chạy
+
+    Công cụ đồng bộ kiểm tra mã trước mỗi yêu cầu /api/fs/ và trong khi chờ hàng đợi
+    sao chép，nên việc liệt kê và gửi tác vụ dừng trong vòng một lượt yêu cầu
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        # Hủy luôn các tác vụ sao chép mà lần chạy đã gửi nhưng AList chưa thực hiện
+        self.cancel_copies = False
+
+    def cancel(self, cancel_copies: bool = False):
+        """Yêu cầu dừng lần chạy"""
+        self.cancel_copies = self.cancel_copies or cancel_copies
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """Ngủ tối đa timeout giây，trả về True ngay khi bị hủy"""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise SyncCancelled("Đồng bộ đã bị hủy")
+
+
+def _join_path(*parts: str) -> str:
+    """Nối các phần đường dẫn và chuẩn hóa dấu gạch chéo"""
+    path = "/".join(part.strip("/") for part in parts if part and part.strip("/"))
+    return "/" + path
+
+
+class PathFilter:
+    """
+    Bộ lọc đường dẫn được biên dịch một lần cho mỗi nhiệm vụ
+
+    Gộp thư mục loại trừ（cây tiền tố theo từng cấp thư mục）、biểu thức chính quy（gộp thành
+    một mẫu duy nhất khi có thể）và giới hạn kích thước；check() trả về quyết định trong một lần gọi
+    và đếm số lần mỗi quy tắc được áp dụng
+    """
+
+    INCLUDE = "include"
+    SKIP_FILE = "skip_file"
+    SKIP_SUBTREE = "skip_subtree"
+
+    # Khóa đánh dấu nút kết thúc một thư mục loại trừ（không thể là tên thư mục）
+    _TERMINAL = "/"
+
+    def __init__(self, exclude_list: List[str] = None, regex_patterns_list: List[Pattern[str]] = None,
+                 regex_pattern: Pattern[str] = None, size_min: int = None, size_max: int = None):
+        self.size_min = size_min
+        self.size_max = size_max
+        self.excludes = []
+        self._trie = {}
+        for exclude in exclude_list or []:
+            # Bỏ qua mục rỗng，nếu không "" sẽ loại trừ mọi đường dẫn
+            parts = self._split(exclude)
+            if not parts:
+                continue
+            node = self._trie
+            for part in parts:
+                node = node.setdefault(part, {})
+            node[self._TERMINAL] = "/" + "/".join(parts)
+            self.excludes.append(node[self._TERMINAL])
+        self._matchers = self._compile_patterns(list(regex_patterns_list or []) +
+                                                ([regex_pattern] if regex_pattern else []))
+        self.hits = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split(path: str) -> List[str]:
+        return [part for part in (path or "").strip().split("/") if part]
+
+    @staticmethod
+    def _compile_patterns(patterns: List[Pattern[str]]) -> List[Pattern[str]]:
+        """Gộp các mẫu thành một biểu thức duy nhất nếu không làm thay đổi ý nghĩa"""
+        if len(patterns) <= 1:
+            return patterns
+        flags = {pattern.flags for pattern in patterns}
+        # Tham chiếu ngược và nhóm có tên bị đánh số lại khi gộp
+        if len(flags) == 1 and not any(re.search(r"\\[1-9]|\(\?P[<=]", pattern.pattern) for pattern in patterns):
+            try:
+                return [re.compile("|".join(f"(?:{pattern.pattern})" for pattern in patterns), flags.pop())]
+            except re.error:
+                pass
+        return patterns
+
+    @property
+    def has_file_rules(self) -> bool:
+        """Có quy tắc nào áp dụng cho từng tệp không（biểu thức chính quy hoặc kích thước）"""
+        return bool(self._matchers) or self.size_min is not None or self.size_max is not None
+
+    def _hit(self, rule: str):
+        with self._lock:
+            self.hits[rule] = self.hits.get(rule, 0) + 1
+
+    def excluded_by(self, path: str) -> Optional[str]:
+        """Trả về thư mục loại trừ chứa path，None nếu không bị loại trừ"""
+        node = self._trie
+        for part in self._split(path):
+            node = node.get(part)
+            if node is None:
+                return None
+            if self._TERMINAL in node:
+                return node[self._TERMINAL]
+        return None
+
+    def intersects(self, path: str) -> bool:
+        """Kiểm tra xem có thư mục loại trừ nào nằm tại hoặc bên dưới path không"""
+        node = self._trie
+        for part in self._split(path):
+            node = node.get(part)
+            if node is None:
+                return False
+            if self._TERMINAL in node:
+                return True
+        return bool(node)
+
+    def is_excluded(self, path: str) -> bool:
+        """Kiểm tra xem path có nằm trong hoặc bên dưới bất kỳ thư mục loại trừ nào"""
+        rule = self.excluded_by(path)
+        if rule:
+            self._hit(f"exclude:{rule}")
+            return True
+        return False
+
+    def match_regex(self, name: str) -> bool:
+        """Kiểm tra tên tệp với các biểu thức chính quy（luôn đúng nếu không có mẫu）"""
+        if not self._matchers:
+            return True
+        return any(matcher.match(name) for matcher in self._matchers)
+
+    def check(self, src_path: str, dst_path: str = None, is_dir: bool = False, size: int = None,
+              name: str = None) -> str:
+        """
+        Quyết định xử lý một mục
+
+        trở lại:
+            SKIP_SUBTREE nếu mục nằm trong thư mục loại trừ，SKIP_FILE nếu tệp không qua
+            bộ lọc kích thước/biểu thức chính quy，ngược lại INCLUDE
+        """
+        if self.is_excluded(src_path) or (dst_path and self.is_excluded(dst_path)):
+            return self.SKIP_SUBTREE
+        if is_dir:
+            return self.INCLUDE
+        if self.size_min is not None and size is not None and size < self.size_min:
+            self._hit("size_min")
+            return self.SKIP_FILE
+        if self.size_max is not None and size is not None and size > self.size_max:
+            self._hit("size_max")
+            return self.SKIP_FILE
+        if not self.match_regex(name if name is not None else src_path.rsplit("/", 1)[-1]):
+            self._hit("regex")
+            return self.SKIP_FILE
+        return self.INCLUDE
+
+    def stats(self) -> Dict[str, int]:
+        """Số lần mỗi quy tắc được áp dụng"""
+        with self._lock:
+            return dict(self.hits)
+
+
+class CopyTaskQueue:
+    """
+    Ảnh chụp hàng đợi sao chép chưa hoàn thành của AList
+
+    Tên tác vụ có dạng "copy [mount](path) to [mount](dir)"，được lập chỉ mục thành
+    tập hợp (đường dẫn nguồn, thư mục đích) để kiểm tra O(1)；ảnh chụp chỉ được tải lại
+    khi đã cũ hơn refresh_interval
+
+    Số tác vụ đang chờ（in_flight）= độ sâu của ảnh chụp gần nhất + số tên đã gửi kể từ đó；
+    acquire() chặn việc gửi khi in_flight đạt high_water cho đến khi giảm về low_water
+    """
+
+    _NAME_PATTERN = re.compile(r"^copy \[(.*?)\]\((.*)\) to \[(.*?)\]\((.*)\)$")
+
+    def __init__(self, alist_sync: "AlistSync", refresh_interval: float = DEFAULT_TASK_REFRESH_INTERVAL,
+                 high_water: int = DEFAULT_QUEUE_HIGH_WATER, low_water: int = DEFAULT_QUEUE_LOW_WATER,
+                 poll_interval: float = DEFAULT_QUEUE_POLL_INTERVAL):
+        self.alist_sync = alist_sync
+        self.refresh_interval = refresh_interval
+        self.high_water = max(0, int(high_water or 0))
+        # Ngưỡng dưới không được vượt quá ngưỡng trên
+        self.low_water = min(max(0, int(low_water or 0)), self.high_water)
+        self.poll_interval = poll_interval
+        self._submitted = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._index = set()
+        self._unparsed = []
+        self._names = []
+        self._fetched_at = None
+
+    @classmethod
+    def parse_name(cls, name: str) -> Optional[Tuple[str, str]]:
+        """Phân tích tên tác vụ thành (đường dẫn nguồn, thư mục đích)"""
+        match = cls._NAME_PATTERN.match(name or "")
+        if not match:
+            return None
+        src_mount, src_path, dst_mount, dst_dir = match.groups()
+        return _join_path(src_mount, src_path), _join_path(dst_mount, dst_dir)
+
+    def refresh(self, force: bool = False) -> List[str]:
+        """Tải lại hàng đợi nếu ảnh chụp đã cũ，trả về danh sách tên tác vụ"""
+        if not force and not self._is_stale():
+            return self._names
+        with self._refresh_lock:
+            # Một luồng khác có thể vừa làm mới xong
+            if not force and not self._is_stale():
+                return self._names
+            response = self.alist_sync._task_operation("GET", "copy/undone")
+            names, index, unparsed = [], set(), []
+            for item in (response.get("data") or []) if response else []:
+                name = item.get("name", "")
+                names.append(name.replace("](", ""))
+                parsed = self.parse_name(name)
+                if parsed:
+                    index.add(parsed)
+                else:
+                    unparsed.append(name.replace("](", ""))
+            with self._lock:
+                self._names, self._index, self._unparsed = names, index, unparsed
+                self._submitted = 0
+                self._fetched_at = time.monotonic()
+            return names
+
+    def _is_stale(self) -> bool:
+        return self._fetched_at is None or time.monotonic() - self._fetched_at >= self.refresh_interval
+
+    def contains(self, src_path: str, dst_dir: str) -> bool:
+        """Kiểm tra xem tệp có đang chờ sao chép vào thư mục đích không"""
+        self.refresh()
+        src_path, dst_dir = _join_path(src_path), _join_path(dst_dir)
+        with self._lock:
+            if (src_path, dst_dir) in self._index:
+                return True
+            # Tên tác vụ không phân tích được vẫn được so khớp theo cách cũ
+            return any(src_path in task_item and dst_dir in task_item for task_item in self._unparsed)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._names)
+
+    @property
+    def in_flight(self) -> int:
+        """Số tác vụ sao chép ước tính đang chờ trên máy chủ"""
+        with self._lock:
+            return len(self._names) + self._submitted
+
+    def record_submitted(self, count: int):
+        """Ghi nhận số tên vừa được gửi sao chép"""
+        with self._lock:
+            self._submitted += count
+
+    def acquire(self) -> int:
+        """
+        Chờ cho đến khi hàng đợi còn chỗ để gửi thêm tác vụ sao chép
+
+        trở lại:
+            Số giây đã chờ
+        """
+        if not self.high_water:
+            return 0
+        self.refresh()
+        if self.in_flight < self.high_water:
+            return 0
+        logger.info(f"Hàng đợi sao chép đạt ngưỡng {self.high_water}（đang chờ: {self.in_flight}），"
+                    f"Tạm dừng gửi cho đến khi còn {self.low_water}")
+        started = time.monotonic()
+        cancel_token = self.alist_sync.cancel_token
+        while True:
+            if cancel_token.wait(self.poll_interval):
+                cancel_token.raise_if_cancelled()
+            self.refresh(force=True)
+            if self.in_flight <= self.low_water:
+                break
+            logger.debug(f"Hàng đợi sao chép còn {self.in_flight} tác vụ，Tiếp tục chờ")
+        waited = time.monotonic() - started
+        logger.info(f"Hàng đợi sao chép còn {self.in_flight} tác vụ，Tiếp tục gửi sau {waited:.1f} giây")
+        return waited
+
+
+class SyncManifest:
+    """
+    Ảnh chụp kết quả đồng bộ của một cặp thư mục，được lưu thành tệp JSON giữa các lần chạy
+
+    Mỗi thư mục nguồn đã được xác minh là đồng bộ（không có thao tác nào trong cả cây con）
+    được ghi lại cùng thời gian sửa đổi của thư mục nguồn/đích và danh sách tệp
+    {tên: [kích thước, thời gian sửa đổi]}. Ở lần chạy sau，một thư mục con có thời gian
+    sửa đổi nguồn và đích không đổi sẽ được bỏ qua mà không cần liệt kê.
+
+    Manifest bị bỏ qua khi dấu vân tay bộ lọc thay đổi；các mục cũ hơn max_age được liệt kê lại
+    vì một số bộ lưu trữ không cập nhật thời gian sửa đổi của thư mục cha khi cây con thay đổi
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, fingerprint: str, max_age: int = DEFAULT_MANIFEST_MAX_AGE):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_age = max_age
+        self.previous = {}
+        self.current = {}
+        self._carried = set()
+
+    @staticmethod
+    def make_fingerprint(**filters) -> str:
+        """Tạo dấu vân tay từ các tùy chọn ảnh hưởng đến kết quả đồng bộ"""
+        raw = json.dumps(filters, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _known(modified: Optional[str]) -> bool:
+        # Một số bộ lưu trữ trả về thời gian rỗng hoặc 0001-01-01 cho thư mục
+        return bool(modified) and not str(modified).startswith("0001-")
+
+    def load(self) -> "SyncManifest":
+        """Đọc manifest của lần chạy trước"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được manifest {self.path}: {str(e)}，Liệt kê lại toàn bộ")
+            return self
+        if data.get("version") != self.VERSION or data.get("fingerprint") != self.fingerprint:
+            logger.info("Bộ lọc đã thay đổi kể từ lần đồng bộ trước，Bỏ qua manifest và liệt kê lại toàn bộ")
+            return self
+        self.previous = data.get("dirs") or {}
+        logger.info(f"Đã tải manifest với {len(self.previous)} thư mục")
+        return self
+
+    def is_unchanged(self, src_path: str, src_modified: Optional[str], dst_modified: Optional[str]) -> bool:
+        """Kiểm tra xem cây con có giống lần đồng bộ trước không"""
+        entry = self.previous.get(src_path)
+        if not entry or not self._known(src_modified) or not self._known(dst_modified):
+            return False
+        if self.max_age and time.time() - entry.get("verified_at", 0) > self.max_age:
+            return False
+        return entry.get("modified") == src_modified and entry.get("dst_modified") == dst_modified
+
+    def carry(self, src_path: str):
+        """Giữ lại mục của cây con không thay đổi cho lần chạy sau"""
+        self.current[src_path] = self.previous[src_path]
+        self._carried.add(src_path)
+
+    def record(self, src_path: str, files: Dict[str, list]):
+        """Ghi lại một thư mục đã được xác minh là đồng bộ"""
+        self.current[src_path] = {"modified": None, "dst_modified": None,
+                                  "verified_at": int(time.time()), "files": files}
+
+    def stamp(self, src_path: str, src_modified: Optional[str], dst_modified: Optional[str]) -> bool:
+        """
+        Gắn thời gian sửa đổi（lấy từ danh sách của thư mục cha）cho một thư mục đã ghi lại
+
+        trở lại:
+            True nếu thư mục đã được xác minh là đồng bộ
+        """
+        entry = self.current.get(src_path)
+        if entry is None:
+            return False
+        if src_path not in self._carried:
+            entry["modified"] = src_modified
+            entry["dst_modified"] = dst_modified
+        return True
+
+    def _is_carried(self, src_path: str) -> bool:
+        parent = src_path
+        while parent and parent != "/":
+            if parent in self._carried:
+                return True
+            parent = parent.rsplit("/", 1)[0] or "/"
+        return False
+
+    def save(self):
+        """Ghi manifest ra đĩa（ghi vào tệp tạm rồi thay thế）"""
+        dirs = dict(self.current)
+        # Các thư mục con của cây con không thay đổi không được liệt kê nên lấy từ lần trước
+        for src_path, entry in self.previous.items():
+            if src_path not in dirs and self._is_carried(src_path):
+                dirs[src_path] = entry
+        data = {"version": self.VERSION, "fingerprint": self.fingerprint, "dirs": dirs}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            logger.info(f"Đã lưu manifest với {len(dirs)} thư mục: {self.path}")
+        except OSError as e:
+            logger.warning(f"Không lưu được manifest {self.path}: {str(e)}")
+
+
+# Nhóm kết nối dùng chung cho mọi phiên bản AlistSync trong tiến trình
+connection_pool = ConnectionPool()
+# Bộ nhớ đệm token dùng chung cho mọi phiên bản AlistSync trong tiến trình
+token_cache = TokenCache()
+
+
 class AlistSync:
     def __init__(self, base_url: str, username: str = None, password: str = None, token: str = None,
                  sync_delete_action: str = "none", exclude_list: List[str] = None, move_file_action: bool = False,
                  regex_patterns_list=None, regex_pattern=None, size_min: int = None, size_max: int = None,
-                 task_list: List[str] = None):
+                 task_list: List[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 walk_concurrency: int = DEFAULT_WALK_CONCURRENCY, queue_high_water: int = DEFAULT_QUEUE_HIGH_WATER,
+                 queue_low_water: int = DEFAULT_QUEUE_LOW_WATER, manifest_dir: str = None,
+                 manifest_key: str = None, manifest_max_age: int = DEFAULT_MANIFEST_MAX_AGE,
+                 use_search_index: bool = False, search_max_staleness: int = DEFAULT_SEARCH_MAX_STALENESS,
+                 search_page_size: int = DEFAULT_SEARCH_PAGE_SIZE, list_page_size: int = DEFAULT_LIST_PAGE_SIZE,
+                 cancel_token: CancelToken = None, stats: Dict[str, int] = None):
         """
         khởi tạoAlistSyncloại
         
@@ -108,6 +756,19 @@ class AlistSync:
             size_min: Chỉ chuyển các tệp lớn hơn kích thước được chỉ định（Byte，mặc định tắt）
             size_max: Chỉ chuyển các tệp nhỏ hơn kích thước được chỉ định（Byte，mặc định tắt）
             task_list: Danh sách nhiệm vụ
+            batch_size: Số tên tối đa trong một yêu cầu copy/move/remove
+            walk_concurrency: Số luồng liệt kê thư mục song song
+            queue_high_water: Số tác vụ sao chép chưa hoàn thành tối đa trước khi tạm dừng gửi（0 = tắt）
+            queue_low_water: Số tác vụ sao chép chưa hoàn thành để tiếp tục gửi
+            manifest_dir: Thư mục lưu manifest đồng bộ tăng dần（None = tắt）
+            manifest_key: Tiền tố tên tệp manifest，thường là ID nhiệm vụ
+            manifest_max_age: Thời gian tối đa tin cậy một thư mục trong manifest（giây，0 = không giới hạn）
+            use_search_index: Liệt kê thư mục nguồn bằng chỉ mục tìm kiếm của AList nếu có
+            search_max_staleness: Độ cũ tối đa của chỉ mục để được sử dụng（giây，0 = không dùng chỉ mục）
+            search_page_size: Số kết quả mỗi trang khi tìm kiếm
+            list_page_size: Số mục mỗi trang khi liệt kê thư mục
+            cancel_token: Mã hủy của lần chạy（None = không thể hủy）
+            stats: Từ điển thống kê được cập nhật trong khi chạy（None = tạo mới）
         """
         if regex_patterns_list is None:
             regex_patterns_list = []
@@ -115,152 +776,355 @@ class AlistSync:
         self.username = username
         self.password = password
         self.token = token  # Thêm thuộc tính mã thông báo
+        self._configured_token = token
         self.sync_delete_action = sync_delete_action.lower()
         self.sync_delete = self.sync_delete_action in ["move", "delete"]
-        self.connection = self._create_connection()
+        # Kết nối được lấy từ nhóm dùng chung，kiểm tra định dạng địa chỉ ngay khi khởi tạo
+        self.pool = connection_pool
+        self.pool.parse_base_url(base_url)
         self.task_list = task_list
+        self.copy_task_queue = CopyTaskQueue(self, high_water=queue_high_water, low_water=queue_low_water)
+        self.manifest_dir = manifest_dir
+        self.manifest_key = manifest_key
+        self.manifest_max_age = manifest_max_age
+        # Manifest của cặp thư mục đang đồng bộ
+        self.manifest = None
+        self.use_search_index = use_search_index
+        self.search_max_staleness = search_max_staleness
+        self.search_page_size = max(1, int(search_page_size or DEFAULT_SEARCH_PAGE_SIZE))
+        self.list_page_size = max(1, int(list_page_size or DEFAULT_LIST_PAGE_SIZE))
+        # Danh sách nguồn lấy từ chỉ mục tìm kiếm {thư mục cha: [mục]}，None = liệt kê từng thư mục
+        self.source_index = None
+        # Độ cũ của chỉ mục tìm kiếm trong lần đồng bộ gần nhất（giây）
+        self.search_index_staleness = None
         self.exclude_list = exclude_list
         self.move_file_action = move_file_action
         self.regex_patterns_list = regex_patterns_list
         self.regex_pattern = regex_pattern
         self.size_min = size_min
         self.size_max = size_max
-
-    def _create_connection(self) -> Union[http.client.HTTPConnection, http.client.HTTPSConnection]:
-        """Tạo HTTP(S)kết nối"""
-        try:
-            match = re.match(r"(?:http[s]?://)?([^:/]+)(?::(\d+))?", self.base_url)
-            if not match:
-                raise ValueError("Invalid base URL format")
-
-            host = match.group(1)
-            port_part = match.group(2)
-            port = int(port_part) if port_part else (443 if self.base_url.startswith("https://") else 80)
-
-            logger.info(f"Tạo một kết nối - Máy chủ: {host}, Cổng: {port}")
-            return (http.client.HTTPSConnection(host, port)
-                    if self.base_url.startswith("https://")
-                    else http.client.HTTPConnection(host, port))
-        except Exception as e:
-            logger.error(f"Không tạo được kết nối: {str(e)}")
-            raise
+        # Bộ lọc được biên dịch một lần cho cả nhiệm vụ
+        self.path_filter = PathFilter(exclude_list, regex_patterns_list, regex_pattern, size_min, size_max)
+        self.batch_size = max(1, int(batch_size or DEFAULT_BATCH_SIZE))
+        self.walk_concurrency = max(1, int(walk_concurrency or DEFAULT_WALK_CONCURRENCY))
+        self.cancel_token = cancel_token or CancelToken()
+        # Thống kê của lần chạy，có thể đọc từ luồng khác khi đang chạy
+        self.stats = stats if stats is not None else {}
+        self._stats_lock = threading.Lock()
+        # (đường dẫn nguồn, thư mục đích) của các tác vụ sao chép đã gửi，dùng để hủy khi dừng
+        self._submitted_copies = set()
 
     def _make_request(self, method: str, path: str, headers: Dict = None,
                       payload: str = None) -> Optional[Dict]:
         """Gửi yêu cầu HTTP và trả về phản hồi JSON"""
         try:
             logger.debug(f"Gửi một yêu cầu - Phương thức: {method}, path: {path}")
-            self.connection.request(method, path, body=payload, headers=headers)
-            response = self.connection.getresponse()
-            result = json.loads(response.read().decode("utf-8"))
+            _, data = self.pool.request(self.base_url, method, path, body=payload, headers=headers)
+            result = json.loads(data.decode("utf-8"))
             logger.debug(f"Yêu cầu phản hồi: {result}")
             return result
         except Exception as e:
             logger.error(f"Yêu cầu không thành công - Phương thức: {method}, path: {path}, sai lầm: {str(e)}")
             return None
 
-    def login(self) -> bool:
-        """Đăng nhập và nhận đượctoken"""
-        # Nếu có mã thông báo, hãy trả về True trực tiếp
-        if self.token and self.get_setting():
-            return True
+    def _token_cache_key(self) -> Tuple[str, str, str]:
+        """Khóa bộ nhớ đệm token：(máy chủ, tên người dùng, dấu vân tay thông tin xác thực)"""
+        fingerprint = hashlib.sha256(f"{self.password or ''}\0{self._configured_token or ''}".encode("utf-8")).hexdigest()
+        return (self.base_url.rstrip("/"), self.username or "", fingerprint)
+
+    def login(self, force: bool = False) -> bool:
+        """
+        Đăng nhập và nhận đượctoken
+
+        tham số:
+            force: Bỏ qua bộ nhớ đệm token và luôn xác minh với máy chủ（dùng khi kiểm tra kết nối）
+
+        trở lại:
+            Đăng nhập có thành công hay không
+        """
+        key = self._token_cache_key()
+        if not force:
+            cached_token = token_cache.get(key)
+            if cached_token:
+                self.token = cached_token
+                return True
+
+        with token_cache.lock_for(key):
+            if force:
+                # Token đã lưu chỉ được thay bằng kết quả xác minh mới
+                token_cache.invalidate(key)
+            else:
+                # Một luồng khác có thể vừa đăng nhập xong
+                cached_token = token_cache.get(key)
+                if cached_token:
+                    self.token = cached_token
+                    return True
+
+            # Nếu có mã thông báo, hãy xác minh một lần rồi lưu vào bộ nhớ đệm
+            if self._configured_token:
+                self.token = self._configured_token
+                if self.get_setting():
+                    token_cache.set(key, self.token)
+                    return True
 
-        # Nếu không, hãy đăng nhập bằng tên người dùng và mật khẩu
-        if not self.username or not self.password:
-            logger.error("tokenHoặc tên người dùng và mật khẩu không chính xác")
+            # Nếu không, hãy đăng nhập bằng tên người dùng và mật khẩu
+            if not self.username or not self.password:
+                logger.error("tokenHoặc tên người dùng và mật khẩu không chính xác")
+                return False
+
+            payload = json.dumps({"username": self.username, "password": self.password})
+            headers = {
+                "User-Agent": "Apifox/1.0.0 (https://apifox.com)",
+                "Content-Type": "application/json"
+            }
+            response = self._make_request("POST", "/api/auth/login", headers, payload)
+            if response and (response.get("data") or {}).get("token"):
+                self.token = response["data"]["token"]
+                token_cache.set(key, self.token)
+                logger.info("Xác minh mã thông báo thành công")
+                return True
+            logger.error("Lấytokenthất bại")
             return False
 
-        payload = json.dumps({"username": self.username, "password": self.password})
-        headers = {
-            "User-Agent": "Apifox/1.0.0 (https://apifox.com)",
-            "Content-Type": "application/json"
-        }
-        response = self._make_request("POST", "/api/auth/login", headers, payload)
-        if response and response.get("data", {}).get("token"):
-            self.token = response["data"]["token"]
+    def get_setting(self) -> bool:
+        """Xác minh tính chính xác của mã thông báo"""
+        headers = self._auth_headers()
+        # Chỉ lấy một giá trị cài đặt thay vì toàn bộ bảng cài đặt
+        response = self._make_request("GET", "/api/admin/setting/get?key=token", headers)
+        data = response.get("data") if response else None
+        if isinstance(data, dict) and "value" in data:
+            token_value = data.get("value")
+        elif response and response.get("code") in (401, 403):
+            token_value = None
+        else:
+            # Máy chủ cũ không có /api/admin/setting/get
+            response = self._make_request("GET", "/api/admin/setting/list", headers)
+            token_value = None
+            if response and isinstance(response.get("data"), list):
+                for item in response["data"]:
+                    if item.get("key") == "token":
+                        token_value = item.get("value")
+                        break
+        if token_value and self.token == token_value:
             logger.info("Xác minh mã thông báo thành công")
             return True
-        logger.error("Lấytokenthất bại")
+        logger.info("Xác minh mã thông báo không thành công")
         return False
 
-    def get_setting(self) -> bool:
-        """Xác minh tính chính xác của mã thông báo"""
-        headers = {
+    def _auth_headers(self) -> Dict:
+        return {
+            "Authorization": self.token,
             "User-Agent": "Apifox/1.0.0 (https://apifox.com)",
-            "Content-Type": "application/json",
-            "Authorization": self.token
+            "Content-Type": "application/json"
         }
-        response = self._make_request("GET", "/api/admin/setting/list", headers)
-        if response and response.get("data", {}):
-            token_value = None
-            for item in response["data"]:
-                if item["key"] == "token":
-                    token_value = item["value"]
-                    logger.info("Xác minh mã thông báo thành công")
-                    break
-            if self.token == token_value:
-                logger.info("Xác minh mã thông báo thành công")
-                return True
-        logger.info("Xác minh mã thông báo không thành công")
-        return False
 
-    def _directory_operation(self, operation: str, **kwargs) -> Optional[Dict]:
-        """Thực hiện các thao tác thư mục"""
+    def _authorized_request(self, method: str, path: str, payload: str = None) -> Optional[Dict]:
+        """
+        Gửi yêu cầu có xác thực
+
+        Token chỉ được xác minh lại khi máy chủ trả về 401：token cũ bị xóa khỏi
+        bộ nhớ đệm，đăng nhập lại một lần rồi gửi lại yêu cầu
+        """
         if not self.token:
             if not self.login():
                 return None
 
-        headers = {
-            "Authorization": self.token,
-            "User-Agent": "Apifox/1.0.0 (https://apifox.com)",
-            "Content-Type": "application/json"
-        }
+        response = self._make_request(method, path, self._auth_headers(), payload)
+        if response and response.get("code") == 401:
+            logger.info("Mã thông báo đã hết hạn，Đăng nhập lại")
+            token_cache.invalidate(self._token_cache_key(), self.token)
+            self.token = None
+            if self.login():
+                response = self._make_request(method, path, self._auth_headers(), payload)
+        return response
+
+    def _count(self, key: str, value: int = 1):
+        """Cộng dồn một chỉ số thống kê"""
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def _directory_operation(self, operation: str, **kwargs) -> Optional[Dict]:
+        """Thực hiện các thao tác thư mục（ném SyncCancelled nếu lần chạy đã bị hủy）"""
+        self.cancel_token.raise_if_cancelled()
         payload = json.dumps(kwargs)
         path = f"/api/fs/{operation}"
-        return self._make_request("POST", path, headers, payload)
+        return self._authorized_request("POST", path, payload)
 
     def _task_operation(self, method: str, operation: str, **kwargs) -> Optional[Dict]:
         """Thực hiện các hoạt động nhiệm vụ"""
-        if not self.token:
-            if not self.login():
-                return None
-
-        headers = {
-            "Authorization": self.token,
-            "User-Agent": "Apifox/1.0.0 (https://apifox.com)",
-            "Content-Type": "application/json"
-        }
         payload = json.dumps(kwargs)
         path = f"/api/admin/task/{operation}"
-        return self._make_request(method, path, headers, payload)
+        return self._authorized_request(method, path, payload)
 
     def get_copy_task_undone(self):
-        """Nhận các tác vụ sao chép chưa hoàn thànhh"""
-        response = self._task_operation("GET", "copy/undone")
-        name_list = []
-        if response and response.get("data", []):
-            for item in response["data"]:
-                name = item["name"]
-                result = name.replace("](", "")
-                name_list.append(result)
-        self.task_list = name_list
+        """Nhận các tác vụ sao chép chưa hoàn thành（làm mới ảnh chụp hàng đợi）"""
+        self.task_list = self.copy_task_queue.refresh(force=True)
         return True
-        # return name_list
 
     def get_copy_task_retry_failed(self) -> List[Dict]:
         """Hoàn thành các tác vụ sao chép"""
         response = self._task_operation("POST", "copy/retry_failed")
         return response.get("data", []) if response else []
 
+    def cancel_submitted_copies(self) -> int:
+        """
+        Hủy các tác vụ sao chép chưa hoàn thành do lần chạy này gửi
+
+        trở lại:
+            Số tác vụ đã hủy
+        """
+        if not self._submitted_copies:
+            return 0
+        response = self._task_operation("GET", "copy/undone")
+        cancelled = 0
+        for item in (response.get("data") or []) if response else []:
+            if CopyTaskQueue.parse_name(item.get("name", "")) not in self._submitted_copies:
+                continue
+            result = self._authorized_request("POST", f"/api/admin/task/copy/cancel?tid={quote(str(item.get('id')))}")
+            if result and result.get("code") == 200:
+                cancelled += 1
+            else:
+                logger.warning(f"Không hủy được tác vụ sao chép: {item.get('name')}")
+        self._count("cancelled_copies", cancelled)
+        logger.info(f"Đã hủy {cancelled} tác vụ sao chép chưa hoàn thành của lần chạy")
+        return cancelled
+
     def get_copy_task_done(self) -> List[Dict]:
         """Hoàn thành các tác vụ sao chép"""
         response = self._task_operation("GET", "copy/done")
         return response.get("data", []) if response else []
 
+    def get_search_index_status(self) -> Dict:
+        """
+        Kiểm tra trạng thái chỉ mục tìm kiếm của AList
+
+        trở lại:
+            {"enabled": bool, "mode": str, "is_done": bool, "last_done": dấu thời gian hoặc None,
+             "staleness": số giây kể từ lần cập nhật chỉ mục cuối hoặc None}
+        """
+        status = {"enabled": False, "mode": None, "is_done": False, "last_done": None, "staleness": None}
+        response = self._authorized_request("GET", "/api/admin/setting/get?key=search_index")
+        data = response.get("data") if response else None
+        mode = data.get("value") if isinstance(data, dict) else None
+        status["mode"] = mode
+        status["enabled"] = bool(mode) and mode != "none"
+        if not status["enabled"]:
+            return status
+
+        response = self._authorized_request("GET", "/api/admin/index/progress")
+        progress = response.get("data") if response and response.get("code") == 200 else None
+        if isinstance(progress, dict):
+            status["is_done"] = bool(progress.get("is_done"))
+            status["last_done"] = parse_iso_timestamp(progress.get("last_done_time"))
+            if progress.get("error"):
+                logger.warning(f"Chỉ mục tìm kiếm báo lỗi: {progress.get('error')}")
+        if status["last_done"]:
+            status["staleness"] = max(0.0, time.time() - status["last_done"])
+        return status
+
+    def search_directory_tree(self, src_dir: str) -> Optional[Dict[str, List[Dict]]]:
+        """
+        Liệt kê toàn bộ cây thư mục bằng /api/fs/search theo trang
+
+        Kết quả tìm kiếm không có thời gian sửa đổi nên các tệp chỉ được so sánh theo kích thước
+
+        trở lại:
+            {thư mục cha: [mục]}，None nếu tìm kiếm thất bại
+        """
+        root = src_dir.rstrip("/") or "/"
+        tree = {root: []}
+        page = 1
+        fetched = 0
+        while True:
+            response = self._directory_operation("search", parent=root, keywords="", scope=0,
+                                                 page=page, per_page=self.search_page_size)
+            if not response or response.get("code") != 200:
+                message = response.get("message") if response else "Không có phản hồi"
+                logger.warning(f"Tìm kiếm thư mục【{root}】thất bại: {message}")
+                return None
+            data = response.get("data") or {}
+            content = data.get("content") or []
+            for item in content:
+                parent = (item.get("parent") or "/").rstrip("/") or "/"
+                # Không giữ các mục nằm trong thư mục loại trừ
+                if self.path_filter.excluded_by(parent):
+                    continue
+                tree.setdefault(parent, []).append(item)
+                if item.get("is_dir"):
+                    tree.setdefault(f"{parent}/{item.get('name')}".replace("//", "/"), [])
+            fetched += len(content)
+            if not content or fetched >= (data.get("total") or 0):
+                break
+            page += 1
+        logger.info(f"Đã liệt kê {fetched} mục trong【{root}】bằng chỉ mục tìm kiếm（{page} trang）")
+        return tree
+
+    def _prepare_source_index(self, src_dir: str):
+        """Dùng chỉ mục tìm kiếm cho thư mục nguồn nếu được bật và đủ mới"""
+        self.source_index = None
+        self.search_index_staleness = None
+        if not self.use_search_index:
+            return
+        if self.sync_delete:
+            # Thư mục thiếu trong chỉ mục sẽ được coi là trống và làm xóa nhầm thư mục đích
+            logger.info("Đang bật xử lý khác biệt của thư mục đích，Không dùng chỉ mục tìm kiếm")
+            return
+        if not self.search_max_staleness or self.search_max_staleness <= 0:
+            logger.info("Chưa đặt độ cũ tối đa của chỉ mục tìm kiếm，Liệt kê từng thư mục")
+            return
+        status = self.get_search_index_status()
+        if not status["enabled"]:
+            logger.info("Chỉ mục tìm kiếm chưa được bật，Liệt kê từng thư mục")
+            return
+        staleness = status["staleness"]
+        self.search_index_staleness = staleness
+        if staleness is None:
+            logger.info(f"Chỉ mục tìm kiếm（{status['mode']}）không rõ thời gian cập nhật")
+        else:
+            logger.info(f"Chỉ mục tìm kiếm（{status['mode']}）được cập nhật cách đây {int(staleness)} giây")
+        if not status["is_done"]:
+            logger.info("Chỉ mục tìm kiếm đang được xây dựng，Liệt kê từng thư mục")
+            return
+        if staleness is None or staleness > self.search_max_staleness:
+            logger.info(f"Chỉ mục tìm kiếm cũ hơn {self.search_max_staleness} giây，Liệt kê từng thư mục")
+            return
+        self.source_index = self.search_directory_tree(src_dir)
+
+    def iter_directory_pages(self, directory_path: str) -> Iterator[List[Dict]]:
+        """
+        Liệt kê thư mục theo trang bằng page/per_page，trả về từng trang khi nhận được
+
+        Ném DirectoryListingError nếu một trang không lấy được，để người gọi không nhầm
+        danh sách thiếu là danh sách đầy đủ
+        """
+        page = 1
+        fetched = 0
+        while True:
+            response = self._directory_operation("list", path=directory_path, page=page,
+                                                 per_page=self.list_page_size)
+            if not response or response.get("code") != 200:
+                message = response.get("message") if response else "Không có phản hồi"
+                raise DirectoryListingError(f"{directory_path}（trang {page}）: {message}")
+            data = response.get("data") or {}
+            content = data.get("content") or []
+            fetched += len(content)
+            yield content
+            if not content or fetched >= (data.get("total") or 0):
+                return
+            page += 1
+
+    def iter_directory_contents(self, directory_path: str) -> Iterator[Dict]:
+        """Liệt kê từng mục của thư mục，chỉ giữ một trang trong bộ nhớ"""
+        for page in self.iter_directory_pages(directory_path):
+            yield from page
+
     def get_directory_contents(self, directory_path: str) -> List[Dict]:
         """Nhận nội dung của thư mục"""
-        response = self._directory_operation("list", path=directory_path)
-        return response.get("data", {}).get("content", []) if response else []
+        try:
+            return list(self.iter_directory_contents(directory_path))
+        except DirectoryListingError as e:
+            logger.error(f"Không liệt kê được thư mục: {str(e)}")
+            return []
 
     def create_directory(self, directory_path: str) -> bool:
         """Tạo một thư mục"""
@@ -302,13 +1166,112 @@ class AlistSync:
                     logger.info(f"Xóa các thư mục trống【{src_dir}】thành công")
                     self._remove_empty_folders(base_dir, remove_dir)
 
+    def _batch_operation(self, operation: str, names: List[str], **kwargs) -> List[str]:
+        """
+        Gửi thao tác copy/move/remove cho nhiều tên trong một yêu cầu
+
+        Danh sách tên được chia thành các lô batch_size；Nếu một lô thất bại，
+        các tên trong lô đó được gửi lại từng cái một để xác định tên nào bị lỗi
+        （trừ các tên máy chủ đã xử lý trước khi gặp lỗi）
+
+        trở lại:
+            Danh sách các tên thất bại
+        """
+        failed = []
+        for start in range(0, len(names), self.batch_size):
+            chunk = names[start:start + self.batch_size]
+            if operation == "copy":
+                # Mỗi tên được sao chép tạo ra một tác vụ trên máy chủ
+                self.copy_task_queue.acquire()
+            response = self._directory_operation(operation, names=chunk, **kwargs)
+            if response and response.get("code") == 200:
+                self._record_success(operation, chunk, **kwargs)
+                continue
+            if len(chunk) == 1:
+                message = response.get("message") if response else "Không có phản hồi"
+                logger.error(f"Thao tác {operation} thất bại - tài liệu【{chunk[0]}】: {message}")
+                self._count("failed")
+                failed.append(chunk[0])
+                continue
+            logger.warning(f"Thao tác hàng loạt {operation} thất bại（{len(chunk)} mục），Thử lại từng mục")
+            applied = self._already_applied(operation, chunk, **kwargs)
+            if applied:
+                logger.info(f"{len(applied)} mục đã được xử lý trước khi lô gặp lỗi，Không gửi lại")
+                self._record_success(operation, [name for name in chunk if name in applied], **kwargs)
+            for name in chunk:
+                if name not in applied:
+                    failed.extend(self._batch_operation(operation, [name], **kwargs))
+        return failed
+
+    def _record_success(self, operation: str, names: List[str], **kwargs):
+        """Ghi nhận các tên đã được gửi thành công"""
+        self._count(operation, len(names))
+        if operation == "copy":
+            self.copy_task_queue.record_submitted(len(names))
+            self._submitted_copies.update(
+                (_join_path(kwargs["src_dir"], name), _join_path(kwargs["dst_dir"])) for name in names)
+
+    def _list_names(self, directory: str) -> Optional[set]:
+        """Tên đã chuẩn hóa của các mục trong thư mục，None nếu không thể liệt kê"""
+        try:
+            return {normalize_filename(item["name"]) for page in self.iter_directory_pages(directory)
+                    for item in page if item.get("name")}
+        except DirectoryListingError:
+            return None
+
+    def _already_applied(self, operation: str, names: List[str], **kwargs) -> set:
+        """
+        Các tên trong một lô thất bại mà máy chủ đã xử lý trước khi gặp lỗi
+
+        AList xử lý các tên theo thứ tự và dừng ở lỗi đầu tiên：các tên trước đó đã được
+        đưa vào hàng đợi sao chép（hoặc đã di chuyển/xóa），gửi lại sẽ tạo tác vụ trùng
+        hoặc báo lỗi "không tìm thấy"
+        """
+        if operation == "copy":
+            self.copy_task_queue.refresh(force=True)
+            applied = {name for name in names
+                       if self.copy_task_queue.contains(_join_path(kwargs["src_dir"], name), kwargs["dst_dir"])}
+            # Tác vụ sao chép tệp nhỏ có thể đã hoàn thành và rời khỏi hàng đợi
+            existing = self._list_names(kwargs["dst_dir"]) or set()
+            return applied | {name for name in names if normalize_filename(name) in existing}
+        remaining = self._list_names(kwargs["src_dir"] if operation == "move" else kwargs["dir"])
+        if remaining is None:
+            return set()
+        applied = {name for name in names if normalize_filename(name) not in remaining}
+        if operation == "move" and applied:
+            # Chỉ coi là đã di chuyển nếu mục đã có ở thư mục đích（không phải vốn không tồn tại）
+            moved = self._list_names(kwargs["dst_dir"])
+            if moved is not None:
+                applied = {name for name in applied if normalize_filename(name) in moved}
+        return applied
+
+    def _copy_items(self, src_dir: str, dst_dir: str, names: List[str]) -> List[str]:
+        """Sao chép nhiều tệp hoặc thư mục，trả về các tên thất bại"""
+        failed = self._batch_operation("copy", names, src_dir=src_dir, dst_dir=dst_dir)
+        succeeded = len(names) - len(failed)
+        if succeeded:
+            logger.info(f"Đã gửi {succeeded} tác vụ sao chép【{src_dir}】->【{dst_dir}】")
+        return failed
+
+    def _move_items(self, src_dir: str, dst_dir: str, names: List[str]) -> List[str]:
+        """Di chuyển nhiều tệp hoặc thư mục，trả về các tên thất bại"""
+        failed = self._batch_operation("move", names, src_dir=src_dir, dst_dir=dst_dir)
+        succeeded = len(names) - len(failed)
+        if succeeded:
+            logger.info(f"Đã di chuyển {succeeded} mục【{src_dir}】->【{dst_dir}】")
+        return failed
+
+    def _remove_items(self, directory: str, names: List[str]) -> List[str]:
+        """Xóa nhiều tệp hoặc thư mục，trả về các tên thất bại"""
+        failed = self._batch_operation("remove", names, dir=directory)
+        succeeded = len(names) - len(failed)
+        if succeeded:
+            logger.info(f"Đã xóa {succeeded} mục trong【{directory}】")
+        return failed
+
     def _copy_item(self, src_dir: str, dst_dir: str, item_name: str) -> bool:
         """Sao chép tệp hoặc thư mục"""
-        response = self._directory_operation("copy",
-                                             src_dir=src_dir,
-                                             dst_dir=dst_dir,
-                                             names=[item_name])
-        if response:
+        if not self._copy_items(src_dir, dst_dir, [item_name]):
             logger.info(f"tài liệu【{item_name}】Sao chép thành công")
             return True
         logger.error("Sao chép tệp không thành công")
@@ -316,11 +1279,7 @@ class AlistSync:
 
     def _move_item(self, src_dir: str, dst_dir: str, item_name: str) -> bool:
         """Di chuyển các tập tin hoặc thư mục"""
-        response = self._directory_operation("move",
-                                             src_dir=src_dir,
-                                             dst_dir=dst_dir,
-                                             names=[item_name])
-        if response:
+        if not self._move_items(src_dir, dst_dir, [item_name]):
             logger.info(f"Tệp từ【{src_dir}/{item_name}】Di chuyển đến【{dst_dir}/{item_name}】Thành công trên thiết bị di động")
             return True
         logger.error("Di chuyển tập tin không thành công")
@@ -333,30 +1292,17 @@ class AlistSync:
 
     def get_storage_list(self) -> List[str]:
         """Nhận danh sách lưu trữ"""
-        if not self.token:
-            if not self.login():
-                return []
-
-        headers = {
-            "Authorization": self.token,
-            "User-Agent": "Apifox/1.0.0 (https://apifox.com)",
-            "Content-Type": "application/json"
-        }
-        response = self._make_request("GET", "/api/admin/storage/list", headers)
-        if response:
+        response = self._authorized_request("GET", "/api/admin/storage/list")
+        if response and response.get("code") == 200:
             storage_list = response["data"]["content"]
             return [item["mount_path"] for item in storage_list]
         logger.error("Không nhận được danh sách lưu trữ")
         return []
 
     def check_regex(self, path: str) -> bool:
-        if self.regex_patterns_list:
-            for regex in self.regex_patterns_list:
-                if regex.match(path):
-                    return True
-        if self.regex_pattern and self.regex_pattern.match(path):
-            return True
-        return False
+        if not self.regex_patterns_list and not self.regex_pattern:
+            return False
+        return self.path_filter.match_regex(path)
 
     def sync_directories(self, src_dir: str, dst_dir: str) -> bool:
         """Đồng bộ hóa hai thư mục"""
@@ -371,51 +1317,387 @@ class AlistSync:
             if not self.is_path_exists(src_dir):
                 logger.error(f"Thư mục nguồn【{src_dir}】Không tồn tại，Dừng đồng bộ hóa")
                 return False
-            result = self._recursive_copy(src_dir, dst_dir)
+            self.manifest = self._load_manifest(src_dir, dst_dir)
+            self._prepare_source_index(src_dir)
+            walker = TreeWalker(self, self.walk_concurrency)
+            self._count("directories_found")
+            try:
+                result = self._recursive_copy(src_dir, dst_dir, walker=walker)
+            finally:
+                walker.close()
+                # Các thư mục đã xác minh vẫn đúng kể cả khi một phần đồng bộ thất bại hoặc bị hủy
+                if self.manifest:
+                    self.manifest.save()
+                    self.manifest = None
+                self.source_index = None
             # Xóa đệ quy các thư mục trống
             if self.move_file_action:
                 self._remove_empty_folders(src_dir, src_dir)
+            filter_stats = self.path_filter.stats()
+            if filter_stats:
+                logger.info(f"Thống kê bộ lọc: {filter_stats}")
 
             logger.info(f"Đồng bộ hóa thư mục được hoàn thành - Thư mục nguồn: {src_dir}, Thư mục mục tiêu: {dst_dir}, kết quả: {'thành công' if result else 'thất bại'}")
             return result
+        except SyncCancelled:
+            logger.warning(f"Đồng bộ hóa thư mục bị hủy - Thư mục nguồn: {src_dir}, Thư mục mục tiêu: {dst_dir}")
+            return False
         except Exception as e:
             logger.error(f"Đồng bộ hóa thư mục không thành công: {str(e)}")
             return False
 
-    def _recursive_copy(self, src_dir: str, dst_dir: str) -> bool:
-        """Sao chép đệ quy nội dung thư mụcp"""
+    def _load_manifest(self, src_dir: str, dst_dir: str) -> Optional[SyncManifest]:
+        """Tải manifest của cặp thư mục nếu đồng bộ tăng dần được bật"""
+        if not self.manifest_dir:
+            return None
+        pair_hash = hashlib.sha1(f"{src_dir}:{dst_dir}".encode("utf-8")).hexdigest()[:16]
+        key = re.sub(r"[^\w.-]", "_", str(self.manifest_key)) if self.manifest_key else "default"
+        path = os.path.join(self.manifest_dir, f"{key}_{pair_hash}.json")
+        fingerprint = SyncManifest.make_fingerprint(
+            src_dir=src_dir, dst_dir=dst_dir, exclude_list=self.exclude_list,
+            regex_patterns=[getattr(p, "pattern", p) for p in self.regex_patterns_list or []],
+            regex_pattern=getattr(self.regex_pattern, "pattern", self.regex_pattern),
+            size_min=self.size_min, size_max=self.size_max,
+            sync_delete_action=self.sync_delete_action, move_file_action=self.move_file_action)
+        return SyncManifest(path, fingerprint, self.manifest_max_age).load()
+
+    def _recursive_copy(self, src_dir: str, dst_dir: str, dst_known_empty: bool = False,
+                        walker: "TreeWalker" = None) -> bool:
+        """
+        Sao chép đệ quy nội dung thư mục
+
+        Nếu có walker，kế hoạch của thư mục được lấy từ các luồng liệt kê song song；
+        các thao tác vẫn được thực hiện tuần tự theo thứ tự của danh sách nguồn
+        """
         try:
             if self.is_path_excluded(src_dir):
                 logger.info(f"Loại trừ thư mục: {src_dir}, Bỏ qua đồng bộ hóa")
                 return True
             logger.info(f"Bắt đầu sao chép đệ quy - Thư mục nguồn: {src_dir}, Thư mục mục tiêu: {dst_dir}")
-            src_contents = self.get_directory_contents(src_dir)
-            if not src_contents:
-                logger.info(f"Thư mục nguồn trống hoặc nội dung không nhận được: {src_dir}")
-                # return True
-
-            if self.sync_delete:
-                self._handle_sync_delete(src_dir, dst_dir, src_contents)
-            if src_contents:
-                for item in src_contents:
-                    if not self._copy_item_with_check(src_dir, dst_dir, item):
-                        logger.error(f"Không thể sao chép dự án: {item.get('name', 'Dự án không xác định')}")
-                        return False
-                logger.info(f"Sao chép đệ quy được hoàn thành - Thư mục nguồn: {src_dir}, Thư mục mục tiêu: {dst_dir}")
+            if walker:
+                plan = walker.result(src_dir, dst_dir, dst_known_empty)
+            else:
+                plan = self._scan_directory(src_dir, dst_dir, dst_known_empty)
+            if plan is None:
+                return False
+            if not self._execute_plan(src_dir, dst_dir, plan, walker):
+                return False
+            logger.info(f"Sao chép đệ quy được hoàn thành - Thư mục nguồn: {src_dir}, Thư mục mục tiêu: {dst_dir}")
             return True
+        except SyncCancelled:
+            raise
         except Exception as e:
             logger.error(f"sao chép đệ quy không thành công: {str(e)}")
         return False
 
-    def _handle_sync_delete(self, src_dir: str, dst_dir: str, src_contents: List[Dict]):
+    def _scan_directory(self, src_dir: str, dst_dir: str, dst_known_empty: bool = False,
+                        prefetch=None) -> Optional[Iterable[Dict]]:
         """
-        Xử lý logic xóa đồng bộ
-        
+        Liệt kê thư mục nguồn và đích rồi lập kế hoạch，trả về None nếu không thể liệt kê
+
+        Chỉ trang đầu tiên của thư mục nguồn được lập kế hoạch ngay；nếu còn trang khác，
+        kế hoạch trả về là một iterator đọc tiếp các trang khi được tiêu thụ.
+        prefetch(src, dst, dst_known_empty) được gọi cho các thư mục con của trang đầu tiên
+        """
+        # Thư mục đích chỉ được liệt kê một lần cho mỗi thư mục
+        if dst_known_empty:
+            dst_index = {}
+        else:
+            dst_index = self._list_destination(dst_dir)
+            if dst_index is None:
+                return None
+
+        index_key = src_dir.rstrip("/") or "/"
+        if self.source_index is not None and index_key in self.source_index:
+            src_pages = iter([self.source_index[index_key]])
+        else:
+            # Thư mục không có trong chỉ mục（mới tạo sau lần xây chỉ mục cuối）được liệt kê trực tiếp
+            src_pages = self.iter_directory_pages(src_dir)
+        try:
+            first_page = next(src_pages, [])
+        except DirectoryListingError as e:
+            logger.error(f"Không liệt kê được thư mục nguồn: {str(e)}")
+            return None
+        if not first_page:
+            logger.info(f"Thư mục nguồn trống: {src_dir}")
+        self._count("directories")
+
+        seen = set()
+        head = list(self._plan_items(src_dir, dst_dir, first_page, dst_index, seen))
+        if prefetch:
+            for entry in head:
+                if entry["action"] == "recurse":
+                    prefetch(f"{src_dir}/{entry['name']}".replace("//", "/"),
+                             f"{dst_dir}/{entry['name']}".replace("//", "/"), not entry["dst_exists"])
+        return itertools.chain(head, self._plan_remaining(src_dir, dst_dir, src_pages, dst_index, seen))
+
+    def _plan_remaining(self, src_dir: str, dst_dir: str, src_pages: Iterator[List[Dict]],
+                        dst_index: Dict[str, Dict], seen: set) -> Iterator[Dict]:
+        """Lập kế hoạch cho các trang nguồn còn lại，sau cùng là các mục khác biệt của đích"""
+        for page in src_pages:
+            yield from self._plan_items(src_dir, dst_dir, page, dst_index, seen)
+        # Chỉ biết mục nào thừa ở đích sau khi đã đọc hết thư mục nguồn
+        yield from self._plan_deletes(dst_dir, dst_index, seen)
+
+    def _list_destination(self, dst_dir: str) -> Optional[Dict[str, Dict]]:
+        """
+        Liệt kê thư mục đích để lập kế hoạch
+
+        trở lại:
+            Chỉ mục {tên đã chuẩn hóa: mục}，rỗng nếu thư mục đích chưa tồn tại，None nếu không thể liệt kê
+        """
+        dst_index = {}
+        try:
+            for page in self.iter_directory_pages(dst_dir):
+                for item in page:
+                    if item.get("name"):
+                        # Chỉ giữ các trường cần để so sánh
+                        dst_index[normalize_filename(item["name"])] = {
+                            key: item.get(key) for key in ("name", "size", "modified", "is_dir")}
+            return dst_index
+        except DirectoryListingError as e:
+            if not dst_index and not self.is_path_exists(dst_dir):
+                return {}
+            logger.error(f"Không liệt kê được thư mục đích: {str(e)}")
+            return None
+
+    @staticmethod
+    def _index_by_name(contents: List[Dict]) -> Dict[str, Dict]:
+        """Lập chỉ mục danh sách thư mục theo tên đã chuẩn hóa"""
+        return {normalize_filename(item["name"]): item for item in contents or [] if item.get("name")}
+
+    def plan_directory(self, src_dir: str, dst_dir: str, src_contents: List[Dict],
+                       dst_contents: List[Dict]) -> List[Dict]:
+        """
+        So sánh danh sách nguồn và đích trong bộ nhớ，Lập kế hoạch cho toàn bộ thư mục
+
         tham số:
             src_dir: Thư mục nguồn
             dst_dir: Thư mục mục tiêu
             src_contents: Danh sách nội dung thư mục nguồn
-            
+            dst_contents: Danh sách nội dung thư mục mục tiêu
+
+        trở lại:
+            Danh sách quyết định，mỗi mục là {"action": ..., "name": ..., "item": ...}
+                - "recurse": Thư mục con，"dst_exists" cho biết thư mục đích đã có chưa
+                - "copy": Tệp chưa có ở đích
+                - "replace": Tệp đã thay đổi，Xóa và sao chép lại
+                - "skip": Không cần xử lý
+                - "remove_source": Tệp đã có ở đích，Xóa tệp nguồn（chế độ di chuyển）
+                - "pending": Tệp đang nằm trong hàng đợi sao chép
+                - "unchanged": Thư mục con không đổi theo manifest，Bỏ qua liệt kê
+                - "delete": Mục khác biệt trong thư mục đích（theo sync_delete_action，luôn ở cuối）
+        """
+        seen = set()
+        dst_index = self._index_by_name(dst_contents)
+        plan = list(self._plan_items(src_dir, dst_dir, src_contents, dst_index, seen))
+        plan.extend(self._plan_deletes(dst_dir, dst_index, seen))
+        return plan
+
+    def _plan_deletes(self, dst_dir: str, dst_index: Dict[str, Dict], seen: set) -> Iterator[Dict]:
+        """Các mục khác biệt trong thư mục đích"""
+        if not self.sync_delete:
+            return
+        for name, dst_item in dst_index.items():
+            if name in seen:
+                continue
+            full_dst_path = f"{dst_dir.rstrip('/')}/{name}".replace("//", "/")
+            if self.is_path_excluded(full_dst_path):
+                logger.info(f"Loại trừ thư mục: {full_dst_path}, Bỏ qua xóa")
+                continue
+            yield {"action": "delete", "name": dst_item["name"], "item": dst_item}
+
+    def _can_copy_whole_directory(self, src_path: str, dst_path: str) -> bool:
+        """
+        Kiểm tra xem có thể sao chép cả thư mục bằng một yêu cầu copy không
+
+        Chỉ khi không có bộ lọc nào có thể loại bỏ tệp trong cây con：không có biểu thức chính quy，
+        giới hạn kích thước，thư mục loại trừ nằm bên dưới，và không ở chế độ di chuyển
+        """
+        if self.move_file_action or self.path_filter.has_file_rules:
+            return False
+        return not self.path_filter.intersects(src_path) and not self.path_filter.intersects(dst_path)
+
+    def _plan_items(self, src_dir: str, dst_dir: str, src_items: Iterable[Dict],
+                    dst_index: Dict[str, Dict], seen: set) -> Iterator[Dict]:
+        """Lập kế hoạch cho một trang của thư mục nguồn，tên đã gặp được thêm vào seen"""
+        for item in src_items or []:
+            item_name = item.get("name")
+            if not item_name:
+                logger.error("Tên dự án trống")
+                continue
+            seen.add(normalize_filename(item_name))
+
+            src_path = f"{src_dir}/{item_name}".replace("//", "/")
+            dst_path = f"{dst_dir}/{item_name}".replace("//", "/")
+            file_size = item.get("size")
+            if not item.get("is_dir", False):
+                self._count("files_scanned")
+            decision = self.path_filter.check(src_path, dst_path, item.get("is_dir", False), file_size, item_name)
+            if decision == PathFilter.SKIP_SUBTREE:
+                # Thư mục bị loại trừ không bao giờ được liệt kê
+                logger.info(f"Loại trừ các đường dẫn: {src_path} hoặc {dst_path}, Bỏ qua xử lý")
+                continue
+            if decision == PathFilter.SKIP_FILE:
+                logger.info(f"tài liệu【{item_name}】Không phù hợp với bộ lọc kích thước hoặc biểu thức chính quy，Bỏ qua đồng bộ hóa")
+                self._count("filtered")
+                continue
+
+            dst_item = dst_index.get(normalize_filename(item_name))
+
+            if item.get("is_dir", False):
+                if dst_item is None and self._can_copy_whole_directory(src_path, dst_path):
+                    if self.copy_task_queue.contains(src_path, dst_dir):
+                        logger.info(f"Thư mục【{item_name}】Trong danh sách các nhiệm vụ còn dang dở，Bỏ qua sao chép")
+                        self._count("skipped")
+                        yield {"action": "pending", "name": item_name, "item": item}
+                    else:
+                        # Thư mục đích chưa có và không có bộ lọc nào áp dụng：để AList sao chép cả cây con
+                        logger.info(f"Thư mục【{item_name}】Chưa có ở đích，Sao chép toàn bộ thư mục")
+                        self._count("bytes_planned", file_size or 0)
+                        yield {"action": "copy", "name": item_name, "item": item}
+                    continue
+                dst_modified = dst_item.get("modified") if dst_item else None
+                if self.manifest and self.manifest.is_unchanged(src_path, item.get("modified"), dst_modified):
+                    logger.info(f"Thư mục【{src_path}】Không thay đổi kể từ lần đồng bộ trước，Bỏ qua liệt kê")
+                    self._count("skipped")
+                    yield {"action": "unchanged", "name": item_name, "item": item}
+                    continue
+                # Thư mục đã phát hiện nhưng chưa liệt kê được dùng để ước tính thời gian còn lại
+                self._count("directories_found")
+                yield {"action": "recurse", "name": item_name, "item": item,
+                       "dst_exists": dst_item is not None, "dst_modified": dst_modified}
+                continue
+
+            # Kiểm tra xem nó có nằm trong danh sách các nhiệm vụ còn dang dở không，Nếu có，Nhảy
+            if self.copy_task_queue.contains(src_path, dst_dir):
+                logger.info(f"tài liệu【{item_name}】Trong danh sách các nhiệm vụ còn dang dở，Bỏ qua sao chép")
+                self._count("skipped")
+                yield {"action": "pending", "name": item_name, "item": item}
+                continue
+
+            if dst_item is None:
+                self._count("bytes_planned", file_size or 0)
+                yield {"action": "copy", "name": item_name, "item": item}
+            elif file_size == dst_item.get("size"):
+                logger.info(f"tài liệu【{item_name}】Đã tồn tại và có cùng kích thước，Bỏ qua sao chép")
+                if not self.move_file_action:
+                    self._count("skipped")
+                yield {"action": "remove_source" if self.move_file_action else "skip",
+                       "name": item_name, "item": item}
+            else:
+                # So sánh thời gian sửa đổi
+                src_modified = parse_time_and_adjust_utc(item.get("modified") or "")
+                dst_modified = parse_time_and_adjust_utc(dst_item.get("modified") or "")
+                if src_modified and dst_modified and dst_modified > src_modified:
+                    logger.info(f"tài liệu【{item_name}】Tệp đích được sửa đổi sau tệp nguồn nên việc sao chép bị bỏ qua.")
+                    if not self.move_file_action:
+                        self._count("skipped")
+                    yield {"action": "remove_source" if self.move_file_action else "skip",
+                           "name": item_name, "item": item}
+                else:
+                    self._count("bytes_planned", file_size or 0)
+                    yield {"action": "replace", "name": item_name, "item": item}
+
+    def _execute_plan(self, src_dir: str, dst_dir: str, plan: Iterable[Dict], walker: "TreeWalker" = None) -> bool:
+        """
+        Thực hiện các quyết định do plan_directory tạo ra
+
+        Kế hoạch được tiêu thụ dần：các thao tác trên tệp được gửi theo lô mỗi khi đủ batch_size，
+        các mục khác biệt của đích được xử lý sau cùng，rồi mới đệ quy các thư mục con
+        """
+        ok = True
+        # Thư mục chỉ được ghi vào manifest khi cả cây con không cần thao tác nào
+        in_sync = self.manifest is not None
+        batches = {"replace": [], "copy": [], "remove_source": []}
+        deletes, recurses, files = [], [], {}
+        for entry in plan:
+            action = entry["action"]
+            if action in batches:
+                in_sync = False
+                batches[action].append(entry["name"])
+                if len(batches[action]) >= self.batch_size:
+                    ok = self._submit_batch(src_dir, dst_dir, action, batches[action]) and ok
+                    batches[action] = []
+            elif action == "recurse":
+                recurses.append(entry)
+                if walker:
+                    # Quét trước thư mục con trong khi vẫn đang đọc các trang còn lại
+                    walker.submit(f"{src_dir}/{entry['name']}".replace("//", "/"),
+                                  f"{dst_dir}/{entry['name']}".replace("//", "/"), not entry["dst_exists"])
+            elif action == "delete":
+                in_sync = False
+                deletes.append(entry)
+            elif action == "unchanged":
+                self.manifest.carry(f"{src_dir}/{entry['name']}".replace("//", "/"))
+            elif action == "skip":
+                if self.manifest is not None:
+                    files[entry["name"]] = [entry["item"].get("size"), entry["item"].get("modified")]
+            else:
+                in_sync = False
+        for action, names in batches.items():
+            if names:
+                ok = self._submit_batch(src_dir, dst_dir, action, names) and ok
+
+        if self.sync_delete:
+            self._handle_sync_delete(dst_dir, deletes)
+
+        if not ok:
+            return False
+
+        for entry in recurses:
+            item_name = entry["name"]
+            src_path = f"{src_dir}/{item_name}".replace("//", "/")
+            dst_path = f"{dst_dir}/{item_name}".replace("//", "/")
+            if entry["dst_exists"]:
+                logger.info(f"Thư mục【{dst_path}】Đã tồn tại，bỏ qua bước tạo")
+            else:
+                logger.info(f"Tạo một thư mục con mục tiêu: {dst_path}")
+                if not self.create_directory(dst_path):
+                    return False
+            # Các thư mục con sao chép đệ quy
+            if not self._recursive_copy(src_path, dst_path, dst_known_empty=not entry["dst_exists"], walker=walker):
+                logger.error(f"Không thể sao chép dự án: {item_name}")
+                return False
+            if self.manifest is not None:
+                in_sync = self.manifest.stamp(src_path, entry["item"].get("modified"),
+                                              entry.get("dst_modified")) and in_sync
+
+        if in_sync:
+            self.manifest.record(src_dir, files)
+        return True
+
+    def _submit_batch(self, src_dir: str, dst_dir: str, action: str, names: List[str]) -> bool:
+        """Gửi một lô thao tác trên tệp của kế hoạch，trả về False nếu có tên thất bại"""
+        if action == "replace":
+            # Xóa các tệp cũ đã thay đổi trước khi sao chép lại
+            logger.info(f"{len(names)} tệp có sự thay đổi，Xóa và sao chép lại")
+            removed_failed = set(self._remove_items(dst_dir, names))
+            for name in removed_failed:
+                logger.error(f"Không xóa tệp đích: {dst_dir}/{name}")
+            names = [name for name in names if name not in removed_failed]
+            failed = self._copy_items(src_dir, dst_dir, names) if names else []
+            for name in failed:
+                logger.error(f"Không thể sao chép dự án: {name}")
+            return not removed_failed and not failed
+        if action == "copy":
+            failed = self._copy_items(src_dir, dst_dir, names)
+            for name in failed:
+                logger.error(f"Không thể sao chép dự án: {name}")
+            return not failed
+        failed = self._remove_items(src_dir, names)
+        for name in failed:
+            logger.error(f"Không xóa tệp nguồn: {src_dir}/{name}")
+        return not failed
+
+    def _handle_sync_delete(self, dst_dir: str, deletes: List[Dict]):
+        """
+        Xử lý logic xóa đồng bộ
+
+        tham số:
+            dst_dir: Thư mục mục tiêu
+            deletes: Các quyết định "delete" do plan_directory tạo ra
+
         Cách xử lý:
             - "none": Không xử lý sự khác biệt của thư mục đích
             - "move": Di chuyển đến thư mục trash của đích
@@ -426,50 +1708,32 @@ class AlistSync:
             if self.sync_delete_action == "none":
                 logger.info("Chính sách xử lý khác biệt：Không xử lý sự khác biệt của thư mục đích")
                 return
-                
-            dst_contents = self.get_directory_contents(dst_dir)
-            src_names = {}
-            if src_contents:
-                src_names = {normalize_filename(item["name"]) for item in src_contents}
-
-            dst_names = {}
-            if dst_contents:
-                dst_names = {normalize_filename(item["name"]) for item in dst_contents}
 
-            if src_names:
-                to_delete = set(dst_names) - set(src_names)
-            else:
-                to_delete = dst_names
-
-            if not to_delete:
+            if not deletes:
                 logger.info("Không có mục khác biệt được xử lý")
                 return
 
+            trash_dir = None
             # Chính sách xử lý hồ sơ
             if self.sync_delete_action == "move":
                 logger.info("Chính sách xử lý khác biệt：Di chuyển đến thư mục trash của đích")
+                trash_dir = self._get_trash_dir(dst_dir)
+                if trash_dir and not self.is_path_exists(trash_dir):
+                    logger.info(f"Tạo một thư mục Bin Recycle: {trash_dir}")
+                    self.create_directory(trash_dir)
             elif self.sync_delete_action == "delete":
                 logger.info("Chính sách xử lý khác biệt：Xóa các mục khác biệt trong thư mục đích")
-                
-            for name in to_delete:
-                full_dst_path = f"{dst_dir.rstrip('/')}/{name}".replace("//", "/")
-                if self.is_path_excluded(full_dst_path):
-                    logger.info(f"Loại trừ thư mục: {full_dst_path}, Bỏ qua xóa")
-                    continue
 
-                if self.sync_delete_action == "move":
-                    logger.info(f"Xử lý các dự án di động: {name}")
-                    trash_dir = self._get_trash_dir(dst_dir)
-                    if trash_dir:
-                        if not self.is_path_exists(trash_dir):
-                            logger.info(f"Tạo một thư mục Bin Recycle: {trash_dir}")
-                            self.create_directory(trash_dir)
-                        logger.info(f"Di chuyển đến thùng rác: {name}")
-                        self._move_item(dst_dir, trash_dir, name)
-                elif self.sync_delete_action == "delete":
-                    logger.info(f"Quy trình đã xóa các mục: {name}")
-                    logger.info(f"Xóa dự án trực tiếp: {name}")
-                    self._directory_operation("remove", dir=dst_dir, names=[name])
+            names = [entry["name"] for entry in deletes]
+            if self.sync_delete_action == "move":
+                if trash_dir:
+                    logger.info(f"Di chuyển {len(names)} mục đến thùng rác: {trash_dir}")
+                    failed = self._move_items(dst_dir, trash_dir, names)
+                    self._count("deleted", len(names) - len(failed))
+            elif self.sync_delete_action == "delete":
+                logger.info(f"Xóa trực tiếp {len(names)} mục khác biệt")
+                failed = self._remove_items(dst_dir, names)
+                self._count("deleted", len(names) - len(failed))
         except Exception as e:
             logger.error(f"Không thể xử lý việc xóa đồng bộ: {str(e)}")
 
@@ -482,13 +1746,8 @@ class AlistSync:
         return None
 
     def close(self):
-        """Đóng kết nối"""
-        try:
-            if hasattr(self, 'connection') and self.connection:
-                self.connection.close()
-                logger.debug("Kết nối được đóng lại")
-        except Exception as e:
-            logger.error(f"Xảy ra lỗi khi đóng kết nối: {str(e)}")
+        """Kết thúc phiên bản，các kết nối vẫn được giữ trong nhóm dùng chung để tái sử dụng"""
+        logger.debug("Kết nối được trả về nhóm")
 
     def get_file_info(self, path: str) -> Optional[Dict]:
         """Nhận thông tin tập tin，Bao gồm kích thước và thời gian sửa đổi"""
@@ -497,265 +1756,290 @@ class AlistSync:
             return response.get("data", {})
         return None
 
-    def _copy_item_with_check(self, src_dir: str, dst_dir: str, item: Dict) -> bool:
-        """Sao chép dự án và kiểm tra nó"""
-        try:
-            item_name = item.get('name')
-            if not item_name:
-                logger.error("Tên dự án trống")
-                return False
-                
-            src_path = f"{src_dir}/{item_name}".replace("//", "/")
-            dst_path = f"{dst_dir}/{item_name}".replace("//", "/")
+    def is_path_excluded(self, path: str) -> bool:
+        """Kiểm tra xem path có nằm trong hoặc bên dưới bất kỳ thư mục loại trừ nào"""
+        return bool(path) and self.path_filter.is_excluded(path)
 
-            if self.is_path_excluded(src_path) or self.is_path_excluded(dst_path):
-                logger.info(f"Loại trừ các đường dẫn: {src_path} hoặc {dst_path}, Bỏ qua xử lý")
-                return True
+class TreeWalker:
+    """
+    Liệt kê cây thư mục song song bằng một nhóm luồng có giới hạn
 
-            if not item_name:
-                logger.error("Tên dự án trống")
-                return False
+    Mỗi thư mục được quét (liệt kê nguồn/đích và lập kế hoạch) trên một luồng worker；
+    khi quét xong，các thư mục con cần đệ quy được đưa vào hàng đợi để quét trước.
+    Luồng chính lấy kết quả theo thứ tự duyệt sâu nên các quyết định vẫn xác định。
+    Số thư mục quét trước chưa được lấy kết quả bị giới hạn ở max_pending，vì mỗi kế hoạch
+    giữ trang nguồn đầu tiên và toàn bộ chỉ mục đích trong bộ nhớ
+    """
 
-            logger.info(f"Dự án xử lý: {item_name}")
+    # Số thư mục quét trước tối đa cho mỗi luồng
+    PENDING_PER_WORKER = 4
 
-            # Xử lý các tập tin
-            src_path = f"{src_dir}/{item_name}".replace('//', '/')
-            dst_path = f"{dst_dir}/{item_name}".replace('//', '/')
+    def __init__(self, alist_sync: AlistSync, concurrency: int = DEFAULT_WALK_CONCURRENCY):
+        self.alist_sync = alist_sync
+        concurrency = max(1, concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="alist-walk")
+        self.max_pending = concurrency * self.PENDING_PER_WORKER
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.closed = False
 
-            # Nếu đó là một thư mục，Xử lý đệ quy
-            if item.get('is_dir', False):
+    def submit(self, src_dir: str, dst_dir: str, dst_known_empty: bool = False, required: bool = False):
+        """
+        Đưa một thư mục vào hàng đợi quét
 
-                # Đảm bảo thư mục con mục tiêu tồn tại
-                if not self.is_path_exists(dst_path):
-                    logger.info(f"Tạo một thư mục con mục tiêu: {dst_path}")
-                    if not self.create_directory(dst_path):
-                        return False
-                else:
-                    logger.info(f"Thư mục【{dst_path}】Đã tồn tại，bỏ qua bước tạo")
+        Quét trước（required=False）bị bỏ qua khi đã có max_pending thư mục đang chờ；
+        thư mục đó sẽ được quét khi luồng chính cần đến
+        """
+        key = (src_dir, dst_dir)
+        with self.lock:
+            if self.closed or key in self.futures:
+                return
+            if not required and len(self.futures) >= self.max_pending:
+                return
+            # Giữ ngữ cảnh của lần chạy（định danh nhật ký）trên luồng worker
+            context = contextvars.copy_context()
+            self.futures[key] = self.executor.submit(context.run, self._scan, src_dir, dst_dir, dst_known_empty)
+
+    def _scan(self, src_dir: str, dst_dir: str, dst_known_empty: bool) -> Optional[Iterable[Dict]]:
+        return self.alist_sync._scan_directory(src_dir, dst_dir, dst_known_empty, prefetch=self.submit)
+
+    def result(self, src_dir: str, dst_dir: str, dst_known_empty: bool = False) -> Optional[List[Dict]]:
+        """Chờ và lấy kế hoạch của một thư mục"""
+        self.submit(src_dir, dst_dir, dst_known_empty, required=True)
+        with self.lock:
+            future = self.futures.pop((src_dir, dst_dir), None)
+        if future is None:
+            return None
+        return future.result()
 
-                # Các thư mục con sao chép đệ quy
-                return self._recursive_copy(src_path, dst_path)
-            else:
-                # Lọc kích thước tập tin
-                file_size = item.get("size")
-                if self.size_min is not None and file_size is not None and file_size < self.size_min:
-                    logger.info(f"tài liệu【{item_name}】Nhỏ hơn kích thước chuyển tối thiểu({self.size_min}Byte)，Bỏ qua đồng bộ hóa")
-                    return True
-                if self.size_max is not None and file_size is not None and file_size > self.size_max:
-                    logger.info(f"tài liệu【{item_name}】Lớn hơn kích thước truyền tối đa({self.size_max}Byte)，Bỏ qua đồng bộ hóa")
-                    return True
+    def close(self):
+        """Hủy các thư mục chưa quét và dừng các luồng"""
+        with self.lock:
+            self.closed = True
+            self.futures.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
 
-                # Đánh giá biểu thức chính quy, nếu nó khớp với biểu thức chính quy, bỏ qua bước sao chép
-                if(self.regex_patterns_list or self.regex_pattern):
-                    if not self.check_regex(item_name):
-                        logger.info(f"Không phù hợp với các biểu thức chính quy: {src_path}, Bỏ qua đồng bộ hóa")
-                        return True
-
-                    # Kiểm tra xem nó có nằm trong danh sách các nhiệm vụ còn dang dở không，Nếu có，Nhảy
-                    self.get_copy_task_undone()
-                    for task_item in self.task_list:
-                        if src_dir in task_item and dst_dir in task_item and src_path in task_item:
-                            logger.info(f"tài liệu【{item_name}】Trong danh sách các nhiệm vụ còn dang dở，Bỏ qua sao chép")
-                            return True
-                # Kiểm tra xem tệp đích có tồn tại không
-                if not self.is_path_exists(dst_path):
-                    logger.info(f"Sao chép tệp: {item_name}")
-                    return self._copy_item(src_dir, dst_dir, item_name)
-                else:
-                    # Nhận thông tin tệp nguồn và mục tiêu
-                    src_size = item.get("size")
-                    dst_info = self.get_file_info(dst_path)
-
-                    if not dst_info:
-                        logger.error(f"Không lấy được thông tin tệp đích: {dst_path}")
-                        return False
-
-                    dst_size = dst_info.get("size")
-
-                    # So sánh kích thước tệp
-                    if src_size == dst_size:
-                        logger.info(f"tài liệu【{item_name}】Đã tồn tại và có cùng kích thước，Bỏ qua sao chép")
-                        if self.move_file_action:
-                            if not self._directory_operation("remove", dir=src_dir, names=[item_name]):
-                                logger.error(f"Không xóa tệp nguồn: {src_path}")
-                                return False
-                            else:
-                                logger.info(f"Xóa thành công tệp nguồn: {src_path}")
-                                return True
-                        else:
-                            return True
-                    else:
-                        # So sánh thời gian sửa đổi
-                        src_modified = parse_time_and_adjust_utc(item.get("modified"))
-                        dst_modified = parse_time_and_adjust_utc(dst_info.get("modified"))
-
-                        if src_modified and dst_modified and dst_modified > src_modified:
-                            logger.info(f"tài liệu【{item_name}】Tệp đích được sửa đổi sau tệp nguồn nên việc sao chép bị bỏ qua.")
-                            if self.move_file_action:
-                                if not self._directory_operation("remove", dir=src_dir, names=[item_name]):
-                                    logger.error(f"Không xóa tệp nguồn: {src_dir}")
-                                    return False
-                                else:
-                                    logger.error(f"Xóa các tập tin nguồn: {src_dir}")
-                                    return True
-                            else:
-                                return True
-                        else:
-                            logger.info(f"tài liệu【{item_name}】Có một sự thay đổi，Xóa và sao chép lại")
-                            # Xóa các tập tin cũ
-                            if not self._directory_operation("remove", dir=dst_dir, names=[item_name]):
-                                logger.error(f"Không xóa tệp đích: {dst_path}")
-                                return False
-                            # Sao chép tệp mới
-                            return self._copy_item(src_dir, dst_dir, item_name)
-        except Exception as e:
-            logger.error(f"Xảy ra lỗi trong khi sao chép dự án: {str(e)}")
-            return False
-    def is_path_excluded(self, path: str) -> bool:
-        """Kiểm tra xem path có nằm trong hoặc bên dưới bất kỳ thư mục loại trừ nào"""
-        if not path or not self.exclude_list:
-            return False
-        normalized_path = path.rstrip("/")
-        for exclude in self.exclude_list:
-            exclude = exclude.rstrip("/")
-            if normalized_path == exclude or normalized_path.startswith(exclude + "/"):
-                return True
-        return False
 
-def get_dir_pairs_from_env() -> List[str]:
+def get_dir_pairs_from_env(environ=None) -> List[str]:
     """Nhận danh sách các cặp thư mục từ các biến môi trường"""
+    env = environ if environ is not None else os.environ
     dir_pairs_list = []
 
     # Nhận chínhDIR_PAIRS
-    if dir_pairs := os.environ.get("DIR_PAIRS"):
+    if dir_pairs := env.get("DIR_PAIRS"):
         dir_pairs_list.extend(dir_pairs.split(";"))
 
     # LấyDIR_PAIRS1đếnDIR_PAIRS50
     for i in range(1, 51):
-        if dir_pairs := os.environ.get(f"DIR_PAIRS{i}"):
+        if dir_pairs := env.get(f"DIR_PAIRS{i}"):
             dir_pairs_list.extend(dir_pairs.split(";"))
 
     return dir_pairs_list
 
 
-def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str = None, move_file: bool = False,
-         regex_patterns: str = None, size_min: int = None, size_max: int = None):
+def _env_int(name: str, default: Optional[int] = None, environ=None) -> Optional[int]:
+    """Đọc số nguyên không âm từ biến môi trường"""
+    value = (environ if environ is not None else os.environ).get(name)
+    return int(value) if value and value.isdigit() else default
+
+
+@dataclass
+class SyncConfig:
     """
-    Chức năng chính，Để thực hiện dòng lệnh
-    
+    Cấu hình của một lần chạy đồng bộ
+
+    Được truyền thẳng vào run_sync nên nhiều nhiệm vụ có thể chạy song song trong cùng
+    một tiến trình；from_env() đọc các biến môi trường cũ cho chế độ dòng lệnh
+    """
+    base_url: str
+    username: Optional[str] = None
+    password: Optional[str] = None
+    token: Optional[str] = None
+    # Cặp thư mục dạng "thư mục nguồn:thư mục đích"
+    dir_pairs: List[str] = field(default_factory=list)
+    sync_delete_action: str = "none"
+    exclude_dirs: List[str] = field(default_factory=list)
+    move_file: bool = False
+    regex_patterns: Optional[str] = None
+    size_min: Optional[int] = None
+    size_max: Optional[int] = None
+    batch_size: int = DEFAULT_BATCH_SIZE
+    walk_concurrency: int = DEFAULT_WALK_CONCURRENCY
+    queue_high_water: int = DEFAULT_QUEUE_HIGH_WATER
+    # None = một nửa ngưỡng trên（tối đa DEFAULT_QUEUE_LOW_WATER）
+    queue_low_water: Optional[int] = None
+    manifest_dir: Optional[str] = None
+    manifest_key: Optional[str] = None
+    manifest_max_age: int = DEFAULT_MANIFEST_MAX_AGE
+    use_search_index: bool = False
+    search_max_staleness: int = DEFAULT_SEARCH_MAX_STALENESS
+    list_page_size: int = DEFAULT_LIST_PAGE_SIZE
+    # Định danh lần chạy，dùng để tách nhật ký khi nhiều nhiệm vụ chạy cùng lúc
+    run_id: Optional[str] = None
+    # Mã hủy do người gọi giữ để dừng lần chạy từ luồng khác
+    cancel_token: Optional[CancelToken] = None
+    # Thống kê được cập nhật trong khi chạy（directories, files_scanned, copy, skipped, deleted, failed ...）
+    stats: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls, environ=None) -> "SyncConfig":
+        """Tạo cấu hình từ các biến môi trường"""
+        env = environ if environ is not None else os.environ
+        queue_high_water = _env_int("QUEUE_HIGH_WATER", DEFAULT_QUEUE_HIGH_WATER, env)
+        return cls(
+            base_url=env.get("BASE_URL"),
+            username=env.get("USERNAME"),
+            password=env.get("PASSWORD"),
+            token=env.get("TOKEN"),
+            dir_pairs=get_dir_pairs_from_env(env),
+            sync_delete_action=env.get("SYNC_DELETE_ACTION", "none"),
+            exclude_dirs=env.get("EXCLUDE_DIRS", "").split(","),
+            move_file=env.get("MOVE_FILE", "false").lower() == "true",
+            regex_patterns=env.get("REGEX_PATTERNS", None),
+            size_min=_env_int("SIZE_MIN", None, env),
+            size_max=_env_int("SIZE_MAX", None, env),
+            batch_size=_env_int("BATCH_SIZE", DEFAULT_BATCH_SIZE, env),
+            walk_concurrency=_env_int("WALK_CONCURRENCY", DEFAULT_WALK_CONCURRENCY, env),
+            queue_high_water=queue_high_water,
+            queue_low_water=_env_int("QUEUE_LOW_WATER", None, env),
+            manifest_dir=env.get("MANIFEST_DIR") or None,
+            manifest_key=env.get("MANIFEST_KEY") or None,
+            manifest_max_age=_env_int("MANIFEST_MAX_AGE", DEFAULT_MANIFEST_MAX_AGE, env),
+            use_search_index=env.get("USE_SEARCH_INDEX", "false").lower() == "true",
+            search_max_staleness=_env_int("SEARCH_MAX_STALENESS", DEFAULT_SEARCH_MAX_STALENESS, env),
+            list_page_size=_env_int("LIST_PAGE_SIZE", DEFAULT_LIST_PAGE_SIZE, env),
+        )
+
+
+# Định danh lần chạy của luồng hiện tại，được truyền sang các luồng liệt kê qua contextvars
+current_run_id = contextvars.ContextVar("alist_sync_run_id", default=None)
+
+
+class RunLogFilter(logging.Filter):
+    """Chỉ cho qua các bản ghi nhật ký được tạo trong một lần chạy cụ thể"""
+
+    def __init__(self, run_id: str):
+        super().__init__()
+        self.run_id = run_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return current_run_id.get() == self.run_id
+
+
+def progress_snapshot(stats: Dict[str, int], elapsed: float, running: bool = True) -> Dict:
+    """
+    Tổng hợp thống kê của một lần chạy thành các chỉ số tiến độ
+
+    Thời gian còn lại được ước tính từ tốc độ liệt kê thư mục trung bình và số thư mục
+    đã phát hiện nhưng chưa liệt kê；cây thư mục được phát hiện dần nên đây là giới hạn dưới
+
     tham số:
-        dir_pairs: Cặp thư mục, định dạng là "thư mục nguồn: thư mục đích", nhiều cặp thư mục được phân tách bằng dấu chấm phẩy
-        sync_del_action: Cách xử lý các mục khác biệt trong thư mục đích
-            - "none": Không xử lý sự khác biệt của thư mục đích（mặc định）
-            - "move": Di chuyển đến thư mục trash của đích
-            - "delete": Xóa các mục khác biệt trong thư mục đích
-        exclude_dirs: Thư mục loại trừ，Nhiều thư mục được phân tách bằng dấu phẩy
-        move_file: Có nên di chuyển tệp nguồn không，Mặc định làFalse
-        regex_patterns: Mẫu biểu thức chính quy
-        size_min: Chỉ chuyển các tệp lớn hơn kích thước được chỉ định（Byte，mặc định tắt）
-        size_max: Chỉ chuyển các tệp nhỏ hơn kích thước được chỉ định（Byte，mặc định tắt）
+        stats: Thống kê của lần chạy（SyncConfig.stats）
+        elapsed: Số giây kể từ khi bắt đầu
+        running: Lần chạy còn đang chạy không（đã kết thúc thì không có thời gian còn lại）
+
+    trở lại:
+        {"directories_listed", "directories_pending", "files_scanned", "copies_submitted", "skipped",
+         "deleted", "failed", "bytes_planned", ..., "elapsed", "directories_per_second", "eta"}
     """
-    code_souce()
-    xiaojin()
+    stats = dict(stats)
+    listed = stats.get("directories", 0)
+    pending = max(0, stats.get("directories_found", 0) - listed)
+    rate = listed / elapsed if elapsed > 0 else 0
+    eta = None
+    if running and rate > 0:
+        eta = round(pending / rate)
+    elif not running:
+        pending = 0
+    return {
+        "directories_listed": listed,
+        "directories_pending": pending,
+        "files_scanned": stats.get("files_scanned", 0),
+        "copies_submitted": stats.get("copy", 0),
+        "moves_submitted": stats.get("move", 0),
+        "skipped": stats.get("skipped", 0),
+        "filtered": stats.get("filtered", 0),
+        "deleted": stats.get("deleted", 0),
+        "failed": stats.get("failed", 0),
+        "bytes_planned": stats.get("bytes_planned", 0),
+        "elapsed": round(elapsed, 1),
+        "directories_per_second": round(rate, 2),
+        "eta": eta,
+    }
+
+
+def run_sync(config: SyncConfig) -> bool:
+    """
+    Thực hiện đồng bộ hóa theo cấu hình
 
+    trở lại:
+        True nếu tất cả các cặp thư mục được đồng bộ thành công
+    """
+    context_token = current_run_id.set(config.run_id)
+    try:
+        return _run_sync(config)
+    finally:
+        current_run_id.reset(context_token)
+
+
+def _run_sync(config: SyncConfig) -> bool:
     logger.info("Bắt đầu thực hiện các tác vụ đồng bộ hóa")
-    # Nhận cấu hình từ biến môi trường 0
-    base_url = os.environ.get("BASE_URL")
-    username = os.environ.get("USERNAME")
-    password = os.environ.get("PASSWORD")
-    token = os.environ.get("TOKEN")  # Thêm tokenBiến môi trường
 
-    # Có nên xóa các tệp dự phòng trong thư mục đích
-    if sync_del_action:
-        sync_delete_action = sync_del_action
-    else:
-        sync_delete_action = os.environ.get("SYNC_DELETE_ACTION", "none")
-    
     # xác minhsync_delete_actionGiá trị có hợp lệ không?
-    sync_delete_action = sync_delete_action.lower()
+    sync_delete_action = (config.sync_delete_action or "none").lower()
     if sync_delete_action not in ["none", "move", "delete"]:
         logger.warning(f"Phương thức xử lý sự khác biệt không hợp lệ: {sync_delete_action}，Giá trị mặc định sẽ được sử dụng: none")
         sync_delete_action = "none"
     else:
         logger.info(f"Phương thức xử lý thời hạn khác biệt: {sync_delete_action}")
 
-    # Có nên xóa thư mục nguồn không
-    if move_file:
-        move_file_action = move_file
-    else:
-        move_file_action = os.environ.get("MOVE_FILE", "false").lower() == "true"
-
     # Xóa thư mục nguồn và xóa thư mục mục tiêu dự phòng không thể có hiệu lực cùng một lúc
+    move_file_action = bool(config.move_file)
     if move_file_action and sync_delete_action != "none":
         logger.warning("Không thể bật tệp nguồn và xử lý các khác biệt thư mục mục tiêu mục tiêu cùng một lúc，Vô hiệu hóa thư mục mục tiêu Xử lý mục khác nhau")
         sync_delete_action = "none"
 
-    # Loại trừ thư mục
-    if exclude_dirs:
-        exclude_list = exclude_dirs.split(",")
-    else:
-        exclude_dirs = os.environ.get("EXCLUDE_DIRS", "")
-        exclude_list = exclude_dirs.split(",")
-
-    # biểu thức chính quy
-    if not regex_patterns:
-        regex_patterns = os.environ.get("REGEX_PATTERNS", None)
-        # regex_patterns_list = regex_patterns.split(" ")
-    # else:
-    #     regex_patterns = os.environ.get("REGEX_PATTERNS", None)
-    #     regex_patterns_list = regex_patterns.split(" ")
-
     # Khởi tạo một danh sách trống，Được sử dụng để lưu trữ các đối tượng biểu thức chính quy được biên dịch
     regex_and_replace_list: List[Pattern[str]] = []
-    # if regex_patterns_list:
-    #     for pattern_replacement in regex_patterns_list:
-    #         try:
-    #             compiled_pattern = re.compile(pattern_replacement)
-    #             regex_and_replace_list.append(compiled_pattern)
-    #         except re.error as e:
-    #             print(f"biểu thức chính quy {pattern_replacement} không biên dịch được：{e}")
     regex_pattern = None
     try:
-        if regex_patterns:
-            regex_pattern = re.compile(regex_patterns)
-        # regex_and_replace_list.append(compiled_pattern)
+        if config.regex_patterns:
+            regex_pattern = re.compile(config.regex_patterns)
     except re.error as e:
-        print(f"biểu thức chính quy {regex_patterns} không biên dịch được：{e}")
+        logger.error(f"biểu thức chính quy {config.regex_patterns} không biên dịch được：{e}")
 
-    # Giải quyết giới hạn kích thước tệp
-    if size_min is None:
-        size_min_env = os.environ.get("SIZE_MIN")
-        size_min = int(size_min_env) if size_min_env and size_min_env.isdigit() else None
-    if size_max is None:
-        size_max_env = os.environ.get("SIZE_MAX")
-        size_max = int(size_max_env) if size_max_env and size_max_env.isdigit() else None
+    queue_low_water = config.queue_low_water
+    if queue_low_water is None:
+        queue_low_water = min(DEFAULT_QUEUE_LOW_WATER, config.queue_high_water // 2)
 
-    if not base_url:
+    if not config.base_url:
         logger.error("Địa chỉ dịch vụ(BASE_URL)Biến môi trường không được đặt")
-        return
+        return False
 
     # Sửa đổi logic xác minh
-    if not token and not (username and password):
+    if not config.token and not (config.username and config.password):
         logger.error("Cần đặt mã thông báo(TOKEN)Hoặc đặt tên người dùng cùng một lúc(USERNAME)và mật khẩu(PASSWORD)")
-        return
+        return False
 
     logger.info(
-        f"Thông tin cấu hình - URL: {base_url}, Tên người dùng: {username}, Chính sách xử lý khác biệt: {sync_delete_action}, Xóa thư mục nguồn: {move_file_action}")
-
-   # Thêm tham số mã thông báo khi tạo phiên bản AlistSync
-    alist_sync = AlistSync(base_url, username, password, token, sync_delete_action, exclude_list, move_file_action,
-                           regex_and_replace_list, regex_pattern, size_min=size_min, size_max=size_max)
+        f"Thông tin cấu hình - URL: {config.base_url}, Tên người dùng: {config.username}, Chính sách xử lý khác biệt: {sync_delete_action}, Xóa thư mục nguồn: {move_file_action}")
+
+    alist_sync = AlistSync(config.base_url, config.username, config.password, config.token, sync_delete_action,
+                           list(config.exclude_dirs or []), move_file_action, regex_and_replace_list, regex_pattern,
+                           size_min=config.size_min, size_max=config.size_max,
+                           batch_size=config.batch_size, walk_concurrency=config.walk_concurrency,
+                           queue_high_water=config.queue_high_water, queue_low_water=queue_low_water,
+                           manifest_dir=config.manifest_dir, manifest_key=config.manifest_key,
+                           manifest_max_age=config.manifest_max_age, use_search_index=config.use_search_index,
+                           search_max_staleness=config.search_max_staleness, list_page_size=config.list_page_size,
+                           cancel_token=config.cancel_token, stats=config.stats)
     # xác minh token Nó có đúng không
     if not alist_sync.login():
         logger.error("Mã thông báo không chính xác hoặc mật khẩu tên người dùng")
         return False
+    success = True
     try:
-        # Nhận cặp thư mục đồng bộ
-        dir_pairs_list = []
-        if dir_pairs:
-            dir_pairs_list.extend(dir_pairs.split(";"))
-        else:
-            dir_pairs_list = get_dir_pairs_from_env()
+        dir_pairs_list = [pair for pair in config.dir_pairs if pair]
 
         logger.info(f"")
         logger.info(f"")
@@ -767,6 +2051,10 @@ def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str =
         # Thực hiện đồng bộ hóa
         i = 1
         for pair in dir_pairs_list:
+            if alist_sync.cancel_token.cancelled:
+                logger.warning("Nhiệm vụ đồng bộ đã bị hủy，Bỏ qua các cặp thư mục còn lại")
+                success = False
+                break
             src_dir, dst_dir = pair.split(":")
             logger.info(f"")
             logger.info(f"")
@@ -777,14 +2065,75 @@ def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str =
             logger.info(f"")
             logger.info(f"")
             i += 1
-            alist_sync.sync_directories(src_dir.strip(), dst_dir.strip())
+            if not alist_sync.sync_directories(src_dir.strip(), dst_dir.strip()):
+                success = False
 
-        logger.info("Tất cả các nhiệm vụ đồng bộ được hoàn thành")
+        if alist_sync.cancel_token.cancelled:
+            if alist_sync.cancel_token.cancel_copies:
+                alist_sync.cancel_submitted_copies()
+            logger.warning(f"Nhiệm vụ đồng bộ đã bị hủy，Thống kê: {alist_sync.stats}")
+        else:
+            logger.info("Tất cả các nhiệm vụ đồng bộ được hoàn thành")
     except Exception as e:
         logger.error(f"Xảy ra lỗi trong khi thực hiện một tác vụ đồng bộ: {str(e)}")
+        success = False
     finally:
         alist_sync.close()
         logger.info("Đóng kết nối，Nhiệm vụ kết thúc")
+    return success
+
+
+def main(dir_pairs: str = None, sync_del_action: str = None, exclude_dirs: str = None, move_file: bool = False,
+         regex_patterns: str = None, size_min: int = None, size_max: int = None, batch_size: int = None,
+         walk_concurrency: int = None, queue_high_water: int = None, queue_low_water: int = None,
+         manifest_dir: str = None, manifest_key: str = None, use_search_index: bool = None):
+    """
+    Chức năng chính，Để thực hiện dòng lệnh
+
+    Các tham số không được truyền sẽ được đọc từ biến môi trường（xem SyncConfig.from_env）
+
+    tham số:
+        dir_pairs: Cặp thư mục, định dạng là "thư mục nguồn: thư mục đích", nhiều cặp thư mục được phân tách bằng dấu chấm phẩy
+        sync_del_action: Cách xử lý các mục khác biệt trong thư mục đích
+            - "none": Không xử lý sự khác biệt của thư mục đích（mặc định）
+            - "move": Di chuyển đến thư mục trash của đích
+            - "delete": Xóa các mục khác biệt trong thư mục đích
+        exclude_dirs: Thư mục loại trừ，Nhiều thư mục được phân tách bằng dấu phẩy
+        move_file: Có nên di chuyển tệp nguồn không，Mặc định làFalse
+        regex_patterns: Mẫu biểu thức chính quy
+        size_min: Chỉ chuyển các tệp lớn hơn kích thước được chỉ định（Byte，mặc định tắt）
+        size_max: Chỉ chuyển các tệp nhỏ hơn kích thước được chỉ định（Byte，mặc định tắt）
+        batch_size: Số tên tối đa trong một yêu cầu copy/move/remove（mặc định 100）
+        walk_concurrency: Số luồng liệt kê thư mục song song（mặc định 4）
+        queue_high_water: Ngưỡng tạm dừng gửi theo số tác vụ sao chép chưa hoàn thành（mặc định 1000，0 = tắt）
+        queue_low_water: Ngưỡng tiếp tục gửi（mặc định 500）
+        manifest_dir: Thư mục lưu manifest đồng bộ tăng dần（mặc định tắt）
+        manifest_key: Tiền tố tên tệp manifest，thường là ID nhiệm vụ
+        use_search_index: Liệt kê thư mục nguồn bằng chỉ mục tìm kiếm của AList（mặc định tắt）
+    """
+    code_souce()
+    xiaojin()
+
+    # Nhận cấu hình từ biến môi trường，các tham số được truyền vào có ưu tiên cao hơn
+    config = SyncConfig.from_env()
+    if dir_pairs:
+        config.dir_pairs = dir_pairs.split(";")
+    if sync_del_action:
+        config.sync_delete_action = sync_del_action
+    if exclude_dirs:
+        config.exclude_dirs = exclude_dirs.split(",")
+    if move_file:
+        config.move_file = move_file
+    if regex_patterns:
+        config.regex_patterns = regex_patterns
+    overrides = {"size_min": size_min, "size_max": size_max, "batch_size": batch_size,
+                 "walk_concurrency": walk_concurrency, "queue_high_water": queue_high_water,
+                 "queue_low_water": queue_low_water, "manifest_dir": manifest_dir, "manifest_key": manifest_key,
+                 "use_search_index": use_search_index}
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(config, name, value)
+    return run_sync(config)
 
 
 def code_souce():
@@ -18,7 +18,8 @@ def init_app(app):
     
     # Khởi tạo Trình quản lý dữ liệu(Nếu không được khởi tạo)
     if 'DATA_MANAGER' not in app.config:
-        data_manager = DataManager()
+        from config import Config
+        data_manager = DataManager(backend=Config.DATA_BACKEND)
         app.config['DATA_MANAGER'] = data_manager
     else:
         data_manager = app.config['DATA_MANAGER']
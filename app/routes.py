@@ -1,5 +1,7 @@
-from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, session, flash
-from app.utils.sync_manager import SyncManager
+from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, session, flash, Response
+from app.utils.task_executor import TaskExecutor
+from app.utils.event_bus import event_bus
+from app.utils.task_log_reader import compile_pattern, grep_lines, iter_chunks, read_range, tail_lines
 from app.utils.version_checker import get_current_version, has_new_version
 import importlib.util
 import os
@@ -7,6 +9,7 @@ import sys
 import logging
 from datetime import datetime
 import json
+import re
 import time
 from werkzeug.utils import secure_filename
 from app.utils.data_manager import DataManager
@@ -248,8 +251,8 @@ def test_connection():
             data.get('token')
         )
         
-        # Thử đăng nhập để xác minh kết nối
-        login_success = alist.login()
+        # Thử đăng nhập để xác minh kết nối（bỏ qua bộ nhớ đệm token，luôn hỏi máy chủ）
+        login_success = alist.login(force=True)
         
         if login_success:
             # Nhận mã thông báo sau khi thử nghiệm thành công
@@ -428,16 +431,21 @@ def api_run_task(task_id):
             "details": {"task_id": task_id, "from": request.remote_addr}
         })
         
-        # Tạo trình quản lý đồng bộ hóa và chạy các tác vụ
-        sync_manager = SyncManager()
-        result = sync_manager.run_task(task_id)
+        # Đưa nhiệm vụ vào hàng đợi của trình quản lý đồng bộ duy nhất của ứng dụng
+        sync_manager = current_app.config.get('SYNC_MANAGER')
+        if not sync_manager:
+            return jsonify({
+                "status": "error",
+                "message": "Bộ lập lịch không được khởi tạo"
+            }), 503
+        result = sync_manager.enqueue_task(task_id, priority=TaskExecutor.PRIORITY_MANUAL, trigger="manual")
         
         # Ghi lại kết quả hoạt động nhiệm vụ
-        if result.get("status") == "success":
+        if result.get("status") == "queued":
             data_manager.add_log({
                 "level": "INFO",
-                "message": f"Nhiệm vụ bắt đầu thành công: {task.get('name', f'Nhiệm vụ {task_id}')}",
-                "details": {"task_id": task_id, "instance_id": result.get("instance_id")}
+                "message": f"Nhiệm vụ đã được đưa vào hàng đợi: {task.get('name', f'Nhiệm vụ {task_id}')}",
+                "details": {"task_id": task_id, "instance_id": result.get("task_instances_id")}
             })
         else:
             data_manager.add_log({
@@ -445,8 +453,15 @@ def api_run_task(task_id):
                 "message": f"Nhiệm vụ không bắt đầu: {task.get('name', f'Nhiệm vụ {task_id}')}",
                 "details": {"task_id": task_id, "error": result.get("message")}
             })
+            return jsonify(result), 409
         
-        return jsonify(result)
+        return jsonify({
+            "status": "success",
+            "message": result.get("message"),
+            "task_instances_id": result["task_instances_id"],
+            "instance_id": result["task_instances_id"],
+            "position": result.get("position")
+        }), 202
     except Exception as e:
         # Ghi lại ngoại lệ
         if 'data_manager' in locals() and 'task' in locals():
@@ -465,21 +480,57 @@ def api_run_task(task_id):
             "message": f"Nhiệm vụ không chạy: {str(e)}"
         }), 500
 
+@api_bp.route('/tasks/<int:task_id>/stop', methods=['POST'])
+def api_stop_task(task_id):
+    """Dừng nhiệm vụ đang chờ hoặc đang chạy"""
+    sync_manager = current_app.config.get('SYNC_MANAGER')
+    if not sync_manager:
+        return jsonify({"status": "error", "message": "Bộ lập lịch không được khởi tạo"}), 503
+    
+    # cancel_copies: Hủy luôn các tác vụ sao chép mà lần chạy đã gửi lên AList
+    data = request.get_json(silent=True) or {}
+    result = sync_manager.stop_task(task_id, cancel_copies=bool(data.get("cancel_copies", False)))
+    if result.get("status") != "success":
+        return jsonify(result), 409
+    
+    current_app.config['DATA_MANAGER'].add_log({
+        "level": "INFO",
+        "message": f"Dừng nhiệm vụ theo cách thủ công: {task_id}",
+        "details": {"task_id": task_id, "from": request.remote_addr, "cancel_copies": bool(data.get("cancel_copies", False))}
+    })
+    return jsonify(result)
+
 @api_bp.route('/task-instances', methods=['GET'])
 def api_task_instances():
-    """Nhận danh sách các phiên bản nhiệm vụ"""
+    """
+    Nhận danh sách các phiên bản nhiệm vụ（mới nhất trước）
+
+    Tham số truy vấn: task_id, status（nhiều trạng thái cách nhau bởi dấu phẩy）,
+    since/until（dấu thời gian start_time）, limit, cursor。
+    Nếu còn trang sau，con trỏ được trả về trong tiêu đề X-Next-Cursor
+    """
     data_manager = current_app.config['DATA_MANAGER']
-    task_id = request.args.get('task_id')
-    limit = request.args.get('limit', 50, type=int)
+    task_id = request.args.get('task_id', type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    since = request.args.get('since', type=int)
+    until = request.args.get('until', type=int)
+    statuses = [status.strip() for status in request.args.get('status', '').split(',') if status.strip()]
     
-    if task_id:
-        # Nhận một thể hiện của tác vụ được chỉ định
-        instances = data_manager.get_task_instances(int(task_id), limit)
-    else:
-        # Nhận các trường hợp của tất cả các nhiệm vụ
-        instances = data_manager.get_task_instances(None, limit)
+    cursor = None
+    if request.args.get('cursor'):
+        try:
+            start_time, instance_id = request.args['cursor'].split('-', 1)
+            cursor = (int(start_time), int(instance_id))
+        except ValueError:
+            return jsonify({"status": "error", "message": "Con trỏ phân trang không hợp lệ"}), 400
     
-    return jsonify(instances)
+    instances, next_cursor = data_manager.query_task_instances(
+        task_id=task_id, statuses=statuses, since=since, until=until, cursor=cursor, limit=limit)
+    
+    response = jsonify(instances)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = f"{next_cursor[0]}-{next_cursor[1]}"
+    return response
 
 @api_bp.route('/task-instances/<int:instance_id>', methods=['GET'])
 def api_task_instance(instance_id):
@@ -492,9 +543,45 @@ def api_task_instance(instance_id):
     
     return jsonify(instance)
 
+@api_bp.route('/task-instances/<int:instance_id>/progress', methods=['GET'])
+def api_task_instance_progress(instance_id):
+    """
+    Nhận chỉ số tiến độ của phiên bản tác vụ
+
+    Phiên bản đang chạy trả về chỉ số trực tiếp và thời gian còn lại ước tính（eta，giây）；
+    phiên bản đã kết thúc trả về chỉ số cuối cùng được lưu trong kết quả
+    """
+    data_manager = current_app.config['DATA_MANAGER']
+    instance = data_manager.get_task_instance(instance_id)
+
+    if not instance:
+        return jsonify({"status": "error", "message": "Phiên bản nhiệm vụ không tồn tại"}), 404
+
+    sync_manager = current_app.config.get('SYNC_MANAGER')
+    progress = sync_manager.get_progress(instance_id) if sync_manager else None
+    running = progress is not None
+    if progress is None:
+        progress = (instance.get('result') or {}).get('details')
+
+    return jsonify({
+        "status": "success",
+        "instance_id": instance_id,
+        "task_id": instance.get('task_id'),
+        "instance_status": instance.get('status'),
+        "running": running,
+        "progress": progress
+    })
+
 @api_bp.route('/task-instances/<int:instance_id>/logs', methods=['GET'])
 def api_task_instance_logs(instance_id):
-    """Nhận nhật ký của phiên bản tác vụ"""
+    """
+    Nhận nhật ký của phiên bản tác vụ theo từng trang
+
+    Chế độ（theo tham số truy vấn）:
+        grep=<mẫu>[&regex=1][&offset=][&limit=]: Các dòng khớp，tiếp tục từ next_offset
+        offset=<byte>[&length=]: Các dòng hoàn chỉnh trong khoảng byte，tiếp tục từ next_offset
+        tail=<số dòng>[&before=<byte>]: Các dòng cuối（mặc định 1000），trang cũ hơn dùng before=start
+    """
     data_manager = current_app.config['DATA_MANAGER']
     instance = data_manager.get_task_instance(instance_id)
     
@@ -502,14 +589,104 @@ def api_task_instance_logs(instance_id):
         return jsonify({"status": "error", "message": "Phiên bản nhiệm vụ không tồn tại"}), 404
     
     task_id = instance.get('task_id')
-    logs = data_manager.get_task_log(task_id, instance_id)
+    result = {"lines": [], "size": 0}
+    log_file = data_manager.get_task_log_path(task_id, instance_id)
+    if log_file:
+        if request.args.get('grep'):
+            try:
+                pattern = compile_pattern(request.args['grep'], regex=request.args.get('regex') in ('1', 'true'))
+            except re.error as e:
+                return jsonify({"status": "error", "message": f"Biểu thức tìm kiếm không hợp lệ: {str(e)}"}), 400
+            limit = min(max(request.args.get('limit', 1000, type=int), 1), 5000)
+            result = grep_lines(log_file, pattern, request.args.get('offset', 0, type=int), limit)
+        elif 'offset' in request.args:
+            length = min(max(request.args.get('length', 256 * 1024, type=int), 1), 4 * 1024 * 1024)
+            result = read_range(log_file, request.args.get('offset', 0, type=int), length)
+        else:
+            tail = min(max(request.args.get('tail', 1000, type=int), 1), 5000)
+            result = tail_lines(log_file, tail, request.args.get('before', type=int))
     
-    return jsonify({
+    response = {
         "status": "success",
         "instance_id": instance_id,
         "task_id": task_id,
-        "logs": logs
-    })
+        "logs": result.pop("lines")
+    }
+    response.update(result)
+    return jsonify(response)
+
+@api_bp.route('/task-instances/<int:instance_id>/logs/raw', methods=['GET'])
+def api_task_instance_logs_raw(instance_id):
+    """Phát trực tiếp toàn bộ nhật ký của phiên bản tác vụ dạng văn bản（tùy chọn chỉ các dòng khớp grep）"""
+    data_manager = current_app.config['DATA_MANAGER']
+    instance = data_manager.get_task_instance(instance_id)
+    
+    if not instance:
+        return jsonify({"status": "error", "message": "Phiên bản nhiệm vụ không tồn tại"}), 404
+    
+    log_file = data_manager.get_task_log_path(instance.get('task_id'), instance_id)
+    if not log_file:
+        return jsonify({"status": "error", "message": "Không tìm thấy ghi nhật ký"}), 404
+    
+    pattern = None
+    if request.args.get('grep'):
+        try:
+            pattern = compile_pattern(request.args['grep'], regex=request.args.get('regex') in ('1', 'true'))
+        except re.error as e:
+            return jsonify({"status": "error", "message": f"Biểu thức tìm kiếm không hợp lệ: {str(e)}"}), 400
+    
+    response = Response(iter_chunks(log_file, pattern), mimetype='text/plain')
+    if request.args.get('download') in ('1', 'true'):
+        response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(log_file)}"'
+    return response
+
+@api_bp.route('/events', methods=['GET'])
+def api_events():
+    """
+    Server-Sent Events：trạng thái phiên bản、chỉ số tiến độ、dòng nhật ký tác vụ mới ...
+
+    Tham số truy vấn: types（instance,log,progress,task,system_log，cách nhau bởi dấu phẩy）,
+    task_id, instance_id。Khi kết nối lại trình duyệt gửi Last-Event-ID để tiếp tục；nếu không
+    thể tiếp tục（máy chủ khởi động lại hoặc bỏ lỡ quá nhiều sự kiện）sẽ nhận sự kiện "reset"
+    và cần tải lại toàn bộ dữ liệu
+    """
+    types = {event_type.strip() for event_type in request.args.get('types', '').split(',') if event_type.strip()}
+    task_id = request.args.get('task_id', type=int)
+    instance_id = request.args.get('instance_id', type=int)
+    after, reset = event_bus.parse_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    
+    def matches(event_type, data):
+        if types and event_type not in types:
+            return False
+        if task_id and data.get("id" if event_type == "task" else "task_id") != task_id:
+            return False
+        if instance_id and data.get("instance_id", data.get("task_instances_id")) != instance_id:
+            return False
+        return True
+    
+    def stream(after, reset):
+        yield "retry: 3000\n\n"
+        while True:
+            if reset:
+                yield f"id: {event_bus.format_id(after)}\nevent: reset\ndata: {{}}\n\n"
+                reset = False
+            events, missed = event_bus.wait(after, timeout=15)
+            if missed:
+                # Các sự kiện sau Last-Event-ID đã bị đẩy khỏi bộ đệm
+                yield f"id: {event_bus.format_id(after)}\nevent: reset\ndata: {{}}\n\n"
+            if not events:
+                # Giữ kết nối qua proxy
+                yield ": keepalive\n\n"
+                continue
+            for seq, event_type, data in events:
+                after = seq
+                if matches(event_type, data):
+                    yield f"id: {event_bus.format_id(seq)}\nevent: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    response = Response(stream(after, reset), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @api_bp.route('/settings', methods=['GET', 'PUT'])
 def api_settings():
@@ -519,6 +696,9 @@ def api_settings():
     if request.method == 'PUT':
         settings_data = request.json
         data_manager.update_settings(settings_data)
+        sync_manager = current_app.config.get('SYNC_MANAGER')
+        if sync_manager and isinstance(settings_data, dict) and 'max_concurrent_tasks' in settings_data:
+            sync_manager.update_max_concurrent_tasks(settings_data['max_concurrent_tasks'])
         return jsonify({"status": "success", "message": "Cài đặt được cập nhật"})
     
     return jsonify(data_manager.get_settings())
@@ -777,142 +957,28 @@ def get_all_storages():
 
 @api_bp.route('/dashboard/stats', methods=['GET'])
 def dashboard_stats():
-    """Nhận thống kê bảng điều khiển"""
+    """
+    Nhận thống kê bảng điều khiển
+
+    Thống kê được lưu trong bộ nhớ và cập nhật dần khi dữ liệu thay đổi；yêu cầu có
+    If-None-Match trùng ETag hiện tại nhận 304 mà không tạo lại nội dung
+    """
     try:
         data_manager = current_app.config['DATA_MANAGER']
+        etag, data = data_manager.dashboard_stats.snapshot()
         
-        # Nhận số lượng kết nối
-        connections = data_manager.get_connections()
-        connection_count = len(connections)
-        
-        # Nhận số và trạng thái của các tác vụ
-        tasks = data_manager.get_tasks()
-        task_count = len(tasks)
-        
-        # Đếm số lượng nhiệm vụ ở các tiểu bang khác nhau
-        completed_task_count = sum(1 for task in tasks if task.get('status') == 'completed')
-        running_task_count = sum(1 for task in tasks if task.get('status') == 'running')
-        failed_task_count = sum(1 for task in tasks if task.get('status') == 'failed')
-        pending_task_count = task_count - completed_task_count - running_task_count - failed_task_count
-        
-        # Nhận số lượng các tác vụ hoạt động
-        active_task_count = running_task_count
-        
-        # Nhận số lượng các tệp được đồng bộ hóa（Thống kê từ phiên bản tác vụ）
-        synced_files_count = 0
-        task_instances = data_manager.get_task_instances(None, 100)
-        for instance in task_instances:
-            if instance.get('status') == 'completed':
-                result = instance.get('result', {})
-                if result.get('details') and 'total' in result.get('details', {}):
-                    synced_files_count += result.get('details', {}).get('total', 0)
-        
-        # Phân phối loại kết nối thống kê
-        connection_types = []
-        connection_type_counts = []
-        connection_type_map = {}
-        
-        for conn in connections:
-            server_url = conn.get('server', '')
-            if '/dav/aliyundrive' in server_url or 'alipan' in server_url:
-                conn_type = 'Alibaba Cloud Drive'
-            elif '/dav/baidu' in server_url or 'pan.baidu' in server_url:
-                conn_type = 'Baidu Netdisk'
-            elif '/dav/quark' in server_url or 'quark' in server_url:
-                conn_type = 'Quark Netdisk'
-            elif '/dav/189cloud' in server_url or '189' in server_url:
-                conn_type = 'Đĩa đám mây Tianyi'
-            elif '/dav/onedrive' in server_url or 'onedrive' in server_url:
-                conn_type = 'OneDrive'
-            else:
-                conn_type = 'khác'
-            
-            if conn_type in connection_type_map:
-                connection_type_map[conn_type] += 1
-            else:
-                connection_type_map[conn_type] = 1
-        
-        for conn_type, count in connection_type_map.items():
-            connection_types.append(conn_type)
-            connection_type_counts.append(count)
-        
-        # Thời gian thực hiện nhiệm vụ thống kê
-        task_duration_labels = ['Ít hơn 1phút', '1-5phút', '5-15phút', '15-30phút', '30phút以上']
-        task_duration_counts = [0, 0, 0, 0, 0]
-        
-        for instance in task_instances:
-            if instance.get('status') == 'completed' and instance.get('start_time') and instance.get('end_time'):
-                duration_seconds = instance.get('end_time') - instance.get('start_time')
-                if duration_seconds < 60:
-                    task_duration_counts[0] += 1
-                elif duration_seconds < 300:
-                    task_duration_counts[1] += 1
-                elif duration_seconds < 900:
-                    task_duration_counts[2] += 1
-                elif duration_seconds < 1800:
-                    task_duration_counts[3] += 1
-                else:
-                    task_duration_counts[4] += 1
-        
-        # Thống kê tỷ lệ thành công của từng nhiệm vụ
-        success_rate_labels = []
-        success_rate_values = []
-        
-        task_success_map = {}
-        task_total_map = {}
-        
-        for instance in task_instances:
-            task_id = instance.get('task_id')
-            task_name = instance.get('task_name')
-            
-            if task_id not in task_total_map:
-                task_total_map[task_id] = 0
-                task_success_map[task_id] = 0
-            
-            task_total_map[task_id] += 1
-            if instance.get('status') == 'completed':
-                task_success_map[task_id] += 1
-        
-        # Nhận danh sách nhiệm vụ và sắp xếp theo tỷ lệ thành công
-        task_success_rate = []
-        for task in tasks[:5]:  # Chỉ thực hiện 5 nhiệm vụ đầu tiên
-            task_id = task.get('id')
-            if task_id in task_total_map and task_total_map[task_id] > 0:
-                success_rate = round((task_success_map.get(task_id, 0) / task_total_map[task_id]) * 100)
-                task_success_rate.append({
-                    'name': task.get('name'),
-                    'rate': success_rate
-                })
-        
-        # Sắp xếp theo tỷ lệ thành công và chuẩn bị dữ liệu
-        task_success_rate.sort(key=lambda x: x['rate'], reverse=True)
-        for item in task_success_rate:
-            success_rate_labels.append(item['name'])
-            success_rate_values.append(item['rate'])
-        
-        # Nhận các nhiệm vụ mới nhất
-        recent_tasks = sorted(tasks, key=lambda x: x.get('last_run', ''), reverse=True)[:5]
-        
-        return jsonify({
-            "status": "success",
-            "data": {
-                "connection_count": connection_count,
-                "task_count": task_count,
-                "active_task_count": active_task_count,
-                "synced_files_count": synced_files_count,
-                "completed_task_count": completed_task_count,
-                "running_task_count": running_task_count,
-                "failed_task_count": failed_task_count,
-                "pending_task_count": pending_task_count,
-                "connection_types": connection_types,
-                "connection_type_counts": connection_type_counts,
-                "task_duration_labels": task_duration_labels,
-                "task_duration_counts": task_duration_counts,
-                "success_rate_labels": success_rate_labels,
-                "success_rate_values": success_rate_values,
-                "recent_tasks": recent_tasks
-            }
-        })
+        if etag and etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = jsonify({
+                "status": "success",
+                "data": data
+            })
+        if etag:
+            response.set_etag(etag)
+            # Trình duyệt luôn xác minh lại với máy chủ thay vì dùng bản lưu cũ
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -955,7 +1021,8 @@ def scheduler_status():
             "message": "Bộ lập lịch đang chạy",
             "running": scheduler.running,
             "job_count": len(jobs),
-            "jobs": job_info
+            "jobs": job_info,
+            "executor": sync_manager.executor.status()
         })
     except Exception as e:
         import traceback
@@ -1156,7 +1223,7 @@ def api_clear_logs():
         })
         
         # Xóa nhật ký
-        data_manager._write_json(data_manager.logs_file, [])
+        data_manager.clear_logs()
         
         return jsonify({
             "status": "success",
@@ -1253,31 +1320,18 @@ def api_repair_logs():
     try:
         data_manager = current_app.config['DATA_MANAGER']
         
-        # Đọc nhật ký cũ
-        try:
-            with open(data_manager.logs_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                old_logs = json.loads(content) if content else []
-                if not isinstance(old_logs, list):
-                    old_logs = []
-        except Exception:
-            old_logs = []
-        
-        # Tạo nhật ký kiểm tra
-        timestamp = int(time.time())
-        test_log = {
+        # Bỏ các dòng nhật ký hỏng
+        dropped = data_manager.repair_logs()
+        
+        # Ghi nhật ký kiểm tra
+        data_manager.add_log({
             "level": "INFO",
             "message": "Hệ thống nhật ký đã được sửa",
-            "timestamp": timestamp,
-            "timestamp_formatted": data_manager.format_timestamp(timestamp),
-            "details": {"triggered_by": "repair_api"}
-        }
-        
-        # Viết lại tệp nhật ký
-        logs = old_logs + [test_log]
-        data_manager._write_json(data_manager.logs_file, logs)
+            "details": {"triggered_by": "repair_api", "dropped_lines": dropped}
+        })
         
         # Xác minh tệp nhật ký
+        new_logs = []
         try:
             new_logs = data_manager.get_logs()
             if len(new_logs) > 0:
@@ -1293,7 +1347,7 @@ def api_repair_logs():
         return jsonify({
             "status": "success" if success else "error",
             "message": message,
-            "logs_count": len(logs)
+            "logs_count": len(new_logs)
         })
     except Exception as e:
         import traceback
@@ -0,0 +1,238 @@
+import bisect
+import threading
+import time
+
+# Nhóm thời gian thực hiện nhiệm vụ（giới hạn trên của từng nhóm，giây）
+DURATION_LABELS = ['Ít hơn 1phút', '1-5phút', '5-15phút', '15-30phút', '30phút以上']
+DURATION_LIMITS = [60, 300, 900, 1800]
+
+# Loại kết nối theo các chuỗi con của địa chỉ máy chủ（theo thứ tự ưu tiên）
+CONNECTION_TYPES = [
+    (('/dav/aliyundrive', 'alipan'), 'Alibaba Cloud Drive'),
+    (('/dav/baidu', 'pan.baidu'), 'Baidu Netdisk'),
+    (('/dav/quark', 'quark'), 'Quark Netdisk'),
+    (('/dav/189cloud', '189'), 'Đĩa đám mây Tianyi'),
+    (('/dav/onedrive', 'onedrive'), 'OneDrive'),
+]
+
+
+def connection_type(server_url):
+    """Phân loại kết nối theo địa chỉ máy chủ"""
+    for patterns, name in CONNECTION_TYPES:
+        if any(pattern in server_url for pattern in patterns):
+            return name
+    return 'khác'
+
+
+class DashboardStats:
+    """
+    Thống kê bảng điều khiển được lưu trong bộ nhớ
+
+    Phần theo kết nối/nhiệm vụ chỉ được tính lại khi chúng thay đổi；phần theo phiên bản
+    （thời gian thực hiện、tỷ lệ thành công、số tệp đã đồng bộ）được cộng trừ dần trên cửa sổ
+    window phiên bản mới nhất mỗi khi một phiên bản thay đổi。Mỗi thay đổi tăng version，
+    nên ETag = mã khởi động + version cho phép trả về 304 mà không tính lại gì
+    """
+
+    def __init__(self, data_manager, window=100):
+        """
+        tham số:
+            data_manager: DataManager để đọc dữ liệu khi cần xây lại
+            window: Số phiên bản mới nhất được thống kê
+        """
+        self.data_manager = data_manager
+        self.window = window
+        self.boot_id = format(int(time.time() * 1000), "x")
+        self._lock = threading.Lock()
+        self.version = 0
+        # Phần theo kết nối/nhiệm vụ，None khi cần xây lại
+        self._config = None
+        self._config_gen = 0
+        # Cửa sổ phiên bản: id -> tóm tắt，các khóa (start_time, id) đã sắp xếp và tổng cộng dồn
+        self._instances = None
+        self._instances_gen = 0
+        # Kết quả đã tổng hợp: (etag, data)
+        self._snapshot = None
+
+    def _changed(self):
+        self.version += 1
+        self._snapshot = None
+
+    def invalidate(self):
+        """Kết nối hoặc nhiệm vụ đã thay đổi"""
+        with self._lock:
+            self._config = None
+            self._config_gen += 1
+            self._changed()
+
+    def reset_instances(self):
+        """Các phiên bản bị xóa hàng loạt（dọn dẹp），xây lại cửa sổ ở lần đọc sau"""
+        with self._lock:
+            self._instances = None
+            self._instances_gen += 1
+            self._changed()
+
+    def instance_changed(self, instance):
+        """Một phiên bản được thêm hoặc cập nhật：cộng trừ phần đóng góp của nó，O(log window)"""
+        with self._lock:
+            if self._instances is None:
+                # Cửa sổ đang được xây lại có thể chưa thấy thay đổi này
+                self._instances_gen += 1
+            else:
+                self._upsert(self._instances, instance)
+            self._changed()
+
+    @staticmethod
+    def _summary(instance):
+        """Phần đóng góp của một phiên bản vào các tổng"""
+        completed = instance.get('status') == 'completed'
+        bucket = None
+        synced = 0
+        if completed and instance.get('start_time') and instance.get('end_time'):
+            bucket = bisect.bisect_right(DURATION_LIMITS, instance['end_time'] - instance['start_time'])
+        if completed:
+            details = (instance.get('result') or {}).get('details')
+            if isinstance(details, dict):
+                synced = details.get('total', 0) or 0
+        return {
+            "key": (instance.get('start_time') or 0, instance.get('task_instances_id') or 0),
+            "task_id": instance.get('task_id'),
+            "completed": completed,
+            "bucket": bucket,
+            "synced": synced,
+        }
+
+    @staticmethod
+    def _empty_instances():
+        return {"by_id": {}, "keys": [], "synced": 0, "durations": [0] * len(DURATION_LABELS),
+                "totals": {}, "successes": {}}
+
+    @staticmethod
+    def _apply(state, summary, sign):
+        task_id = summary["task_id"]
+        state["totals"][task_id] = state["totals"].get(task_id, 0) + sign
+        if not state["totals"][task_id]:
+            del state["totals"][task_id]
+        if summary["completed"]:
+            state["successes"][task_id] = state["successes"].get(task_id, 0) + sign
+            if not state["successes"][task_id]:
+                del state["successes"][task_id]
+            state["synced"] += sign * summary["synced"]
+        if summary["bucket"] is not None:
+            state["durations"][summary["bucket"]] += sign
+
+    def _upsert(self, state, instance):
+        instance_id = instance.get('task_instances_id')
+        if instance_id is None:
+            return
+        summary = self._summary(instance)
+        old = state["by_id"].pop(instance_id, None)
+        if old is not None:
+            self._apply(state, old, -1)
+            position = bisect.bisect_left(state["keys"], old["key"])
+            del state["keys"][position]
+        elif len(state["keys"]) >= self.window and summary["key"] < state["keys"][0]:
+            # Cũ hơn toàn bộ cửa sổ
+            return
+        state["by_id"][instance_id] = summary
+        bisect.insort(state["keys"], summary["key"])
+        self._apply(state, summary, 1)
+        if len(state["keys"]) > self.window:
+            _, oldest_id = state["keys"].pop(0)
+            self._apply(state, state["by_id"].pop(oldest_id), -1)
+
+    def _build_instances(self):
+        state = self._empty_instances()
+        for instance in self.data_manager.get_task_instances(None, self.window):
+            self._upsert(state, instance)
+        return state
+
+    def _build_config(self):
+        connections = self.data_manager.get_connections()
+        tasks = self.data_manager.get_tasks()
+        type_counts = {}
+        for conn in connections:
+            conn_type = connection_type(conn.get('server', ''))
+            type_counts[conn_type] = type_counts.get(conn_type, 0) + 1
+        status_counts = {}
+        for task in tasks:
+            status_counts[task.get('status')] = status_counts.get(task.get('status'), 0) + 1
+        return {
+            "connection_count": len(connections),
+            "connection_types": list(type_counts),
+            "connection_type_counts": list(type_counts.values()),
+            "task_count": len(tasks),
+            "completed_task_count": status_counts.get('completed', 0),
+            "running_task_count": status_counts.get('running', 0),
+            "failed_task_count": status_counts.get('failed', 0),
+            # Tỷ lệ thành công chỉ tính cho 5 nhiệm vụ đầu tiên
+            "rate_tasks": [(task.get('id'), task.get('name')) for task in tasks[:5]],
+            "recent_tasks": sorted(tasks, key=lambda x: x.get('last_run', ''), reverse=True)[:5],
+        }
+
+    @staticmethod
+    def _compose(config, state):
+        task_success_rate = []
+        for task_id, name in config["rate_tasks"]:
+            total = state["totals"].get(task_id, 0)
+            if total > 0:
+                task_success_rate.append({
+                    'name': name,
+                    'rate': round((state["successes"].get(task_id, 0) / total) * 100)
+                })
+        task_success_rate.sort(key=lambda x: x['rate'], reverse=True)
+        running = config["running_task_count"]
+        return {
+            "connection_count": config["connection_count"],
+            "task_count": config["task_count"],
+            "active_task_count": running,
+            "synced_files_count": state["synced"],
+            "completed_task_count": config["completed_task_count"],
+            "running_task_count": running,
+            "failed_task_count": config["failed_task_count"],
+            "pending_task_count": (config["task_count"] - config["completed_task_count"] - running
+                                   - config["failed_task_count"]),
+            "connection_types": config["connection_types"],
+            "connection_type_counts": config["connection_type_counts"],
+            "task_duration_labels": DURATION_LABELS,
+            "task_duration_counts": list(state["durations"]),
+            "success_rate_labels": [item['name'] for item in task_success_rate],
+            "success_rate_values": [item['rate'] for item in task_success_rate],
+            "recent_tasks": config["recent_tasks"],
+        }
+
+    def snapshot(self):
+        """
+        Thống kê hiện tại
+
+        Dữ liệu được đọc lại ngoài khóa（DataManager có thể đang giữ khóa tệp và gọi
+        instance_changed）；phần xây lại chỉ được giữ nếu không có thay đổi nào xảy ra trong lúc đọc
+
+        trở lại:
+            (etag, data)；etag là None nếu dữ liệu thay đổi trong lúc tính
+        """
+        with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            config, config_gen = self._config, self._config_gen
+            instances, instances_gen = self._instances, self._instances_gen
+        if config is None:
+            config = self._build_config()
+        if instances is None:
+            instances = self._build_instances()
+        with self._lock:
+            stale = False
+            if self._config is None:
+                if config_gen == self._config_gen:
+                    self._config = config
+                else:
+                    stale = True
+            if self._instances is None:
+                if instances_gen == self._instances_gen:
+                    self._instances = instances
+                else:
+                    stale = True
+            if stale:
+                return None, self._compose(config, instances)
+            self._snapshot = (f"{self.boot_id}-{self.version}", self._compose(self._config, self._instances))
+            return self._snapshot
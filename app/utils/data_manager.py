@@ -4,15 +4,34 @@ import time
 import datetime
 from datetime import datetime as dt, timedelta
 import glob
+import copy
+import pickle
+import threading
 import logging
 from pathlib import Path
 from flask import current_app
+from app.utils.log_store import LogStore
+from app.utils.file_lock import ReadWriteLock
+from app.utils.instance_index import InstanceIndex
+from app.utils.task_log_reader import tail_lines
+from app.utils.event_bus import event_bus
+from app.utils.dashboard_stats import DashboardStats
 
 class DataManager:
     """Trình quản lý dữ liệu，Chịu trách nhiệm xử lýJSONĐọc và ghi tệp"""
     
-    def __init__(self, data_dir=None):
-        """Khởi tạo Trình quản lý dữ liệu"""
+    # Khóa đọc/ghi theo tệp，dùng chung cho mọi phiên bản DataManager trong tiến trình
+    _file_locks = {}
+    _file_locks_guard = threading.Lock()
+    
+    def __init__(self, data_dir=None, backend=None):
+        """
+        Khởi tạo Trình quản lý dữ liệu
+
+        tham số:
+            data_dir: Thư mục dữ liệu
+            backend: "json"（mặc định）hoặc "sqlite"，mặc định lấy từ biến môi trường DATA_BACKEND
+        """
         # Nhận thư mục gốc dự án
         project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         
@@ -33,8 +52,19 @@ class DataManager:
         self.connections_file = os.path.join(self.config_dir, "connections.json")
         self.tasks_file = os.path.join(self.config_dir, "tasks.json")
         self.settings_file = os.path.join(self.config_dir, "settings.json")
+        # Tệp nhật ký cũ，chỉ dùng để di chuyển sang kho JSONL（hoặc SQLite）
         self.logs_file = os.path.join(self.log_dir, "logs.json")
         self.task_instances_file = os.path.join(self.config_dir, "task_instances.json")
+        # ID phiên bản lớn nhất đã cấp，giữ lại khi các phiên bản cũ bị dọn dẹp
+        self.task_instances_seq_file = os.path.join(self.config_dir, "task_instances_seq.json")
+        
+        # Bộ nhớ đệm các tệp JSON đã phân tích: đường dẫn -> {"key": (mtime_ns, size), "blob": ..., "index": ...}
+        self._json_cache = {}
+        self._json_cache_lock = threading.Lock()
+        # Chỉ mục phiên bản nhiệm vụ（chế độ JSON）
+        self._instance_index = None
+        # Thống kê bảng điều khiển，được cập nhật khi kết nối、nhiệm vụ hoặc phiên bản thay đổi
+        self.dashboard_stats = DashboardStats(self)
         
         # Đảm bảo thư mục nhật ký tác vụ tồn tại
         self.task_logs_dir = os.path.join(self.log_dir, "task_logs")
@@ -45,8 +75,68 @@ class DataManager:
         self._ensure_file_exists(self.connections_file, [])
         self._ensure_file_exists(self.tasks_file, [])
         self._ensure_file_exists(self.settings_file, self._get_default_settings())
-        self._ensure_file_exists(self.logs_file, [])
         self._ensure_file_exists(self.task_instances_file, [])
+        
+        # Kho SQLite cho người dùng、kết nối、nhiệm vụ、phiên bản và nhật ký（cài đặt vẫn ở JSON）
+        self.backend = (backend or os.environ.get("DATA_BACKEND") or "json").lower()
+        self.store = None
+        self._store_tables = {}
+        if self.backend == "sqlite":
+            from app.utils.sqlite_store import SqliteStore
+            self.store = SqliteStore(os.path.join(self.config_dir, "alist_sync.db"))
+            self._store_tables = {
+                self.users_file: "users",
+                self.connections_file: "connections",
+                self.tasks_file: "tasks",
+                self.task_instances_file: "task_instances",
+                self.logs_file: "logs",
+            }
+            self._migrate_to_store()
+        
+        # Nhật ký hệ thống ở chế độ JSON được ghi thêm vào các phân đoạn JSONL
+        self.log_store = None
+        if self.store is None:
+            self.log_store = LogStore(self.log_dir)
+            self._migrate_legacy_logs()
+    
+    def _migrate_legacy_logs(self):
+        """Chuyển nhật ký từ logs.json cũ sang kho JSONL một lần，tệp cũ được đổi tên thành .migrated"""
+        if not os.path.exists(self.logs_file):
+            return
+        try:
+            with open(self.logs_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            logs = json.loads(content) if content.strip() else []
+        except Exception as e:
+            logging.error(f"Không đọc được tệp nhật ký cũ ({self.logs_file}): {str(e)}")
+            logs = []
+        if isinstance(logs, list) and self.log_store.is_empty():
+            logs = [log for log in logs if isinstance(log, dict)]
+            for log in sorted(logs, key=lambda x: x.get("timestamp", 0)):
+                self.log_store.append(log)
+            logging.info(f"Đã chuyển {len(logs)} nhật ký sang kho JSONL: {self.log_dir}")
+        os.replace(self.logs_file, self.logs_file + ".migrated")
+    
+    def _migrate_to_store(self):
+        """Di chuyển một lần dữ liệu từ các tệp JSON hiện có vào SQLite"""
+        sources = {}
+        for file_path, table in self._store_tables.items():
+            if not os.path.exists(file_path):
+                sources[table] = []
+                continue
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                sources[table] = json.loads(content) if content.strip() else []
+            except Exception as e:
+                logging.error(f"Không đọc được tệp để di chuyển ({file_path}): {str(e)}")
+                sources[table] = []
+        if not sources.get("users"):
+            sources["users"] = self._get_default_users()
+        # Nhật ký đã nằm trong kho JSONL
+        sources["logs"] = sources.get("logs", []) + LogStore(self.log_dir).read_all()
+        if self.store.migrate(sources):
+            logging.info(f"Đã di chuyển dữ liệu JSON vào SQLite: {self.store.db_path}，Các tệp JSON cũ không còn được cập nhật")
     
     def _get_default_settings(self):
         """Nhận cài đặt mặc định"""
@@ -88,39 +178,103 @@ class DataManager:
             }
         ]
     
+    @staticmethod
+    def _file_key(file_path):
+        """Khóa phiên bản của tệp (mtime_ns, size)，None nếu không đọc được"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _cache_get(self, file_path):
+        """Mục bộ nhớ đệm của tệp nếu tệp chưa thay đổi kể từ lần đọc/ghi trước"""
+        key = self._file_key(file_path)
+        with self._json_cache_lock:
+            entry = self._json_cache.get(file_path)
+            if entry is not None and entry["key"] == key:
+                return entry
+        return None
+    
+    def _cache_put(self, file_path, data, key):
+        """Lưu bản sao dữ liệu của tệp vào bộ nhớ đệm（dạng pickle để mỗi lần đọc nhận một bản sao mới）"""
+        if key is None:
+            return
+        entry = {"key": key, "blob": pickle.dumps(data, pickle.HIGHEST_PROTOCOL), "index": {}}
+        with self._json_cache_lock:
+            self._json_cache[file_path] = entry
+    
+    def _cached_record(self, file_path, field, value):
+        """
+        Tìm một bản ghi theo trường trong tệp danh sách mà không sao chép cả danh sách
+
+        Chỉ mục {giá trị: bản ghi} được tạo một lần cho mỗi phiên bản của tệp
+        """
+        entry = self._cache_get(file_path)
+        if entry is None:
+            self._read_json(file_path)
+            entry = self._cache_get(file_path)
+        if entry is None:
+            records = self._read_json(file_path)
+            return next((record for record in records if record.get(field) == value), None)
+        with self._json_cache_lock:
+            index = entry["index"].get(field)
+            if index is None:
+                records = pickle.loads(entry["blob"])
+                index = {}
+                for record in records if isinstance(records, list) else []:
+                    index.setdefault(record.get(field), record)
+                entry["index"][field] = index
+            record = index.get(value)
+        return copy.deepcopy(record) if record is not None else None
+    
+    def _file_lock(self, file_path):
+        """Khóa đọc/ghi của tệp（khóa ghi còn giữ flock trên tệp .lock để loại trừ tiến trình khác）"""
+        file_path = os.path.abspath(file_path)
+        with self._file_locks_guard:
+            lock = self._file_locks.get(file_path)
+            if lock is None:
+                lock = self._file_locks[file_path] = ReadWriteLock(file_path + ".lock")
+            return lock
+    
+    def _default_json(self, file_path):
+        """Giá trị mặc định khi tệp trống hoặc không đọc được"""
+        if "users.json" in file_path:
+            return self._get_default_users()
+        elif "settings.json" in file_path:
+            return self._get_default_settings()
+        return []
+    
     def _read_json(self, file_path):
-        """Đọc JSON tài liệu"""
-        max_retries = 3
-        retry_delay = 1
-        for attempt in range(max_retries):
+        """
+        Đọc JSON tài liệu（trả về bản sao từ bộ nhớ đệm nếu tệp chưa thay đổi）
+
+        Tệp luôn được thay thế nguyên tử khi ghi nên không bao giờ đọc phải tệp ghi dở，
+        tệp trống hoặc hỏng trả về giá trị mặc định ngay thay vì thử lại
+        """
+        table = self._store_tables.get(file_path)
+        if table:
+            return self.store.all(table)
+        with self._file_lock(file_path).read():
+            entry = self._cache_get(file_path)
+            if entry is not None:
+                return pickle.loads(entry["blob"])
             try:
-                # Cố gắng đọc nội dung tệp
-                content = None
+                # Khóa được lấy trước khi đọc，nếu tệp thay đổi trong lúc đọc lần sau sẽ đọc lại
+                key = self._file_key(file_path)
                 with open(file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
-                    # Kiểm tra xem tệp có trống không
-                    if not content:
-                        raise ValueError("Nội dung tệp trống")
-                    # Cố gắng phân tíchJSON
-                    json_content = json.loads(content)
-                    if isinstance(json_content, list) and not json_content:
-                        raise ValueError("Nội dung tệp là một mảng trống")
-                    return json_content
+                # Kiểm tra xem tệp có trống không
+                if not content:
+                    raise ValueError("Nội dung tệp trống")
+                json_content = json.loads(content)
+                if isinstance(json_content, list) and not json_content:
+                    return self._default_json(file_path)
+                self._cache_put(file_path, json_content, key)
+                return json_content
             except Exception as e:
-                if attempt < max_retries - 1:
-                    current_app.logger.error(f"ĐọcJSONXảy ra lỗi trong khi tệp ({file_path}): {str(e)}，Hãy thử đầu tiên {attempt + 1} Hãy thử lại")
-                    time.sleep(retry_delay)
-                else:
-                    current_app.logger.error(f"ĐọcJSONXảy ra lỗi trong khi tệp ({file_path}): {str(e)}，Số lượng thử lại tối đa đạt được，Sẽ trả về giá trị mặc định")
-            # Quay trở lại giá trị mặc định
-            if "logs.json" in file_path:
-                return []
-            elif "users.json" in file_path:
-                return self._get_default_users()
-            elif "settings.json" in file_path:
-                return self._get_default_settings()
-            else:
-                return []
+                current_app.logger.error(f"ĐọcJSONXảy ra lỗi trong khi tệp ({file_path}): {str(e)}，Sẽ trả về giá trị mặc định")
+        return self._default_json(file_path)
     
     def _write_json(self, file_path, data):
         """Viết JSON tài liệu"""
@@ -128,31 +282,35 @@ class DataManager:
         if isinstance(data, list) and not data and not ("logs.json" in file_path or "task_instances.json" in file_path):
             current_app.logger.warning(f"Thử viết một mảng trống vào một tệp: {file_path}，Từ chối viết")
             return
+        table = self._store_tables.get(file_path)
+        if table:
+            self.store.replace_all(table, data if isinstance(data, list) else [])
+            self._dashboard_changed(file_path)
+            return
         try:
             # Đảm bảo thư mục tồn tại
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            if os.name == 'nt': 
-                # Ghi vào tệp tạm thời trước
-                temp_file = file_path + ".tmp"
+            with self._file_lock(file_path).write():
+                # Ghi vào tệp tạm thời trước，sau đó thay thế nguyên tử tệp đích
+                temp_file = f"{file_path}.{os.getpid()}.tmp"
                 with open(temp_file, 'w', encoding='utf-8') as f:
                     json.dump(data, ensure_ascii=False, indent=2, fp=f)
-                # Sau đó đổi tên nguyên tử thành tệp đích
-                if os.path.exists(file_path):
-                    # hiện hữuWindowsBạn cần xóa các tệp hiện có trước tiên
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        current_app.logger.error(f"Không xóa các tệp hiện có: {str(e)}")
-                os.rename(temp_file, file_path)
-            else:
-                # KHÔNGWindowsViết trực tiếp vào hệ thống
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, ensure_ascii=False, indent=2, fp=f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, file_path)
+                # Cập nhật bộ nhớ đệm bằng dữ liệu vừa ghi
+                self._cache_put(file_path, data, self._file_key(file_path))
+            self._dashboard_changed(file_path)
             # Viết hồ sơ đã thành công
             current_app.logger.info(f"Ghi thành công vào tệp: {file_path}")
         except Exception as e:
             current_app.logger.error(f"ViếtJSONXảy ra lỗi trong khi tệp ({file_path}): {str(e)}")
     
+    def _dashboard_changed(self, file_path):
+        """Đánh dấu thống kê bảng điều khiển cần tính lại sau khi ghi kết nối hoặc nhiệm vụ"""
+        if file_path in (self.connections_file, self.tasks_file):
+            self.dashboard_stats.invalidate()
+    
     def format_timestamp(self, timestamp):
         """Định dạng dấu thời gian là yyyy-MM-dd HH:mm:ss Định dạng"""
         if not timestamp:
@@ -166,11 +324,9 @@ class DataManager:
     
     def get_user(self, username):
         """Nhận người dùng thông qua tên người dùng"""
-        users = self.get_users()
-        for user in users:
-            if user["username"] == username:
-                return user
-        return None
+        if self.store is not None:
+            return self.store.find("users", "username", username)
+        return self._cached_record(self.users_file, "username", username)
     
     def authenticate_user(self, username, password):
         """Xác minh tên người dùng và mật khẩu"""
@@ -208,6 +364,12 @@ class DataManager:
     
     def update_last_login(self, username):
         """Cập nhật thời gian đăng nhập cuối cùng của người dùng"""
+        if self.store is not None:
+            user = self.get_user(username)
+            if not user:
+                return False
+            user["last_login"] = self.format_timestamp(int(time.time()))
+            return self.store.put("users", user)
         users = self.get_users()
         for i, user in enumerate(users):
             if user["username"] == username:
@@ -223,14 +385,19 @@ class DataManager:
     
     def get_connection(self, conn_id):
         """Nhận một kết nối duy nhất"""
-        connections = self.get_connections()
-        for conn in connections:
-            if conn["connection_id"] == conn_id:
-                return conn
-        return None
+        if self.store is not None:
+            return self.store.get("connections", conn_id)
+        return self._cached_record(self.connections_file, "connection_id", conn_id)
     
     def add_connection(self, connection_data):
         """Thêm một kết nối"""
+        if self.store is not None:
+            connection_data.pop("connection_id", None)
+            connection_data["created_at"] = self.format_timestamp(int(time.time()))
+            connection_data["updated_at"] = self.format_timestamp(int(time.time()))
+            connection_data["connection_id"] = self.store.insert("connections", connection_data)
+            self.dashboard_stats.invalidate()
+            return connection_data["connection_id"]
         connections = self.get_connections()
         # Tạo mớiID
         next_id = 1
@@ -247,6 +414,16 @@ class DataManager:
     
     def update_connection(self, conn_id, connection_data):
         """Cập nhật kết nối"""
+        if self.store is not None:
+            conn = self.get_connection(conn_id)
+            if not conn:
+                return False
+            connection_data["connection_id"] = conn_id
+            connection_data["created_at"] = conn.get("created_at")
+            connection_data["updated_at"] = self.format_timestamp(int(time.time()))
+            updated = self.store.put("connections", connection_data)
+            self.dashboard_stats.invalidate()
+            return updated
         connections = self.get_connections()
         for i, conn in enumerate(connections):
             if conn["connection_id"] == conn_id:
@@ -260,6 +437,10 @@ class DataManager:
     
     def delete_connection(self, conn_id):
         """Xóa kết nối"""
+        if self.store is not None:
+            self.store.delete("connections", conn_id)
+            self.dashboard_stats.invalidate()
+            return
         connections = self.get_connections()
         connections = [conn for conn in connections if conn["connection_id"] != conn_id]
         self._write_json(self.connections_file, connections)
@@ -271,14 +452,22 @@ class DataManager:
     
     def get_task(self, task_id):
         """Nhận nhiệm vụ duy nhất"""
-        tasks = self.get_tasks()
-        for task in tasks:
-            if task["id"] == task_id:
-                return task
-        return None
+        if self.store is not None:
+            return self.store.get("tasks", task_id)
+        return self._cached_record(self.tasks_file, "id", task_id)
     
     def add_task(self, task_data):
         """Thêm nhiệm vụ"""
+        if self.store is not None:
+            task_data.pop("id", None)
+            task_data["created_at"] = self.format_timestamp(int(time.time()))
+            task_data["updated_at"] = self.format_timestamp(int(time.time()))
+            task_data["status"] = "pending"
+            task_data["last_run"] = ""
+            task_data["next_run"] = ""
+            task_data["id"] = self.store.insert("tasks", task_data)
+            self.dashboard_stats.invalidate()
+            return task_data["id"]
         tasks = self.get_tasks()
         # Tạo mớiID
         next_id = 1
@@ -298,6 +487,19 @@ class DataManager:
     
     def update_task(self, task_id, task_data):
         """Cập nhật nhiệm vụ"""
+        if self.store is not None:
+            task = self.get_task(task_id)
+            if not task:
+                return False
+            task_data["id"] = task_id
+            task_data["created_at"] = task.get("created_at")
+            task_data["updated_at"] = self.format_timestamp(int(time.time()))
+            for field in ["status", "last_run", "next_run"]:
+                if field in task and field not in task_data:
+                    task_data[field] = task[field]
+            updated = self.store.put("tasks", task_data)
+            self.dashboard_stats.invalidate()
+            return updated
         tasks = self.get_tasks()
         for i, task in enumerate(tasks):
             if task["id"] == task_id:
@@ -316,26 +518,38 @@ class DataManager:
     
     def delete_task(self, task_id):
         """Xóa nhiệm vụ"""
+        if self.store is not None:
+            self.store.delete("tasks", task_id)
+            self.dashboard_stats.invalidate()
+            return
         tasks = self.get_tasks()
         tasks = [task for task in tasks if task["id"] != task_id]
         self._write_json(self.tasks_file, tasks)
     
     def update_task_status(self, task_id, status, last_run=None, next_run=None):
         """Cập nhật trạng thái tác vụ"""
-        tasks = self.get_tasks()
-        for i, task in enumerate(tasks):
-            if task["id"] == task_id:
-                task["status"] = status
-                if last_run:
-                    task["last_run"] = self.format_timestamp(last_run)
-                if next_run:
-                    # Nếu dấu thời gian số được cung cấp，Được định dạng dưới dạng chuỗi
-                    task["next_run"] = self.format_timestamp(next_run)
-                    current_app.logger.debug(f"Cập nhật nhiệm vụ {task_id} Thời gian chạy tiếp theo: {task['next_run']}")
-                tasks[i] = task
-                self._write_json(self.tasks_file, tasks)
-                return True
-        return False
+        # Đọc-sửa-ghi trong một giao dịch để không mất cập nhật của luồng khác
+        with self._file_lock(self.tasks_file).write():
+            tasks = [task for task in [self.get_task(task_id)] if task] if self.store is not None else self.get_tasks()
+            for i, task in enumerate(tasks):
+                if task["id"] == task_id:
+                    task["status"] = status
+                    if last_run:
+                        task["last_run"] = self.format_timestamp(last_run)
+                    if next_run:
+                        # Nếu dấu thời gian số được cung cấp，Được định dạng dưới dạng chuỗi
+                        task["next_run"] = self.format_timestamp(next_run)
+                        current_app.logger.debug(f"Cập nhật nhiệm vụ {task_id} Thời gian chạy tiếp theo: {task['next_run']}")
+                    if self.store is not None:
+                        updated = self.store.put("tasks", task)
+                        self.dashboard_stats.invalidate()
+                    else:
+                        tasks[i] = task
+                        self._write_json(self.tasks_file, tasks)
+                        updated = True
+                    event_bus.publish("task", {key: task.get(key) for key in ("id", "name", "status", "last_run", "next_run")})
+                    return updated
+            return False
     
     # Quản lý cài đặt
     def get_settings(self):
@@ -352,15 +566,10 @@ class DataManager:
     def get_logs(self, limit=100):
         """Nhận nhật ký mới nhất"""
         try:
-            logs = self._read_json(self.logs_file)
-            
-            # Hãy chắc chắnlogsĐó là một danh sách
-            if not isinstance(logs, list):
-                print(f"Nội dung tệp nhật ký không phải là một danh sách hợp lệ，Đặt lại vào danh sách trống")
-                logs = []
-                self._write_json(self.logs_file, logs)
-                
-            logs_sorted = sorted(logs, key=lambda x: x.get("timestamp", 0), reverse=True)[:limit]
+            if self.store is not None:
+                logs_sorted = self.store.recent_logs(limit)
+            else:
+                logs_sorted = self.log_store.recent(limit)
             
             # Định dạng dấu thời gian và thêm tên tác vụ bị thiếu
             for log in logs_sorted:
@@ -386,7 +595,6 @@ class DataManager:
     def add_log(self, log_data):
         """Thêm nhật ký"""
         try:
-            logs = self._read_json(self.logs_file)
             timestamp = int(time.time())
             log_data["timestamp"] = timestamp
             log_data["timestamp_formatted"] = self.format_timestamp(timestamp)
@@ -397,28 +605,13 @@ class DataManager:
                 if task:
                     log_data["task_name"] = task.get("name", "Nhiệm vụ không xác định")
             
-            # Hãy chắc chắnlogsĐó là một danh sách
-            if not isinstance(logs, list):
-                logs = []
-                
-            # Giới hạn số lượng nhật ký mới nhất 1000 dải
-            logs.append(log_data)
-            logs = sorted(logs, key=lambda x: x.get("timestamp", 0), reverse=True)[:1000]
-            
-            # In thông tin gỡ lỗi trước khi ghi vào nhật ký
-            print(f"Nhật ký viết，Số lượng nhật ký hiện tại: {len(logs)}")
-            try:
-                self._write_json(self.logs_file, logs)
-                print(f"Nhật ký viết thành công - {log_data.get('message', 'Không có tin tức')}")
-            except Exception as e:
-                print(f"Xảy ra lỗi khi viết vào nhật ký: {str(e)}")
-                # Cố gắng tạo lại tệp nhật ký
-                with open(self.logs_file, 'w', encoding='utf-8') as f:
-                    json.dump(logs, ensure_ascii=False, indent=2, fp=f)
+            if self.store is not None:
+                self.store.insert("logs", log_data)
+            else:
+                self.log_store.append(log_data)
+            event_bus.publish("system_log", log_data)
         except Exception as e:
             print(f"Không thể thêm nhật ký: {str(e)}")
-            # Đảm bảo tệp nhật ký tồn tại và hợp lệ
-            self._ensure_file_exists(self.logs_file, [])
     
     def clear_old_logs(self, days=None):
         """Làm sạch các bản ghi cũ"""
@@ -426,102 +619,181 @@ class DataManager:
             settings = self.get_settings()
             days = settings.get("keep_log_days", 7)
         
-        logs = self._read_json(self.logs_file)
         current_time = int(time.time())
         cutoff_time = current_time - (days * 86400)  # Có một ngày 86400 s
         
-        logs = [log for log in logs if log.get("timestamp", 0) > cutoff_time]
-        self._write_json(self.logs_file, logs)
+        if self.store is not None:
+            self.store.delete_logs_before(cutoff_time)
+        else:
+            self.log_store.delete_before(cutoff_time)
+    
+    def clear_logs(self):
+        """Xóa tất cả nhật ký hệ thống"""
+        if self.store is not None:
+            self.store.replace_all("logs", [])
+        else:
+            self.log_store.clear()
+    
+    def repair_logs(self):
+        """
+        Bỏ các dòng nhật ký hỏng
+
+        trở lại:
+            Số dòng đã bỏ（luôn là 0 với SQLite）
+        """
+        if self.store is not None:
+            return 0
+        return self.log_store.repair()
     
     # Quản lý phiên nhiệm vụ
+    def _get_instance_index(self):
+        """
+        Chỉ mục của task_instances.json，chỉ xây lại khi tệp bị thay đổi từ bên ngoài
+
+        Phải được gọi khi đang giữ khóa đọc hoặc ghi của tệp
+        """
+        key = self._file_key(self.task_instances_file)
+        index = self._instance_index
+        if index is None or index.key != key:
+            last_id = 0
+            if os.path.exists(self.task_instances_seq_file):
+                seq = self._read_json(self.task_instances_seq_file)
+                last_id = seq.get("last_id", 0) if isinstance(seq, dict) else 0
+            index = InstanceIndex(self._read_json(self.task_instances_file), key, last_id)
+            self._instance_index = index
+        return index
+    
+    def _commit_instance_index(self, index):
+        """Gắn chỉ mục với phiên bản tệp vừa ghi；nếu ghi thất bại thì bỏ chỉ mục để xây lại"""
+        key = self._file_key(self.task_instances_file)
+        if key == index.key:
+            self._instance_index = None
+        else:
+            index.key = key
+    
+    def query_task_instances(self, task_id=None, statuses=None, since=None, until=None, cursor=None, limit=50):
+        """
+        Truy vấn phiên bản nhiệm vụ mới nhất trước，có lọc và phân trang theo con trỏ
+
+        tham số:
+            task_id: Chỉ lấy phiên bản của nhiệm vụ này
+            statuses: Danh sách trạng thái cần lấy
+            since, until: Khoảng start_time（dấu thời gian，bao gồm hai đầu）
+            cursor: (start_time, task_instances_id) do trang trước trả về
+            limit: Số bản ghi tối đa
+
+        trở lại:
+            (danh sách phiên bản, con trỏ trang sau hoặc None)
+        """
+        statuses = set(statuses) if statuses else None
+        if self.store is not None:
+            return self.store.query_task_instances(task_id, sorted(statuses) if statuses else None,
+                                                   since, until, cursor, limit)
+        with self._file_lock(self.task_instances_file).read():
+            return self._get_instance_index().query(task_id, statuses, since, until, cursor, limit)
+    
     def get_task_instances(self, task_id=None, limit=50):
         """Nhận danh sách các phiên bản nhiệm vụ，Có thể được giao nhiệm vụIDlọc"""
-        instances = self._read_json(self.task_instances_file)
-        
-        # Sắp xếp theo dấu thời gian giảm dần
-        instances = sorted(instances, key=lambda x: x.get("start_time", 0), reverse=True)
-        
-        # Nếu nhiệm vụ được chỉ địnhID，Sau đó, chỉ có trường hợp của nhiệm vụ được trả về
-        if task_id:
-            instances = [inst for inst in instances if inst.get("task_id") == task_id]
-        
-        # 返回指定数量的实例
-        return instances[:limit]
+        return self.query_task_instances(task_id=task_id, limit=limit)[0]
     
     def get_task_instance(self, instance_id):
         """Nhận một phiên bản tác vụ duy nhất"""
-        instances = self._read_json(self.task_instances_file)
-        for instance in instances:
-            if instance.get("task_instances_id") == instance_id:
-                return instance
-        return None
+        if self.store is not None:
+            return self.store.get("task_instances", instance_id)
+        with self._file_lock(self.task_instances_file).read():
+            return self._get_instance_index().get(instance_id)
     
-    def add_task_instance(self, task_id, start_params=None):
-        """Thêm một bản ghi phiên bản nhiệm vụ mới"""
-        instances = self._read_json(self.task_instances_file)
+    def add_task_instance(self, task_id, start_params=None, status="running"):
+        """Thêm một bản ghi phiên bản nhiệm vụ mới（status="queued" khi nhiệm vụ mới được đưa vào hàng đợi）"""
         task = self.get_task(task_id)
         
         if not task:
             return None
         
-        # Tạo mớiID
-        next_id = 1
-        if instances:
-            next_id = max(instance.get("task_instances_id", 0) for instance in instances) + 1
-        
         # Nhận dấu thời gian hiện tại
         start_time = int(time.time())
         
         # Tạo bản ghi phiên bản tác vụ
         instance = {
-            "task_instances_id": next_id,
+            "task_instances_id": None,
             "task_id": task_id,
             "task_name": task.get("name", f"Nhiệm vụ {task_id}"),
             "start_time": start_time,
             "start_time_formatted": self.format_timestamp(start_time),
             "end_time": 0,
             "end_time_formatted": "",
-            "status": "running",
+            "status": status,
             "params": start_params or {},
             "result": {}
         }
         
-        instances.append(instance)
-        self._write_json(self.task_instances_file, instances)
+        if self.store is not None:
+            instance["task_instances_id"] = self.store.insert("task_instances", instance)
+        else:
+            # Cấp ID mới và ghi trong cùng một giao dịch để hai luồng không nhận trùng ID
+            with self._file_lock(self.task_instances_file).write():
+                index = self._get_instance_index()
+                instances = self._read_json(self.task_instances_file)
+                instance["task_instances_id"] = index.next_id()
+                instances.append(instance)
+                self._write_json(self.task_instances_file, instances)
+                index.put(copy.deepcopy(instance))
+                self._commit_instance_index(index)
         
         # Tạo tệp nhật ký tác vụ
         self._create_task_log_file(task_id, instance["task_instances_id"], f"Bắt đầu thực hiện các tác vụ: {instance['task_name']}")
+        self.dashboard_stats.instance_changed(instance)
+        event_bus.publish("instance", copy.deepcopy(instance))
         
         return instance
     
-    def update_task_instance(self, instance_id, status, result=None, end_time=None):
-        """Cập nhật trạng thái phiên bản tác vụ"""
-        instances = self._read_json(self.task_instances_file)
+    def update_task_instance(self, instance_id, status, result=None, end_time=None, start_time=None):
+        """Cập nhật trạng thái phiên bản tác vụ（start_time được đặt khi phiên bản rời hàng đợi）"""
+        # Đọc-sửa-ghi trong một giao dịch để không mất cập nhật của luồng khác
+        with self._file_lock(self.task_instances_file).write():
+            index = None
+            if self.store is not None:
+                instance = self.get_task_instance(instance_id)
+                instances = [instance] if instance else []
+            else:
+                index = self._get_instance_index()
+                instances = self._read_json(self.task_instances_file)
         
-        for i, instance in enumerate(instances):
-            if instance.get("task_instances_id") == instance_id:
-                instances[i]["status"] = status
+            for i, instance in enumerate(instances):
+                if instance.get("task_instances_id") == instance_id:
+                    instances[i]["status"] = status
                 
-                if result:
-                    instances[i]["result"] = result
+                    if start_time:
+                        instances[i]["start_time"] = start_time
+                        instances[i]["start_time_formatted"] = self.format_timestamp(start_time)
                 
-                if end_time or status in ["completed", "failed"]:
-                    end_time = end_time or int(time.time())
-                    instances[i]["end_time"] = end_time
-                    instances[i]["end_time_formatted"] = self.format_timestamp(end_time)
+                    if result:
+                        instances[i]["result"] = result
                 
-                self._write_json(self.task_instances_file, instances)
+                    if end_time or status in ["completed", "failed", "cancelled"]:
+                        end_time = end_time or int(time.time())
+                        instances[i]["end_time"] = end_time
+                        instances[i]["end_time_formatted"] = self.format_timestamp(end_time)
                 
-                # Cập nhật nhật ký tác vụ
-                self._append_task_log(
-                    instance.get("task_id"), 
-                    instance_id, 
-                    f"Trạng thái nhiệm vụ được cập nhật để: {status}" + (f", kết quả: {json.dumps(result, ensure_ascii=False)}" if result else "")
-                )
+                    if self.store is not None:
+                        self.store.put("task_instances", instances[i])
+                    else:
+                        self._write_json(self.task_instances_file, instances)
+                        index.put(instances[i])
+                        self._commit_instance_index(index)
+                    self.dashboard_stats.instance_changed(instances[i])
+                    event_bus.publish("instance", copy.deepcopy(instances[i]))
                 
-                return True
+                    # Cập nhật nhật ký tác vụ
+                    self._append_task_log(
+                        instance.get("task_id"), 
+                        instance_id, 
+                        f"Trạng thái nhiệm vụ được cập nhật để: {status}" + (f", kết quả: {json.dumps(result, ensure_ascii=False)}" if result else "")
+                    )
                 
-        return False
+                    return True
+                
+            return False
     
     def clear_old_task_instances(self, days=None):
         """Làm sạch hồ sơ phiên bản nhiệm vụ cũ"""
@@ -529,24 +801,41 @@ class DataManager:
             settings = self.get_settings()
             days = settings.get("keep_log_days", 7)
         
-        instances = self._read_json(self.task_instances_file)
         current_time = int(time.time())
         cutoff_time = current_time - (days * 86400)  # Có một ngày 86400 s
         
-        # Giữ các trường hợp nhiệm vụ mới hơn
-        new_instances = [inst for inst in instances if inst.get("start_time", 0) > cutoff_time]
+        if self.store is not None:
+            for task_id, instance_id in self.store.delete_task_instances_before(cutoff_time):
+                log_file = self._get_task_log_file_path(task_id, instance_id)
+                if os.path.exists(log_file):
+                    try:
+                        os.remove(log_file)
+                    except:
+                        pass
+            self.dashboard_stats.reset_instances()
+            return
+        with self._file_lock(self.task_instances_file).write():
+            instances = self._read_json(self.task_instances_file)
+            
+            # Lưu ID lớn nhất đã cấp để không dùng lại ID sau khi dọn dẹp
+            last_id = self._get_instance_index().last_id
+            self._write_json(self.task_instances_seq_file, {"last_id": last_id})
         
-        # Xóa tệp nhật ký tương ứng với thể hiện cũ
-        old_instances = [inst for inst in instances if inst.get("start_time", 0) <= cutoff_time]
-        for instance in old_instances:
-            log_file = self._get_task_log_file_path(instance.get("task_id"), instance.get("task_instances_id"))
-            if os.path.exists(log_file):
-                try:
-                    os.remove(log_file)
-                except:
-                    pass
+            # Giữ các trường hợp nhiệm vụ mới hơn
+            new_instances = [inst for inst in instances if inst.get("start_time", 0) > cutoff_time]
+        
+            # Xóa tệp nhật ký tương ứng với thể hiện cũ
+            old_instances = [inst for inst in instances if inst.get("start_time", 0) <= cutoff_time]
+            for instance in old_instances:
+                log_file = self._get_task_log_file_path(instance.get("task_id"), instance.get("task_instances_id"))
+                if os.path.exists(log_file):
+                    try:
+                        os.remove(log_file)
+                    except:
+                        pass
         
-        self._write_json(self.task_instances_file, new_instances)
+            self._write_json(self.task_instances_file, new_instances)
+        self.dashboard_stats.reset_instances()
     
     def clear_main_log_files(self, days=None):
         """Làm sạch tệp nhật ký chínhalist_sync.logSao lưu lịch sử
@@ -599,23 +888,28 @@ class DataManager:
         """Nối nội dung vào tệp nhật ký tác vụ"""
         log_file = self._get_task_log_file_path(task_id, instance_id)
         
-        with open(log_file, 'a', encoding='utf-8') as f:
-            timestamp = self.format_timestamp(int(time.time()))
-            f.write(f"[{timestamp}] {message}\n")
+        timestamp = self.format_timestamp(int(time.time()))
+        line = f"[{timestamp}] {message}"
+        data = (line + "\n").encode('utf-8')
+        with open(log_file, 'ab') as f:
+            f.write(data)
+            # Vị trí byte của dòng，người nghe dùng để bỏ các dòng đã đọc qua API
+            offset = f.tell() - len(data)
+        event_bus.publish("log", {"task_id": task_id, "instance_id": instance_id, "line": line, "offset": offset})
     
-    def get_task_log(self, task_id, instance_id):
-        """Nhận nội dung nhật ký tác vụ"""
+    def get_task_log_path(self, task_id, instance_id):
+        """Đường dẫn tệp nhật ký tác vụ，None nếu chưa có"""
         log_file = self._get_task_log_file_path(task_id, instance_id)
+        return log_file if os.path.exists(log_file) else None
+    
+    def get_task_log(self, task_id, instance_id, tail=1000):
+        """Nhận tail dòng cuối của nhật ký tác vụ（đọc ngược từ cuối tệp，không đọc cả tệp）"""
+        log_file = self.get_task_log_path(task_id, instance_id)
         
-        if not os.path.exists(log_file):
+        if not log_file:
             return []
         
-        with open(log_file, 'r', encoding='utf-8') as f:
-            log_content = f.read()
-            
-        # Chuyển đổi văn bản nhật ký thành danh sách
-        log_lines = log_content.split('\n')
-        return [line for line in log_lines if line.strip()]
+        return [line for line in tail_lines(log_file, tail)["lines"] if line.strip()]
     
     # Hàm nhập và xuất
     def export_data(self):
@@ -720,9 +1014,9 @@ class DataManager:
                 ]:
                     if os.path.exists(json_file):
                         backup_file = os.path.join(backup_dir, os.path.basename(json_file))
-                        with open(json_file, 'r', encoding='utf-8') as src, \
-                             open(backup_file, 'w', encoding='utf-8') as dst:
-                            dst.write(src.read())
+                        # Sao lưu dữ liệu hiện tại（với SQLite tệp JSON cũ không còn được cập nhật）
+                        with open(backup_file, 'w', encoding='utf-8') as dst:
+                            json.dump(self._read_json(json_file), ensure_ascii=False, indent=2, fp=dst)
                         backup_files[file_name] = backup_file
                 
                 result["details"]["backup_dir"] = backup_dir
@@ -764,9 +1058,8 @@ class DataManager:
                 try:
                     for data_type, backup_file in backup_files.items():
                         dest_file = getattr(self, f"{data_type}_file")
-                        with open(backup_file, 'r', encoding='utf-8') as src, \
-                             open(dest_file, 'w', encoding='utf-8') as dst:
-                            dst.write(src.read())
+                        with open(backup_file, 'r', encoding='utf-8') as src:
+                            self._write_json(dest_file, json.load(src))
                     result["details"]["recovery"] = "Phục hồi từ sao chép lưu"
                 except Exception as recovery_error:
                     result["details"]["recovery_error"] = str(recovery_error)
@@ -1027,8 +1320,8 @@ class DataManager:
                     conn.get('token')
                 )
                 
-                # Cố gắng đăng nhập
-                if alist.login():
+                # Cố gắng đăng nhập（xác minh lại với máy chủ thay vì tin bộ nhớ đệm token）
+                if alist.login(force=True):
                     # Nhận danh sách lưu trữ
                     storage_list = alist.get_storage_list()
                     if isinstance(storage_list, list):
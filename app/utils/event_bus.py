@@ -0,0 +1,79 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class EventBus:
+    """
+    Kênh phát/đăng ký sự kiện trong tiến trình cho Server-Sent Events
+
+    Sự kiện được giữ trong bộ đệm vòng có ID tăng dần，nên người nghe kết nối lại có thể
+    tiếp tục từ Last-Event-ID；ID gồm mã khởi động của tiến trình để nhận ra ID cũ
+    sau khi khởi động lại（khi đó người nghe nhận sự kiện "reset" và tải lại toàn bộ）
+    """
+
+    def __init__(self, capacity=5000):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=capacity)
+        self._seq = itertools.count(1)
+        self._last = 0
+        self.boot_id = format(int(time.time() * 1000), "x")
+
+    def publish(self, event_type, data):
+        """
+        Phát một sự kiện
+
+        tham số:
+            event_type: Loại sự kiện（instance, log, progress, task, system_log）
+            data: Dữ liệu sự kiện（có thể chuyển thành JSON）
+        """
+        with self._cond:
+            self._last = next(self._seq)
+            self._events.append((self._last, event_type, data))
+            self._cond.notify_all()
+        return self._last
+
+    def format_id(self, seq):
+        return f"{self.boot_id}-{seq}"
+
+    def parse_id(self, event_id):
+        """
+        Vị trí tiếp tục từ Last-Event-ID
+
+        trở lại:
+            (số thứ tự, cần_reset)；không có ID thì bắt đầu từ hiện tại
+        """
+        if not event_id:
+            return self._last, False
+        boot_id, _, seq = event_id.partition("-")
+        if boot_id != self.boot_id or not seq.isdigit() or int(seq) > self._last:
+            return self._last, True
+        return int(seq), False
+
+    def wait(self, after, timeout=15):
+        """
+        Các sự kiện có số thứ tự lớn hơn after，chờ tối đa timeout giây nếu chưa có
+
+        trở lại:
+            (danh sách (số thứ tự, loại, dữ liệu), đã_bỏ_lỡ)；đã_bỏ_lỡ là True khi các sự kiện
+            sau after đã bị đẩy ra khỏi bộ đệm
+        """
+        with self._cond:
+            if self._last <= after:
+                self._cond.wait(timeout)
+            if not self._events or self._last <= after:
+                return [], False
+            missed = self._events[0][0] > after + 1
+            # Duyệt ngược vì người nghe thường chỉ chậm vài sự kiện
+            events = []
+            for event in reversed(self._events):
+                if event[0] <= after:
+                    break
+                events.append(event)
+        events.reverse()
+        return events, missed
+
+
+# Kênh dùng chung trong tiến trình
+event_bus = EventBus()
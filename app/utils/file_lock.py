@@ -0,0 +1,94 @@
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class ReadWriteLock:
+    """
+    Khóa đọc/ghi cho một tệp dữ liệu
+
+    Nhiều luồng có thể đọc cùng lúc，luồng ghi độc quyền；luồng đang giữ khóa ghi
+    có thể lấy lại khóa đọc hoặc ghi（để đọc-sửa-ghi trong cùng một giao dịch）。
+    Nếu có lock_file，khóa ghi ngoài cùng còn giữ fcntl.flock trên tệp đó để loại trừ
+    các tiến trình khác（trên Windows chỉ khóa giữa các luồng có hiệu lực）
+    """
+
+    def __init__(self, lock_file=None):
+        self.lock_file = lock_file
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._lock_handle = None
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                # Chỉ chờ luồng đang ghi；đọc thường trúng bộ nhớ đệm nên rất ngắn，
+                # ưu tiên ghi sẽ làm người đọc bị chặn cả giây khi nhiều nhiệm vụ ghi liên tiếp
+                while self._writer is not None:
+                    self._cond.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                if self._writer == me:
+                    self._writer_depth -= 1
+                else:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+                outermost = False
+            else:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writer = me
+                self._writer_depth = 1
+                outermost = True
+        try:
+            if outermost:
+                self._acquire_process_lock()
+            yield
+        finally:
+            if outermost:
+                self._release_process_lock()
+            with self._cond:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+    def _acquire_process_lock(self):
+        if self.lock_file is None or fcntl is None:
+            return
+        handle = open(self.lock_file, "a")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            handle.close()
+            raise
+        self._lock_handle = handle
+
+    def _release_process_lock(self):
+        handle, self._lock_handle = self._lock_handle, None
+        if handle is not None:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            finally:
+                handle.close()
@@ -0,0 +1,117 @@
+import bisect
+import copy
+
+
+class InstanceIndex:
+    """
+    Chỉ mục trong bộ nhớ cho các phiên bản nhiệm vụ ở chế độ JSON
+
+    Giữ các khóa (start_time, id) đã sắp xếp cho toàn bộ phiên bản và cho từng nhiệm vụ，
+    nên lấy N phiên bản mới nhất（có lọc và phân trang）chỉ duyệt đúng số bản ghi cần thiết。
+    Chỉ mục gắn với một phiên bản của tệp（key = (mtime_ns, size)），được cập nhật tại chỗ
+    khi DataManager tự ghi và được xây lại khi tệp bị sửa từ bên ngoài
+    """
+
+    def __init__(self, instances, key=None, last_id=0):
+        """
+        tham số:
+            instances: Danh sách phiên bản đã đọc từ tệp
+            key: Khóa phiên bản của tệp tương ứng
+            last_id: ID lớn nhất đã từng cấp（kể cả các phiên bản đã bị dọn dẹp）
+        """
+        self.key = key
+        self.last_id = last_id or 0
+        self.by_id = {}
+        self.order = []
+        self.by_task = {}
+        for instance in instances:
+            instance_id = instance.get("task_instances_id")
+            if instance_id is None:
+                continue
+            self.by_id[instance_id] = instance
+            sort_key = self._sort_key(instance)
+            self.order.append(sort_key)
+            self.by_task.setdefault(instance.get("task_id"), []).append(sort_key)
+            self.last_id = max(self.last_id, instance_id)
+        self.order.sort()
+        for keys in self.by_task.values():
+            keys.sort()
+
+    @staticmethod
+    def _sort_key(instance):
+        return (instance.get("start_time") or 0, instance.get("task_instances_id") or 0)
+
+    @staticmethod
+    def _discard(keys, sort_key):
+        position = bisect.bisect_left(keys, sort_key)
+        if position < len(keys) and keys[position] == sort_key:
+            del keys[position]
+
+    def next_id(self):
+        """Cấp ID tiếp theo（tăng đơn điệu，không dùng lại ID của phiên bản đã xóa）"""
+        self.last_id += 1
+        return self.last_id
+
+    def put(self, instance):
+        """Thêm hoặc cập nhật một phiên bản"""
+        instance_id = instance["task_instances_id"]
+        if instance_id in self.by_id:
+            self.remove(instance_id)
+        self.by_id[instance_id] = instance
+        sort_key = self._sort_key(instance)
+        bisect.insort(self.order, sort_key)
+        bisect.insort(self.by_task.setdefault(instance.get("task_id"), []), sort_key)
+        self.last_id = max(self.last_id, instance_id)
+
+    def remove(self, instance_id):
+        instance = self.by_id.pop(instance_id, None)
+        if instance is None:
+            return
+        sort_key = self._sort_key(instance)
+        self._discard(self.order, sort_key)
+        task_keys = self.by_task.get(instance.get("task_id"))
+        if task_keys is not None:
+            self._discard(task_keys, sort_key)
+            if not task_keys:
+                del self.by_task[instance.get("task_id")]
+
+    def get(self, instance_id):
+        instance = self.by_id.get(instance_id)
+        return copy.deepcopy(instance) if instance is not None else None
+
+    def query(self, task_id=None, statuses=None, since=None, until=None, cursor=None, limit=50):
+        """
+        Phiên bản mới nhất trước theo (start_time, id)
+
+        tham số:
+            task_id: Chỉ lấy phiên bản của nhiệm vụ này
+            statuses: Tập trạng thái cần lấy，None là tất cả
+            since, until: Khoảng start_time（bao gồm hai đầu）
+            cursor: (start_time, id) của bản ghi cuối trang trước
+            limit: Số bản ghi tối đa
+
+        trở lại:
+            (danh sách phiên bản, con trỏ trang sau hoặc None)
+        """
+        if limit <= 0:
+            return [], None
+        keys = self.by_task.get(task_id, []) if task_id else self.order
+        # Vị trí bắt đầu duyệt ngược：trước con trỏ và không vượt quá until
+        end = len(keys)
+        if until is not None:
+            end = bisect.bisect_right(keys, (until, float("inf")))
+        if cursor is not None:
+            end = min(end, bisect.bisect_left(keys, tuple(cursor)))
+        result = []
+        for position in range(end - 1, -1, -1):
+            start_time, instance_id = keys[position]
+            if since is not None and start_time < since:
+                break
+            instance = self.by_id[instance_id]
+            if statuses and instance.get("status") not in statuses:
+                continue
+            if len(result) == limit:
+                last = result[-1]
+                return result, (last["start_time"] or 0, last["task_instances_id"])
+            result.append(copy.deepcopy(instance))
+        return result, None
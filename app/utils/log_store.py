@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LogStore:
+    """
+    Kho nhật ký hệ thống dạng JSONL chỉ ghi thêm
+
+    Mỗi nhật ký là một dòng được ghi thêm vào phân đoạn mới nhất（logs-000001.jsonl, ...）；
+    phân đoạn được xoay vòng theo kích thước，nhật ký mới nhất được đọc ngược từ cuối
+    phân đoạn mới nhất nên không cần đọc lại，sắp xếp hay ghi lại toàn bộ nhật ký
+    """
+
+    SEGMENT_PATTERN = re.compile(r"^logs-(\d+)\.jsonl$")
+    READ_BLOCK = 64 * 1024
+
+    def __init__(self, log_dir, max_segment_bytes=1024 * 1024, max_segments=20):
+        """
+        tham số:
+            log_dir: Thư mục chứa các phân đoạn
+            max_segment_bytes: Kích thước tối đa của một phân đoạn trước khi xoay vòng
+            max_segments: Số phân đoạn giữ lại tối đa，phân đoạn cũ nhất bị xóa khi xoay vòng
+        """
+        self.log_dir = log_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max(1, max_segments)
+        self._lock = threading.Lock()
+        # Phân đoạn đang ghi: (số thứ tự, đường dẫn, kích thước)
+        self._current = None
+
+    def _segment_path(self, seq):
+        return os.path.join(self.log_dir, f"logs-{seq:06d}.jsonl")
+
+    def segments(self):
+        """Các phân đoạn hiện có từ cũ đến mới: [(số thứ tự, đường dẫn)]"""
+        try:
+            names = os.listdir(self.log_dir)
+        except OSError:
+            return []
+        result = []
+        for name in names:
+            match = self.SEGMENT_PATTERN.match(name)
+            if match:
+                result.append((int(match.group(1)), os.path.join(self.log_dir, name)))
+        return sorted(result)
+
+    def is_empty(self):
+        return not self.segments()
+
+    def _current_segment(self):
+        if self._current is None:
+            segments = self.segments()
+            if segments:
+                seq, path = segments[-1]
+                self._current = (seq, path, os.path.getsize(path))
+            else:
+                self._current = (1, self._segment_path(1), 0)
+        return self._current
+
+    def _rotate(self, seq):
+        """Bắt đầu phân đoạn mới và xóa các phân đoạn vượt quá giới hạn"""
+        segments = self.segments()
+        for _, path in segments[:max(0, len(segments) - (self.max_segments - 1))]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Không xóa được phân đoạn nhật ký cũ {path}: {str(e)}")
+        seq += 1
+        return (seq, self._segment_path(seq), 0)
+
+    def append(self, entry):
+        """Ghi thêm một nhật ký（O(1)，không đọc lại tệp）"""
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            os.makedirs(self.log_dir, exist_ok=True)
+            seq, path, size = self._current_segment()
+            if size and size + len(line) > self.max_segment_bytes:
+                seq, path, size = self._rotate(seq)
+            with open(path, "ab") as f:
+                f.write(line)
+            self._current = (seq, path, size + len(line))
+
+    def _read_reversed(self, path):
+        """Đọc ngược các dòng của một phân đoạn theo từng khối（dòng cuối trước）"""
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b""
+            while position > 0:
+                step = min(self.READ_BLOCK, position)
+                position -= step
+                f.seek(position)
+                lines = (f.read(step) + remainder).split(b"\n")
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line
+            if remainder.strip():
+                yield remainder
+
+    @staticmethod
+    def _parse(line):
+        """Phân tích một dòng，None nếu dòng hỏng（ví dụ đang được ghi dở）"""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        return entry if isinstance(entry, dict) else None
+
+    def recent(self, limit=100):
+        """Nhật ký mới nhất trước，chỉ đọc phần cuối cần thiết của các phân đoạn mới nhất"""
+        result = []
+        for _, path in reversed(self.segments()):
+            try:
+                for line in self._read_reversed(path):
+                    entry = self._parse(line)
+                    if entry is not None:
+                        result.append(entry)
+                        if len(result) >= limit:
+                            return result
+            except OSError:
+                # Phân đoạn vừa bị xóa bởi xoay vòng hoặc dọn dẹp
+                continue
+        return result
+
+    def read_all(self):
+        """Tất cả nhật ký từ cũ đến mới"""
+        result = []
+        for _, path in self.segments():
+            try:
+                with open(path, "rb") as f:
+                    for line in f:
+                        entry = self._parse(line)
+                        if entry is not None:
+                            result.append(entry)
+            except OSError:
+                continue
+        return result
+
+    def _rewrite(self, path, entries):
+        """Ghi lại một phân đoạn（tệp tạm + os.replace）"""
+        temp_file = path + ".tmp"
+        with open(temp_file, "wb") as f:
+            for entry in entries:
+                f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        os.replace(temp_file, path)
+
+    def delete_before(self, cutoff_time):
+        """
+        Xóa nhật ký có timestamp <= cutoff_time
+
+        Phân đoạn cũ hoàn toàn bị xóa nguyên tệp，chỉ phân đoạn chứa mốc cắt được ghi lại
+        """
+        removed = 0
+        with self._lock:
+            for _, path in self.segments():
+                entries = []
+                with open(path, "rb") as f:
+                    for line in f:
+                        entry = self._parse(line)
+                        if entry is not None:
+                            entries.append(entry)
+                kept = [entry for entry in entries if entry.get("timestamp", 0) > cutoff_time]
+                removed += len(entries) - len(kept)
+                if not kept:
+                    os.remove(path)
+                    continue
+                if len(kept) < len(entries):
+                    self._rewrite(path, kept)
+                # Nhật ký được ghi theo thứ tự thời gian，các phân đoạn sau đều mới hơn
+                break
+            self._current = None
+        return removed
+
+    def repair(self):
+        """
+        Ghi lại các phân đoạn bỏ đi những dòng hỏng
+
+        trở lại:
+            Số dòng đã bỏ
+        """
+        dropped = 0
+        with self._lock:
+            for _, path in self.segments():
+                with open(path, "rb") as f:
+                    lines = [line for line in f if line.strip()]
+                entries = [entry for entry in map(self._parse, lines) if entry is not None]
+                if len(entries) < len(lines):
+                    dropped += len(lines) - len(entries)
+                    self._rewrite(path, entries)
+            self._current = None
+        return dropped
+
+    def clear(self):
+        """Xóa tất cả nhật ký"""
+        with self._lock:
+            for _, path in self.segments():
+                os.remove(path)
+            self._current = None
@@ -0,0 +1,215 @@
+import json
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteStore:
+    """
+    Kho dữ liệu SQLite cho DataManager（chế độ WAL）
+
+    Mỗi bản ghi được lưu nguyên dạng JSON trong cột data；khóa chính và các trường cần
+    tìm kiếm（task_id, start_time, timestamp ...）được tách ra cột riêng có chỉ mục，
+    nên đọc/ghi một bản ghi là O(log n) thay vì đọc lại cả tệp
+    """
+
+    # Bảng -> (khóa chính, {cột phụ: trường trong bản ghi})
+    TABLES = {
+        "users": ("id", {"username": "username"}),
+        "connections": ("connection_id", {}),
+        "tasks": ("id", {}),
+        "task_instances": ("task_instances_id", {"task_id": "task_id", "start_time": "start_time", "status": "status"}),
+        "logs": ("id", {"timestamp": "timestamp", "task_id": "task_id"}),
+    }
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT, data TEXT NOT NULL);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username);
+        CREATE TABLE IF NOT EXISTS connections (connection_id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS task_instances (
+            task_instances_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER, start_time INTEGER, status TEXT, data TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_instances_task ON task_instances (task_id, start_time);
+        CREATE INDEX IF NOT EXISTS idx_instances_start ON task_instances (start_time);
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp INTEGER, task_id INTEGER, data TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_logs_task ON logs (task_id, timestamp);
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connection(self):
+        """Mỗi luồng dùng một kết nối riêng"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_values(self, table, record):
+        key, columns = self.TABLES[table]
+        data = {k: v for k, v in record.items() if k != key}
+        return [record.get(field) for field in columns.values()] + [json.dumps(data, ensure_ascii=False)]
+
+    def _to_record(self, table, key_value, data):
+        record = json.loads(data)
+        record[self.TABLES[table][0]] = key_value
+        return record
+
+    # Thao tác chung
+    def all(self, table):
+        """Tất cả bản ghi của bảng theo thứ tự khóa chính"""
+        key = self.TABLES[table][0]
+        rows = self._connection().execute(f"SELECT {key}, data FROM {table} ORDER BY {key}")
+        return [self._to_record(table, key_value, data) for key_value, data in rows]
+
+    def get(self, table, key_value):
+        """Một bản ghi theo khóa chính，None nếu không có"""
+        key = self.TABLES[table][0]
+        row = self._connection().execute(f"SELECT data FROM {table} WHERE {key} = ?", (key_value,)).fetchone()
+        return self._to_record(table, key_value, row[0]) if row else None
+
+    def find(self, table, column, value):
+        """Bản ghi đầu tiên có cột phụ bằng value"""
+        key = self.TABLES[table][0]
+        row = self._connection().execute(
+            f"SELECT {key}, data FROM {table} WHERE {column} = ? LIMIT 1", (value,)).fetchone()
+        return self._to_record(table, row[0], row[1]) if row else None
+
+    def insert(self, table, record):
+        """
+        Thêm bản ghi
+
+        trở lại:
+            Khóa chính của bản ghi（được cấp mới nếu bản ghi chưa có）
+        """
+        key, columns = self.TABLES[table]
+        names = [key] + list(columns) + ["data"]
+        placeholders = ", ".join("?" * len(names))
+        with self._connection() as conn:
+            cursor = conn.execute(f"INSERT INTO {table} ({', '.join(names)}) VALUES ({placeholders})",
+                                  [record.get(key)] + self._row_values(table, record))
+        return record.get(key) or cursor.lastrowid
+
+    def put(self, table, record):
+        """Ghi đè bản ghi có cùng khóa chính，trả về False nếu không tồn tại"""
+        key, columns = self.TABLES[table]
+        assignments = ", ".join(f"{name} = ?" for name in list(columns) + ["data"])
+        with self._connection() as conn:
+            cursor = conn.execute(f"UPDATE {table} SET {assignments} WHERE {key} = ?",
+                                  self._row_values(table, record) + [record[key]])
+        return cursor.rowcount > 0
+
+    def delete(self, table, key_value):
+        key = self.TABLES[table][0]
+        with self._connection() as conn:
+            conn.execute(f"DELETE FROM {table} WHERE {key} = ?", (key_value,))
+
+    def replace_all(self, table, records):
+        """Thay toàn bộ nội dung bảng（dùng cho nhập dữ liệu và các thao tác ghi cả danh sách）"""
+        key, columns = self.TABLES[table]
+        names = [key] + list(columns) + ["data"]
+        placeholders = ", ".join("?" * len(names))
+        with self._connection() as conn:
+            conn.execute(f"DELETE FROM {table}")
+            conn.executemany(f"INSERT INTO {table} ({', '.join(names)}) VALUES ({placeholders})",
+                             [[record.get(key)] + self._row_values(table, record) for record in records or []])
+
+    # Truy vấn có chỉ mục
+    def query_task_instances(self, task_id=None, statuses=None, since=None, until=None, cursor=None, limit=50):
+        """
+        Phân trang phiên bản theo (start_time, id) giảm dần，tham số giống InstanceIndex.query
+
+        trở lại:
+            (danh sách phiên bản, con trỏ trang sau hoặc None)
+        """
+        conditions, params = [], []
+        if task_id:
+            conditions.append("task_id = ?")
+            params.append(task_id)
+        if statuses:
+            conditions.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if since is not None:
+            conditions.append("start_time >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("start_time <= ?")
+            params.append(until)
+        if cursor is not None:
+            conditions.append("(start_time < ? OR (start_time = ? AND task_instances_id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self._connection().execute(
+            f"SELECT task_instances_id, data FROM task_instances {where}"
+            "ORDER BY start_time DESC, task_instances_id DESC LIMIT ?", params + [limit + 1]).fetchall()
+        instances = [self._to_record("task_instances", key_value, data) for key_value, data in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit and instances:
+            next_cursor = (instances[-1].get("start_time") or 0, instances[-1]["task_instances_id"])
+        return instances, next_cursor
+
+    def delete_task_instances_before(self, cutoff_time):
+        """
+        Xóa các phiên bản bắt đầu trước cutoff_time
+
+        trở lại:
+            Danh sách (task_id, task_instances_id) đã xóa
+        """
+        with self._connection() as conn:
+            removed = conn.execute("SELECT task_id, task_instances_id FROM task_instances WHERE start_time <= ?",
+                                   (cutoff_time,)).fetchall()
+            conn.execute("DELETE FROM task_instances WHERE start_time <= ?", (cutoff_time,))
+        return removed
+
+    def recent_logs(self, limit=100):
+        """Nhật ký mới nhất trước"""
+        rows = self._connection().execute(
+            "SELECT id, data FROM logs ORDER BY timestamp DESC, id DESC LIMIT ?", (limit,))
+        return [self._to_record("logs", key_value, data) for key_value, data in rows]
+
+    def delete_logs_before(self, cutoff_time):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM logs WHERE timestamp <= ?", (cutoff_time,))
+
+    # Di chuyển dữ liệu
+    def get_meta(self, key):
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def migrate(self, sources):
+        """
+        Di chuyển dữ liệu một lần từ các tệp JSON cũ
+
+        tham số:
+            sources: {bảng: danh sách bản ghi}
+
+        trở lại:
+            True nếu đã di chuyển trong lần gọi này
+        """
+        if self.get_meta("migrated_from_json"):
+            return False
+        for table, records in sources.items():
+            records = [record for record in records or [] if isinstance(record, dict)]
+            # Nhật ký cũ không có khóa chính，để SQLite cấp theo thứ tự thời gian
+            if table == "logs":
+                records = sorted(records, key=lambda x: x.get("timestamp", 0))
+            self.replace_all(table, records)
+            logger.info(f"Đã di chuyển {len(records)} bản ghi vào bảng {table}")
+        self.set_meta("migrated_from_json", "1")
+        return True
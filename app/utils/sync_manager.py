@@ -12,6 +12,8 @@ from pytz import timezone
 import logging
 import traceback
 from app.utils.notifier import Notifier
+from app.utils.task_executor import TaskExecutor
+from app.utils.event_bus import event_bus
 
 class SyncManager:
     """Trình quản lý đồng bộ hóa，Chịu trách nhiệm thực hiện các nhiệm vụ đồng bộ hóa"""
@@ -21,9 +23,50 @@ class SyncManager:
         self.scheduler = BackgroundScheduler(timezone=timezone('Asia/Shanghai'))
         self.scheduler.start()
         self.running_tasks = {}
+        # Mã hủy của các nhiệm vụ đang chạy: task_id -> CancelToken
+        self.cancel_tokens = {}
         self.lock = threading.Lock()
         self.is_initialized = False
         self.notifier = Notifier()
+        # Bộ thực thi giới hạn số nhiệm vụ chạy đồng thời（max_concurrent_tasks）
+        from config import Config
+        self.executor = TaskExecutor(self.run_task, max_workers=Config.MAX_CONCURRENT_TASKS)
+        # Tuần tự hóa việc kiểm tra、tạo phiên bản và đưa vào hàng đợi
+        self._enqueue_lock = threading.Lock()
+        # Chỉ số tiến độ của các lần chạy: instance_id -> {"task_id": ..., "stats": ..., "started_at": ...}
+        self.progress = {}
+        self._progress_stop = threading.Event()
+        threading.Thread(target=self._publish_progress, name="progress-publisher", daemon=True).start()
+    
+    def _publish_progress(self, interval=2):
+        """Định kỳ phát sự kiện progress cho các lần chạy có chỉ số thay đổi"""
+        last_sent = {}
+        while not self._progress_stop.wait(interval):
+            with self.lock:
+                running = {instance_id: (entry["task_id"], dict(entry["stats"]))
+                           for instance_id, entry in self.progress.items()}
+            for instance_id, (task_id, stats) in running.items():
+                if stats and last_sent.get(instance_id) != stats:
+                    last_sent[instance_id] = stats
+                    event_bus.publish("progress", {"task_id": task_id, "instance_id": instance_id, "stats": stats,
+                                                   "progress": self.get_progress(instance_id)})
+            for instance_id in set(last_sent) - set(running):
+                del last_sent[instance_id]
+    
+    def get_progress(self, instance_id):
+        """
+        Chỉ số tiến độ và thời gian còn lại ước tính của một lần chạy đang diễn ra
+
+        trở lại:
+            Kết quả của progress_snapshot，None nếu phiên bản không chạy trong tiến trình này
+        """
+        from app.alist_sync import progress_snapshot
+        with self.lock:
+            entry = self.progress.get(instance_id)
+            if entry is None:
+                return None
+            stats = dict(entry["stats"])
+        return progress_snapshot(stats, time.time() - entry["started_at"])
     
     def initialize_scheduler(self):
         """Khởi tạo bộ lập lịch，Tải tất cả các nhiệm vụ"""
@@ -37,6 +80,9 @@ class SyncManager:
             data_manager = current_app.config['DATA_MANAGER']
             tasks = data_manager.get_tasks()
             
+            # Số nhiệm vụ đồng thời lấy từ cài đặt
+            self.update_max_concurrent_tasks(data_manager.get_settings().get("max_concurrent_tasks"))
+            
             # Xóa tất cả các nhiệm vụ hiện có
             for job in self.scheduler.get_jobs():
                 self.scheduler.remove_job(job.id)
@@ -121,8 +167,9 @@ class SyncManager:
             cron_parts = self._parse_cron_expression(schedule)
             
             # Thêm một tác vụ mới
+            # Bộ lập lịch chỉ đưa nhiệm vụ vào hàng đợi，bộ thực thi quyết định khi nào chạy
             job = self.scheduler.add_job(
-                self.run_task,
+                self.enqueue_task,
                 'cron',
                 id=job_id,
                 args=[task_id],
@@ -172,8 +219,85 @@ class SyncManager:
         current_app.logger.debug(f"Phân tích cron sự biểu lộ: {cron_expr} -> {result}")
         return result
     
-    def run_task(self, task_id):
-        """Chạy một tác vụ đồng bộ hóa"""
+    def update_max_concurrent_tasks(self, value):
+        """Áp dụng cài đặt max_concurrent_tasks cho bộ thực thi"""
+        try:
+            max_workers = int(value)
+        except (TypeError, ValueError):
+            return
+        if max_workers > 0 and max_workers != self.executor.max_workers:
+            self.executor.set_max_workers(max_workers)
+            logging.getLogger(__name__).info(f"Số nhiệm vụ chạy đồng thời tối đa: {max_workers}")
+
+    def _get_app(self):
+        """Lấy phiên bản ứng dụng hiện tại hoặc phiên bản toàn cầu"""
+        try:
+            return current_app._get_current_object()
+        except RuntimeError:
+            from app import flask_app
+            return flask_app
+
+    def enqueue_task(self, task_id, priority=TaskExecutor.PRIORITY_SCHEDULED, trigger="schedule"):
+        """
+        Đưa nhiệm vụ vào hàng đợi của bộ thực thi
+
+        tham số:
+            task_id: ID nhiệm vụ
+            priority: TaskExecutor.PRIORITY_MANUAL hoặc PRIORITY_SCHEDULED
+            trigger: Nguồn kích hoạt（schedule/manual）
+
+        trở lại:
+            Kết quả của TaskExecutor.submit（hoặc promote nếu nhiệm vụ đã chờ với mức ưu tiên thấp hơn）
+        """
+        app = self._get_app()
+        if app is None:
+            return {"status": "error", "message": "Không thể lấy ngữ cảnh ứng dụng"}
+        # Giữ khóa từ lúc kiểm tra đến khi đưa vào hàng đợi，để hai yêu cầu đồng thời không
+        # cùng tạo phiên bản rồi một phiên bản bị đánh dấu thất bại giả
+        with self._enqueue_lock, app.app_context():
+            data_manager = app.config['DATA_MANAGER']
+            # Nhiệm vụ đang chờ（ví dụ theo lịch）：nâng mục hiện có thay vì tạo phiên bản mới
+            result = self.executor.promote(task_id, priority, trigger)
+            if result is not None:
+                instance_id = result.pop("kwargs").get("instance_id")
+                if result.get("status") == "queued":
+                    data_manager._append_task_log(task_id, instance_id, f"Nhiệm vụ được ưu tiên（{trigger}），Vị trí: {result.get('position')}")
+                result["task_instances_id"] = instance_id
+                return result
+            if self.executor.is_active(task_id):
+                return {"status": "error", "message": "Nhiệm vụ đang chạy hoặc đã ở trong hàng đợi"}
+            
+            task = data_manager.get_task(task_id)
+            if not task:
+                return {"status": "error", "message": "Nhiệm vụ không tồn tại"}
+            
+            # Phiên bản được tạo ngay khi vào hàng đợi để người gọi có ID theo dõi
+            task_instance = data_manager.add_task_instance(task_id, {
+                "sync_type": task.get("sync_type", "file_sync"),
+                "source_path": task.get("source_path", "/"),
+                "target_path": task.get("target_path", "/"),
+                "trigger": trigger
+            }, status="queued")
+            instance_id = task_instance["task_instances_id"]
+            
+            result = self.executor.submit(task_id, priority=priority, group=task.get("connection_id"),
+                                          trigger=trigger, instance_id=instance_id)
+            if result.get("status") != "queued":
+                data_manager.update_task_instance(instance_id, "failed", {"status": "error", "message": result.get("message")})
+            else:
+                data_manager._append_task_log(task_id, instance_id, f"Nhiệm vụ đang chờ trong hàng đợi，Vị trí: {result.get('position')}")
+        
+        result["task_instances_id"] = instance_id
+        return result
+
+    def run_task(self, task_id, instance_id=None):
+        """
+        Chạy một tác vụ đồng bộ hóa
+
+        tham số:
+            task_id: ID nhiệm vụ
+            instance_id: Phiên bản đã tạo khi vào hàng đợi，None để tạo mới
+        """
         # LấyFlaskPhiên bản ứng dụng
         from flask import current_app, Flask
         
@@ -213,26 +337,34 @@ class SyncManager:
             task = data_manager.get_task(task_id)
             
             if not task:
+                if instance_id:
+                    data_manager.update_task_instance(instance_id, "failed", {"status": "error", "message": "Nhiệm vụ không tồn tại"})
                 return {"status": "error", "message": "Nhiệm vụ không tồn tại"}
             
             # Kiểm tra xem nhiệm vụ có đang chạy không
             with self.lock:
                 if task_id in self.running_tasks:
+                    if instance_id:
+                        data_manager.update_task_instance(instance_id, "failed", {"status": "error", "message": "Nhiệm vụ đang chạy"})
                     return {"status": "error", "message": "Nhiệm vụ đang chạy"}
                 self.running_tasks[task_id] = time.time()
             
             try:
-                # Tạo bản ghi phiên bản tác vụ
-                task_instance = data_manager.add_task_instance(task_id, {
-                    "sync_type": task.get("sync_type", "file_sync"),
-                    "source_path": task.get("source_path", "/"),
-                    "target_path": task.get("target_path", "/")
-                })
-                
-                instance_id = task_instance["task_instances_id"]
+                current_time = int(time.time())
+                if instance_id:
+                    # Phiên bản đã được tạo khi vào hàng đợi
+                    data_manager.update_task_instance(instance_id, "running", start_time=current_time)
+                else:
+                    # Tạo bản ghi phiên bản tác vụ
+                    task_instance = data_manager.add_task_instance(task_id, {
+                        "sync_type": task.get("sync_type", "file_sync"),
+                        "source_path": task.get("source_path", "/"),
+                        "target_path": task.get("target_path", "/")
+                    })
+                    
+                    instance_id = task_instance["task_instances_id"]
                 
                 # Cập nhật trạng thái tác vụ
-                current_time = int(time.time())
                 data_manager.update_task_status(task_id, "running", last_run=current_time)
                 
                 # Nhật ký nhật ký bắt đầu
@@ -251,7 +383,8 @@ class SyncManager:
                 result = self._execute_task_with_alist_sync(task, task_id, instance_id)
                 
                 # Cập nhật trạng thái tác vụ
-                status = "completed" if result.get("status") == "success" else "failed"
+                status = {"success": "completed", "cancelled": "cancelled"}.get(result.get("status"), "failed")
+                status_text = {"completed": "thành công", "cancelled": "bị hủy"}.get(status, "thất bại")
                 data_manager.update_task_status(task_id, status, last_run=current_time)
                 
                 # Cập nhật trạng thái phiên bản tác vụ
@@ -261,8 +394,8 @@ class SyncManager:
                 data_manager.add_log({
                     "task_id": task_id,
                     "instance_id": instance_id,
-                    "level": "INFO" if status == "completed" else "ERROR",
-                    "message": f"Thực thi nhiệm vụ {('thành công' if status == 'completed' else 'thất bại')}: {task.get('name', f'Nhiệm vụ {task_id}')}",
+                    "level": {"completed": "INFO", "cancelled": "WARNING"}.get(status, "ERROR"),
+                    "message": f"Thực thi nhiệm vụ {status_text}: {task.get('name', f'Nhiệm vụ {task_id}')}",
                     "details": result
                 })
                 
@@ -270,12 +403,12 @@ class SyncManager:
                 data_manager._append_task_log(
                     task_id, 
                     instance_id, 
-                    f"Thực thi nhiệm vụ {('thành công' if status == 'completed' else 'thất bại')}: {json.dumps(result, ensure_ascii=False)}"
+                    f"Thực thi nhiệm vụ {status_text}: {json.dumps(result, ensure_ascii=False)}"
                 )
                 
                 # Gửi thông báo
                 task_duration = int(time.time()) - current_time
-                notification_title = f"Thực thi nhiệm vụ {'thành công' if status == 'completed' else 'thất bại'}"
+                notification_title = f"Thực thi nhiệm vụ {status_text}"
                 notification_content = result.get("message", "")
                 
                 # Thêm thông tin nhiệm vụ
@@ -305,7 +438,7 @@ class SyncManager:
                 data_manager.update_task_status(task_id, "failed", last_run=int(time.time()))
                 
                 # Nếu một thể hiện đã được tạo，Cập nhật trạng thái thể hiện
-                if 'instance_id' in locals():
+                if instance_id:
                     error_result = {"status": "error", "message": str(e)}
                     data_manager.update_task_instance(instance_id, "failed", error_result)
                     data_manager._append_task_log(task_id, instance_id, f"Ngoại lệ thực thi nhiệm vụ: {str(e)}\n{error_details}")
@@ -332,7 +465,7 @@ class SyncManager:
                     "name": task.get('name', f'Nhiệm vụ {task_id}'),
                     "status": "failed",
                     "duration": f"{task_duration}s",
-                    "instance_id": instance_id if 'instance_id' in locals() else None
+                    "instance_id": instance_id
                 }
                 
                 # Gửi thông báo
@@ -358,7 +491,7 @@ class SyncManager:
     
     def _execute_task_with_alist_sync(self, task, task_id, instance_id):
         """sử dụngAlistSyncThực hiện các nhiệm vụ"""
-        from app.alist_sync import main as alist_sync_main
+        from app.alist_sync import SyncConfig, RunLogFilter, CancelToken, run_sync, progress_snapshot
         from app.alist_sync import logger as alist_sync_logger
         
         # Nhận Trình quản lý dữ liệu
@@ -383,25 +516,29 @@ class SyncManager:
             source_path = task.get("source_path", "/")
             target_path = task.get("target_path", "/")
             
-            # Đặt các biến môi trường，Đảm bảo sử dụng thông tin kết nối chính xác
-            os.environ["BASE_URL"] = connection.get("server", "")
-            os.environ["USERNAME"] = connection.get("username", "")
-            os.environ["PASSWORD"] = connection.get("password", "")
-            os.environ["TOKEN"] = connection.get("token", "")
+            # Cấu hình được truyền thẳng vào công cụ đồng bộ，không dùng biến môi trường dùng chung
+            config = SyncConfig(
+                base_url=connection.get("server", ""),
+                username=connection.get("username", ""),
+                password=connection.get("password", ""),
+                token=connection.get("token", ""),
+                run_id=str(instance_id),
+                cancel_token=CancelToken(),
+            )
             
-            data_manager._append_task_log(task_id, instance_id, f"Thiết lập kết nối: máy chủ={os.environ['BASE_URL']}, Tên người dùng={os.environ['USERNAME']}")
+            data_manager._append_task_log(task_id, instance_id, f"Thiết lập kết nối: máy chủ={config.base_url}, Tên người dùng={config.username}")
             
             # Xác định các hoạt động dựa trên loại nhiệm vụ
             if sync_type == "file_move":
-                os.environ["MOVE_FILE"] = "true"
+                config.move_file = True
                 data_manager._append_task_log(task_id, instance_id, "Đặt thành chế độ di chuyển tệp")
             else:
-                os.environ["MOVE_FILE"] = "false"
+                config.move_file = False
                 data_manager._append_task_log(task_id, instance_id, "Đặt thành chế độ đồng bộ hóa tệp")
             
             # Đặt hành vi xóa mục khác biệt
-            os.environ["SYNC_DELETE_ACTION"] = task.get("sync_diff_action", "none")
-            data_manager._append_task_log(task_id, instance_id, f"Đặt phương thức xử lý mục khác biệt: {os.environ['SYNC_DELETE_ACTION']}")
+            config.sync_delete_action = task.get("sync_diff_action", "none")
+            data_manager._append_task_log(task_id, instance_id, f"Đặt phương thức xử lý mục khác biệt: {config.sync_delete_action}")
             
             # Thiết lập một thư mục đồng bộ
             dir_pairs = []
@@ -437,27 +574,63 @@ class SyncManager:
                         exclude_dirs.extend([exclude_src, exclude_dst])
         
             if dir_pairs:
-                os.environ["DIR_PAIRS"] = ";".join(dir_pairs)
-                data_manager._append_task_log(task_id, instance_id, f"Thiết lập một cặp thư mục đồng bộ: {os.environ['DIR_PAIRS']}")
+                config.dir_pairs = dir_pairs
+                data_manager._append_task_log(task_id, instance_id, f"Thiết lập một cặp thư mục đồng bộ: {';'.join(dir_pairs)}")
                 
                 # Đặt thư mục loại trừ
                 if exclude_dirs:
-                    os.environ["EXCLUDE_DIRS"] = ",".join(exclude_dirs)
-                    data_manager._append_task_log(task_id, instance_id, f"Đặt thư mục loại trừ: {os.environ['EXCLUDE_DIRS']}")
+                    config.exclude_dirs = exclude_dirs
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt thư mục loại trừ: {','.join(exclude_dirs)}")
                 
                 # Đặt tệp loại trừ
                 if task.get("file_filter"):
-                    os.environ["REGEX_PATTERNS"] = task.get("file_filter")
-                    data_manager._append_task_log(task_id, instance_id, f"Đặt bộ lọc tệp: {os.environ['REGEX_PATTERNS']}")
+                    config.regex_patterns = task.get("file_filter")
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt bộ lọc tệp: {config.regex_patterns}")
                 
                 # Đặt tối thiểu/Kích thước tệp tối đa
                 if task.get("size_min"):
-                    os.environ["SIZE_MIN"] = str(task.get("size_min"))
-                    data_manager._append_task_log(task_id, instance_id, f"Đặt kích thước tệp tối thiểu: {os.environ['SIZE_MIN']}")
+                    config.size_min = int(task.get("size_min"))
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt kích thước tệp tối thiểu: {config.size_min}")
 
                 if task.get("size_max"):
-                    os.environ["SIZE_MAX"] = str(task.get("size_max"))
-                    data_manager._append_task_log(task_id, instance_id, f"Đặt kích thước tệp tối đa: {os.environ['SIZE_MAX']}")
+                    config.size_max = int(task.get("size_max"))
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt kích thước tệp tối đa: {config.size_max}")
+
+                # Đặt kích thước lô gửi yêu cầu copy/move/remove
+                if task.get("batch_size"):
+                    config.batch_size = int(task.get("batch_size"))
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt kích thước lô: {config.batch_size}")
+
+                # Đặt số luồng liệt kê thư mục song song
+                if task.get("walk_concurrency"):
+                    config.walk_concurrency = int(task.get("walk_concurrency"))
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt số luồng liệt kê: {config.walk_concurrency}")
+
+                # Đặt ngưỡng hàng đợi sao chép
+                if task.get("queue_high_water") is not None:
+                    config.queue_high_water = int(task.get("queue_high_water"))
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt ngưỡng tạm dừng hàng đợi: {config.queue_high_water}")
+                if task.get("queue_low_water") is not None:
+                    config.queue_low_water = int(task.get("queue_low_water"))
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt ngưỡng tiếp tục hàng đợi: {config.queue_low_water}")
+
+                # Manifest đồng bộ tăng dần được lưu trong thư mục dữ liệu theo từng nhiệm vụ
+                if task.get("use_manifest", True):
+                    config.manifest_dir = os.path.join(data_manager.data_dir, "manifest")
+                    config.manifest_key = str(task_id)
+                    data_manager._append_task_log(task_id, instance_id, f"Bật đồng bộ tăng dần: {config.manifest_dir}")
+
+                # Liệt kê nguồn bằng chỉ mục tìm kiếm của AList
+                if task.get("use_search_index"):
+                    config.use_search_index = True
+                    data_manager._append_task_log(task_id, instance_id, "Bật liệt kê nguồn bằng chỉ mục tìm kiếm")
+                if task.get("search_max_staleness") is not None:
+                    config.search_max_staleness = int(task.get("search_max_staleness"))
+
+                # Đặt số mục mỗi trang khi liệt kê thư mục
+                if task.get("list_page_size"):
+                    config.list_page_size = int(task.get("list_page_size"))
+                    data_manager._append_task_log(task_id, instance_id, f"Đặt số mục mỗi trang: {config.list_page_size}")
                 
                 # Thực hiện chức năng chính
                 data_manager._append_task_log(task_id, instance_id, "Bắt đầu thực hiện đồng bộ hóa...")
@@ -468,21 +641,31 @@ class SyncManager:
                         log_message = self.format(record)
                         data_manager._append_task_log(task_id, instance_id, log_message)
                 
-                # Lấyalist_synccủaloggerVà thêm bộ xử lý tùy chỉnh
-                if alist_sync_logger:
-                    task_log_handler = TaskLogHandler()
-                    formatter = logging.Formatter('%(message)s')
-                    task_log_handler.setFormatter(formatter)
-                    alist_sync_logger.addHandler(task_log_handler)
-                
-                # Thực hiện chức năng chính
-                alist_sync_main()
-                
-                # Nếu bạn đã thêm một bộ xử lý tùy chỉnh，Cần phải được gỡ bỏ
-                if alist_sync_logger and 'task_log_handler' in locals():
+                # Lấyalist_synccủaloggerVà thêm bộ xử lý tùy chỉnh，chỉ nhận nhật ký của lần chạy này
+                task_log_handler = TaskLogHandler()
+                task_log_handler.setFormatter(logging.Formatter('%(message)s'))
+                task_log_handler.addFilter(RunLogFilter(config.run_id))
+                alist_sync_logger.addHandler(task_log_handler)
+                with self.lock:
+                    self.cancel_tokens[task_id] = config.cancel_token
+                    self.progress[instance_id] = {"task_id": task_id, "stats": config.stats, "started_at": time.time()}
+                try:
+                    # Thực hiện chức năng chính
+                    success = run_sync(config)
+                finally:
                     alist_sync_logger.removeHandler(task_log_handler)
-                
-                return {"status": "success", "message": "Thực thi nhiệm vụ đồng bộ thành công", "dir_pairs": dir_pairs}
+                    with self.lock:
+                        self.cancel_tokens.pop(task_id, None)
+                        started_at = self.progress.pop(instance_id)["started_at"]
+                
+                # Chỉ số cuối cùng được lưu trong kết quả của phiên bản；total là số mục đã gửi sao chép
+                details = progress_snapshot(config.stats, time.time() - started_at, running=False)
+                details["total"] = details["copies_submitted"]
+                if config.cancel_token.cancelled:
+                    return {"status": "cancelled", "message": "Nhiệm vụ đã bị hủy", "dir_pairs": dir_pairs, "stats": config.stats, "details": details}
+                if not success:
+                    return {"status": "error", "message": "Một số cặp thư mục đồng bộ không thành công", "dir_pairs": dir_pairs, "stats": config.stats, "details": details}
+                return {"status": "success", "message": "Thực thi nhiệm vụ đồng bộ thành công", "dir_pairs": dir_pairs, "stats": config.stats, "details": details}
             else:
                 return {"status": "error", "message": "Không có cặp thư mục hợp lệ nào được cấu hình"}
                 
@@ -618,20 +801,35 @@ class SyncManager:
         
         return {"status": "success", "message": f"Đồng bộ hóa tệp thành công: {source_path} -> {target_path}"}
     
-    def stop_task(self, task_id):
-        """Ngừng chạy nhiệm vụ"""
+    def stop_task(self, task_id, cancel_copies=False):
+        """
+        Ngừng nhiệm vụ đang chờ hoặc đang chạy
+
+        Nhiệm vụ đang chờ được xóa khỏi hàng đợi；nhiệm vụ đang chạy nhận yêu cầu hủy và dừng
+        liệt kê/gửi tác vụ sau yêu cầu hiện tại，phiên bản được ghi là "cancelled"
+
+        tham số:
+            task_id: ID nhiệm vụ
+            cancel_copies: Hủy luôn các tác vụ sao chép mà lần chạy đã gửi lên AList
+        """
+        data_manager = current_app.config['DATA_MANAGER']
+        entry = self.executor.cancel(task_id)
+        if entry is not None:
+            instance_id = entry["kwargs"].get("instance_id")
+            if instance_id:
+                data_manager.update_task_instance(instance_id, "cancelled", {"status": "cancelled", "message": "Nhiệm vụ bị hủy khi đang chờ"})
+            return {"status": "success", "message": "Nhiệm vụ đã được xóa khỏi hàng đợi"}
+        
         with self.lock:
-            if task_id in self.running_tasks:
-                # Trong các dự án thực tế，Cần có một cơ chế để làm gián đoạn các nhiệm vụ chạy
-                del self.running_tasks[task_id]
-                
-                # Cập nhật trạng thái tác vụ
-                data_manager = current_app.config['DATA_MANAGER']
-                data_manager.update_task_status(task_id, "stopped")
-                
-                return {"status": "success", "message": "Nhiệm vụ đã được dừng lại"}
-            else:
-                return {"status": "error", "message": "Nhiệm vụ không chạy"}
+            cancel_token = self.cancel_tokens.get(task_id)
+            running = task_id in self.running_tasks
+        if cancel_token is not None:
+            cancel_token.cancel(cancel_copies=cancel_copies)
+            data_manager.update_task_status(task_id, "stopping")
+            return {"status": "success", "message": "Đã gửi yêu cầu dừng，nhiệm vụ sẽ dừng sau yêu cầu hiện tại"}
+        if running:
+            return {"status": "error", "message": "Nhiệm vụ đang chuẩn bị chạy，Hãy thử lại sau"}
+        return {"status": "error", "message": "Nhiệm vụ không chạy"}
     
     def reload_scheduler(self):
         """Tải lại tất cả các tác vụ trong Trình lập lịch"""
@@ -693,4 +891,8 @@ class SyncManager:
     
     def shutdown(self):
         """Tắt bộ lập lịch"""
-        self.scheduler.shutdown() 
\ No newline at end of file
+        from app.alist_sync import connection_pool
+        self.scheduler.shutdown()
+        self.executor.shutdown()
+        self._progress_stop.set()
+        connection_pool.close_all()
\ No newline at end of file
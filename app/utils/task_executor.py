@@ -0,0 +1,254 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TaskExecutor:
+    """
+    Bộ thực thi nhiệm vụ đồng bộ với số luồng giới hạn
+
+    Nhiệm vụ được xếp vào hàng đợi ưu tiên（chạy thủ công trước chạy theo lịch）；
+    trong cùng mức ưu tiên，các kết nối được phục vụ luân phiên để một kết nối
+    có nhiều nhiệm vụ không chiếm hết các luồng
+    """
+
+    PRIORITY_MANUAL = 0
+    PRIORITY_SCHEDULED = 10
+
+    def __init__(self, runner, max_workers=3):
+        """
+        tham số:
+            runner: Hàm thực thi nhiệm vụ，được gọi với runner(task_id, **kwargs)
+            max_workers: Số nhiệm vụ chạy đồng thời tối đa
+        """
+        self._runner = runner
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # Mỗi kết nối có một heap riêng: group -> [(priority, seq, task_id)]
+        self._queues = {}
+        self._queued = {}
+        self._running = {}
+        # Lần cuối mỗi kết nối được phục vụ，dùng để luân phiên
+        self._last_served = {}
+        self._served = itertools.count()
+        self._workers = []
+        self._stopped = False
+        self.max_workers = max(1, int(max_workers or 1))
+        self._spawn_workers()
+
+    def _spawn_workers(self):
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"task-worker-{next(self._seq)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def set_max_workers(self, max_workers):
+        """Thay đổi số nhiệm vụ chạy đồng thời tối đa，luồng thừa thoát sau khi xong nhiệm vụ hiện tại"""
+        with self._cond:
+            self.max_workers = max(1, int(max_workers or 1))
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def submit(self, task_id, priority=PRIORITY_SCHEDULED, group=None, trigger="schedule", **kwargs):
+        """
+        Đưa nhiệm vụ vào hàng đợi
+
+        tham số:
+            task_id: ID nhiệm vụ
+            priority: Giá trị nhỏ hơn được chạy trước
+            group: Khóa công bằng（ID kết nối）
+            trigger: Nguồn kích hoạt，chỉ dùng để hiển thị
+            kwargs: Tham số bổ sung truyền cho runner
+
+        trở lại:
+            {"status": "queued"|"error", "message": ..., "position": ...}
+        """
+        with self._cond:
+            if self._stopped:
+                return {"status": "error", "message": "Bộ thực thi đã dừng"}
+            if task_id in self._running:
+                return {"status": "error", "message": "Nhiệm vụ đang chạy"}
+            if task_id in self._queued:
+                # Dùng promote để nâng mức ưu tiên của mục đã có
+                return {"status": "error", "message": "Nhiệm vụ đã ở trong hàng đợi",
+                        "position": self._position(task_id)}
+            entry = {
+                "task_id": task_id,
+                "priority": priority,
+                "group": group,
+                "trigger": trigger,
+                "kwargs": kwargs,
+                "queued_at": time.time(),
+            }
+            self._queued[task_id] = entry
+            heapq.heappush(self._queues.setdefault(group, []), (priority, next(self._seq), task_id))
+            self._cond.notify()
+            position = self._position(task_id)
+        logger.info(f"Nhiệm vụ {task_id} được đưa vào hàng đợi（{trigger}），Vị trí: {position}")
+        return {"status": "queued", "message": "Nhiệm vụ đã được đưa vào hàng đợi", "position": position}
+
+    def promote(self, task_id, priority, trigger=None):
+        """
+        Nâng mức ưu tiên của nhiệm vụ đang chờ，giữ nguyên mục và tham số của nó
+
+        tham số:
+            task_id: ID nhiệm vụ
+            priority: Mức ưu tiên mới，chỉ có tác dụng khi nhỏ hơn mức hiện tại
+            trigger: Nguồn kích hoạt mới，None để giữ nguyên
+
+        trở lại:
+            None nếu nhiệm vụ không ở trong hàng đợi，nếu không
+            {"status": "queued"|"error", "message": ..., "position": ..., "kwargs": ...}
+        """
+        with self._cond:
+            entry = self._queued.get(task_id)
+            if entry is None:
+                return None
+            if priority >= entry["priority"]:
+                return {"status": "error", "message": "Nhiệm vụ đã ở trong hàng đợi",
+                        "position": self._position(task_id), "kwargs": dict(entry["kwargs"])}
+            heap = self._queues[entry["group"]]
+            heap[:] = [item for item in heap if item[2] != task_id]
+            heapq.heapify(heap)
+            entry["priority"] = priority
+            if trigger is not None:
+                entry["trigger"] = trigger
+            heapq.heappush(heap, (priority, next(self._seq), task_id))
+            self._cond.notify()
+            position = self._position(task_id)
+        logger.info(f"Nhiệm vụ {task_id} được nâng mức ưu tiên trong hàng đợi，Vị trí: {position}")
+        return {"status": "queued", "message": "Nhiệm vụ đã được ưu tiên trong hàng đợi",
+                "position": position, "kwargs": dict(entry["kwargs"])}
+
+    def cancel(self, task_id):
+        """Xóa nhiệm vụ khỏi hàng đợi nếu chưa chạy，trả về mục đã xóa hoặc None"""
+        with self._cond:
+            return self._remove_queued(task_id)
+
+    def _remove_queued(self, task_id):
+        entry = self._queued.pop(task_id, None)
+        if entry is not None:
+            heap = self._queues.get(entry["group"], [])
+            heap[:] = [item for item in heap if item[2] != task_id]
+            heapq.heapify(heap)
+            if not heap:
+                self._queues.pop(entry["group"], None)
+        return entry
+
+    def _pick(self):
+        """Chọn nhiệm vụ tiếp theo：mức ưu tiên cao nhất，sau đó kết nối lâu chưa được phục vụ nhất"""
+        best = None
+        for group, heap in self._queues.items():
+            priority, seq, task_id = heap[0]
+            key = (priority, self._last_served.get(group, -1), seq)
+            if best is None or key < best[0]:
+                best = (key, group)
+        if best is None:
+            return None
+        group = best[1]
+        heap = self._queues[group]
+        _, _, task_id = heapq.heappop(heap)
+        if not heap:
+            del self._queues[group]
+        self._last_served[group] = next(self._served)
+        return self._queued.pop(task_id)
+
+    def _position(self, task_id):
+        for index, entry in enumerate(self.queued()):
+            if entry["task_id"] == task_id:
+                return index + 1
+        return None
+
+    def _work(self):
+        current = threading.current_thread()
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._queues or len(self._running) >= self.max_workers):
+                    if self._workers.index(current) >= self.max_workers:
+                        self._workers.remove(current)
+                        return
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                entry = self._pick()
+                entry["started_at"] = time.time()
+                self._running[entry["task_id"]] = entry
+            try:
+                self._runner(entry["task_id"], **entry["kwargs"])
+            except Exception as e:
+                logger.error(f"Nhiệm vụ {entry['task_id']} gặp lỗi trong bộ thực thi: {str(e)}", exc_info=True)
+            finally:
+                with self._cond:
+                    self._running.pop(entry["task_id"], None)
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _describe(entry, now):
+        info = {
+            "task_id": entry["task_id"],
+            "priority": entry["priority"],
+            "connection_id": entry["group"],
+            "trigger": entry["trigger"],
+            "queued_at": int(entry["queued_at"]),
+            "waited": int(entry.get("started_at", now) - entry["queued_at"]),
+        }
+        if "started_at" in entry:
+            info["started_at"] = int(entry["started_at"])
+            info["elapsed"] = int(now - entry["started_at"])
+        return info
+
+    def queued(self):
+        """Danh sách nhiệm vụ đang chờ theo thứ tự sẽ được chạy"""
+        with self._cond:
+            queues = {group: list(heap) for group, heap in self._queues.items()}
+            last_served = dict(self._last_served)
+            entries = dict(self._queued)
+        # Mô phỏng _pick trên bản sao để có đúng thứ tự luân phiên
+        order = []
+        served = itertools.count(max(last_served.values(), default=-1) + 1)
+        while queues:
+            group = min(queues, key=lambda g: (queues[g][0][0], last_served.get(g, -1), queues[g][0][1]))
+            _, _, task_id = heapq.heappop(queues[group])
+            if not queues[group]:
+                del queues[group]
+            last_served[group] = next(served)
+            order.append(entries[task_id])
+        now = time.time()
+        return [self._describe(entry, now) for entry in order]
+
+    def running(self):
+        """Danh sách nhiệm vụ đang chạy"""
+        with self._cond:
+            entries = list(self._running.values())
+        now = time.time()
+        return [self._describe(entry, now) for entry in entries]
+
+    def is_active(self, task_id):
+        """Nhiệm vụ đang chờ hoặc đang chạy"""
+        with self._cond:
+            return task_id in self._queued or task_id in self._running
+
+    def status(self):
+        """Trạng thái bộ thực thi cho API"""
+        return {
+            "max_workers": self.max_workers,
+            "running": self.running(),
+            "queued": self.queued(),
+        }
+
+    def shutdown(self, wait=False):
+        """Dừng nhận nhiệm vụ mới và bỏ các nhiệm vụ đang chờ"""
+        with self._cond:
+            self._stopped = True
+            self._queues.clear()
+            self._queued.clear()
+            self._cond.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join()
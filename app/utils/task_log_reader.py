@@ -0,0 +1,200 @@
+import os
+import re
+
+# Kích thước khối khi đọc tệp nhật ký
+BLOCK_SIZE = 64 * 1024
+# Kích thước khối khi tìm kiếm（tìm trên cả khối nhanh hơn nhiều so với từng dòng）
+SEARCH_BLOCK_SIZE = 1024 * 1024
+
+
+def _decode(line):
+    return line.rstrip(b"\r\n").decode("utf-8", errors="replace")
+
+
+def tail_lines(path, count, before=None):
+    """
+    Đọc count dòng cuối cùng trước vị trí before bằng cách đọc ngược từng khối
+
+    tham số:
+        path: Đường dẫn tệp nhật ký
+        count: Số dòng cần lấy
+        before: Vị trí byte kết thúc（mặc định là cuối tệp），dùng để xem các trang cũ hơn
+
+    trở lại:
+        {"lines": [...], "start": vị trí dòng đầu tiên, "end": vị trí kết thúc, "size": kích thước tệp}
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if before is None else max(0, min(before, size))
+        position = end
+        buffer = b""
+        # Cần count + 1 dấu xuống dòng（hoặc đầu tệp）để chắc chắn có đủ count dòng hoàn chỉnh
+        while position > 0 and buffer.count(b"\n") <= count:
+            step = min(BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            buffer = f.read(step) + buffer
+    # Dòng cuối chưa có dấu xuống dòng（nhiệm vụ vẫn đang ghi）được bỏ qua
+    buffer = buffer[:buffer.rfind(b"\n") + 1]
+    end = position + len(buffer)
+    lines = buffer.split(b"\n")[:-1]
+    if position > 0 and lines:
+        # Dòng đầu tiên trong bộ đệm có thể chưa hoàn chỉnh
+        lines.pop(0)
+    lines = lines[-count:] if count > 0 else []
+    start = end - sum(len(line) + 1 for line in lines)
+    return {"lines": [_decode(line) for line in lines], "start": start, "end": end, "size": size}
+
+
+def read_range(path, offset=0, length=256 * 1024):
+    """
+    Đọc các dòng hoàn chỉnh trong khoảng byte [offset, offset + length)
+
+    Nếu offset nằm giữa một dòng thì bỏ qua phần còn lại của dòng đó；dòng cuối chưa có
+    dấu xuống dòng（nhiệm vụ vẫn đang ghi）không được trả về cho đến khi hoàn chỉnh
+
+    trở lại:
+        {"lines": [...], "start": ..., "next_offset": vị trí đọc tiếp theo, "size": ...}
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = max(0, min(offset, size))
+        if offset > 0:
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                offset += len(f.readline())
+        f.seek(offset)
+        chunk = f.read(max(0, length))
+    cut = chunk.rfind(b"\n")
+    if cut >= 0:
+        chunk = chunk[:cut + 1]
+    elif len(chunk) < length:
+        # Chỉ còn một dòng chưa hoàn chỉnh ở cuối tệp
+        chunk = b""
+    # Một dòng dài hơn length được trả về từng phần
+    lines = chunk.split(b"\n")[:-1] if chunk.endswith(b"\n") else [chunk] if chunk else []
+    return {"lines": [_decode(line) for line in lines], "start": offset,
+            "next_offset": offset + len(chunk), "size": size}
+
+
+class LogPattern:
+    """
+    Mẫu tìm kiếm nhật ký
+
+    Với tìm chuỗi con，khối không chứa chuỗi được bỏ qua bằng so khớp chuỗi thường
+    （nhanh hơn nhiều so với biểu thức chính quy không phân biệt hoa thường）
+    """
+
+    def __init__(self, pattern, regex=False, ignore_case=True):
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        self.regex = re.compile(pattern if regex else re.escape(pattern), flags)
+        self.ignore_case = ignore_case
+        self.literal = None if regex else (pattern.lower() if ignore_case else pattern)
+
+    def may_match(self, text):
+        if self.literal is None:
+            return True
+        return self.literal in (text.lower() if self.ignore_case else text)
+
+    def search(self, text, pos=0):
+        return self.regex.search(text, pos)
+
+
+def compile_pattern(pattern, regex=False, ignore_case=True):
+    """Biên dịch mẫu tìm kiếm（chuỗi con hoặc biểu thức chính quy），ném re.error nếu không hợp lệ"""
+    return LogPattern(pattern, regex, ignore_case)
+
+
+def _iter_matches(f, pattern, position):
+    """
+    Các dòng hoàn chỉnh khớp mẫu bắt đầu từ position: (vị trí byte, dòng)
+
+    Tìm kiếm trên cả khối đã giải mã thay vì từng dòng；surrogateescape giữ đúng số byte
+    nên vị trí trả về luôn chính xác kể cả khi tệp có byte không hợp lệ
+    """
+    f.seek(position)
+    while True:
+        data = f.read(SEARCH_BLOCK_SIZE)
+        if not data:
+            return
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            if len(data) < SEARCH_BLOCK_SIZE:
+                # Chỉ còn một dòng chưa hoàn chỉnh ở cuối tệp
+                return
+            data += f.readline()
+            cut = data.rfind(b"\n")
+            if cut < 0:
+                return
+        data = data[:cut + 1]
+        f.seek(position + len(data))
+        text = data.decode("utf-8", errors="surrogateescape")
+        if not pattern.may_match(text):
+            position += len(data)
+            continue
+        char_position, byte_position = 0, position
+        search_from = 0
+        while True:
+            match = pattern.search(text, search_from)
+            # Khớp rỗng ở cuối khối（$, ^, x* ...）không thuộc dòng nào
+            if not match or match.start() >= len(text):
+                break
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            line_end = text.find("\n", match.start())
+            if line_end < 0:
+                break
+            line = text[line_start:line_end]
+            search_from = line_end + 1
+            # Mẫu có thể khớp qua dấu xuống dòng，chỉ nhận nếu khớp trong chính dòng đó
+            if match.end() > line_end and not pattern.search(line):
+                continue
+            byte_position += len(text[char_position:line_start].encode("utf-8", errors="surrogateescape"))
+            char_position = line_start
+            yield byte_position, line.encode("utf-8", errors="surrogateescape")
+        position += len(data)
+
+
+def grep_lines(path, pattern, offset=0, limit=1000):
+    """
+    Tìm các dòng khớp mẫu từ vị trí offset，bộ nhớ không phụ thuộc kích thước tệp
+
+    tham số:
+        pattern: Mẫu đã biên dịch từ compile_pattern
+        offset: Vị trí byte bắt đầu quét
+        limit: Số dòng khớp tối đa
+
+    trở lại:
+        {"lines": [...], "offsets": [vị trí từng dòng], "next_offset": vị trí quét tiếp hoặc None, "size": ...}
+    """
+    lines, offsets = [], []
+    next_offset = None
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        for position, raw in _iter_matches(f, pattern, max(0, min(offset, size))):
+            if len(lines) == limit:
+                next_offset = position
+                break
+            lines.append(_decode(raw))
+            offsets.append(position)
+    return {"lines": lines, "offsets": offsets, "next_offset": next_offset, "size": size}
+
+
+def iter_chunks(path, pattern=None):
+    """Trả dần nội dung tệp theo khối（hoặc chỉ các dòng khớp pattern）để phát trực tiếp"""
+    with open(path, "rb") as f:
+        if pattern is None:
+            while True:
+                chunk = f.read(BLOCK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        batch = []
+        batch_size = 0
+        for _, raw in _iter_matches(f, pattern, 0):
+            batch.append(raw + b"\n")
+            batch_size += len(raw) + 1
+            if batch_size >= BLOCK_SIZE:
+                yield b"".join(batch)
+                batch, batch_size = [], 0
+        if batch:
+            yield b"".join(batch)
@@ -19,6 +19,9 @@ class Config:
     # Thư mục tệp cấu hình
     CONFIG_DIR = os.path.join(DATA_DIR, 'config')
     
+    # Kho dữ liệu: json（mặc định）hoặc sqlite
+    DATA_BACKEND = os.environ.get('DATA_BACKEND', 'json')
+    
     # Cấu hình nhật ký
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_DIR = os.path.join(DATA_DIR, 'log')
@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+from flask import Flask
+
+import app as app_package
+from app.utils.data_manager import DataManager
+from app.utils.sync_manager import SyncManager
+from app.utils.task_executor import TaskExecutor
+
+
+class Recorder:
+    """runner ghi lại thứ tự chạy；nhiệm vụ "block" giữ luồng duy nhất đến khi được thả"""
+
+    def __init__(self):
+        self.order = []
+        self.calls = {}
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.done = threading.Semaphore(0)
+
+    def __call__(self, task_id, **kwargs):
+        if task_id == "block":
+            self.started.set()
+            self.release.wait(5)
+        else:
+            self.order.append(task_id)
+            self.calls[task_id] = kwargs
+        self.done.release()
+
+    def wait(self, count):
+        for _ in range(count):
+            assert self.done.acquire(timeout=5)
+
+
+@pytest.fixture
+def blocked():
+    """Bộ thực thi một luồng đang bận，để các nhiệm vụ gửi sau chỉ nằm trong hàng đợi"""
+    recorder = Recorder()
+    executor = TaskExecutor(recorder, max_workers=1)
+    executor.submit("block", group="other")
+    assert recorder.started.wait(5)
+    yield executor, recorder
+    recorder.release.set()
+    executor.shutdown(wait=True)
+
+
+def test_manual_runs_before_scheduled(blocked):
+    executor, recorder = blocked
+    executor.submit(1, group="a")
+    executor.submit(2, priority=TaskExecutor.PRIORITY_MANUAL, group="a", trigger="manual")
+    assert [entry["task_id"] for entry in executor.queued()] == [2, 1]
+    recorder.release.set()
+    recorder.wait(3)
+    assert recorder.order == [2, 1]
+
+
+def test_groups_take_turns(blocked):
+    executor, recorder = blocked
+    for task_id in (1, 2, 3):
+        executor.submit(task_id, group="a")
+    executor.submit(4, group="b")
+    assert [entry["task_id"] for entry in executor.queued()] == [1, 4, 2, 3]
+    recorder.release.set()
+    recorder.wait(5)
+    assert recorder.order == [1, 4, 2, 3]
+
+
+def test_submit_rejects_queued_task(blocked):
+    executor, _ = blocked
+    assert executor.submit(1, group="a", instance_id=10)["status"] == "queued"
+    result = executor.submit(1, priority=TaskExecutor.PRIORITY_MANUAL, group="a", instance_id=11)
+    assert result["status"] == "error"
+    assert result["position"] == 1
+
+
+def test_promote_overtakes_and_keeps_entry(blocked):
+    executor, recorder = blocked
+    executor.submit(1, group="a", instance_id=10)
+    executor.submit(2, group="a", instance_id=20)
+    result = executor.promote(2, TaskExecutor.PRIORITY_MANUAL, "manual")
+    assert result["status"] == "queued"
+    assert result["position"] == 1
+    assert result["kwargs"] == {"instance_id": 20}
+    assert executor.queued()[0]["trigger"] == "manual"
+    # Không nâng được lần nữa，cũng không có nhiệm vụ ngoài hàng đợi
+    assert executor.promote(2, TaskExecutor.PRIORITY_MANUAL)["status"] == "error"
+    assert executor.promote(3, TaskExecutor.PRIORITY_MANUAL) is None
+    recorder.release.set()
+    recorder.wait(3)
+    assert recorder.order == [2, 1]
+    assert recorder.calls[2] == {"instance_id": 20}
+
+
+@pytest.fixture
+def sync_manager(tmp_path, monkeypatch):
+    flask_app = Flask("test")
+    data_manager = DataManager(str(tmp_path))
+    flask_app.config['DATA_MANAGER'] = data_manager
+    monkeypatch.setattr(app_package, "flask_app", flask_app, raising=False)
+    with flask_app.app_context():
+        manager = SyncManager()
+        yield manager, data_manager
+        manager.shutdown()
+
+
+def test_manual_enqueue_promotes_scheduled_instance(sync_manager):
+    manager, data_manager = sync_manager
+    recorder = Recorder()
+    manager.executor.shutdown(wait=True)
+    manager.executor = TaskExecutor(recorder, max_workers=1)
+    manager.executor.submit("block", group="other")
+    assert recorder.started.wait(5)
+    first = data_manager.add_task({"name": "first", "connection_id": 1})
+    second = data_manager.add_task({"name": "second", "connection_id": 1})
+
+    manager.enqueue_task(first)
+    scheduled = manager.enqueue_task(second)
+    manual = manager.enqueue_task(second, priority=TaskExecutor.PRIORITY_MANUAL, trigger="manual")
+
+    assert manual["status"] == "queued"
+    assert manual["position"] == 1
+    assert manual["task_instances_id"] == scheduled["task_instances_id"]
+    assert len(data_manager.get_task_instances(second)) == 1
+    recorder.release.set()
+    recorder.wait(3)
+    assert recorder.order == [second, first]
+    assert recorder.calls[second] == {"instance_id": scheduled["task_instances_id"]}
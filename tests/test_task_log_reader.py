@@ -0,0 +1,132 @@
+import os
+
+import pytest
+
+from app.utils import task_log_reader
+from app.utils.task_log_reader import compile_pattern, grep_lines, iter_chunks, read_range, tail_lines
+
+
+LINES = [f"dòng {i} {'lỗi' if i % 7 == 0 else 'ok'}" for i in range(200)]
+
+
+def _offsets(raw):
+    """Vị trí byte bắt đầu của từng dòng"""
+    positions, position = [], 0
+    for line in raw.split(b"\n")[:-1]:
+        positions.append(position)
+        position += len(line) + 1
+    return positions
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "task.log"
+    path.write_bytes(("\n".join(LINES) + "\n").encode("utf-8"))
+    return str(path)
+
+
+@pytest.fixture(params=[5, 64])
+def small_blocks(request, monkeypatch):
+    """Khối nhỏ để các dòng nằm vắt qua ranh giới khối"""
+    monkeypatch.setattr(task_log_reader, "BLOCK_SIZE", request.param)
+    monkeypatch.setattr(task_log_reader, "SEARCH_BLOCK_SIZE", request.param)
+
+
+def test_tail_lines_returns_last_lines(log_file, small_blocks):
+    result = tail_lines(log_file, 10)
+    raw = open(log_file, "rb").read()
+    assert result["lines"] == LINES[-10:]
+    assert result["end"] == result["size"] == len(raw)
+    assert result["start"] == _offsets(raw)[-10]
+
+
+def test_tail_lines_pages_backwards_with_before(log_file, small_blocks):
+    collected = []
+    before = None
+    while True:
+        result = tail_lines(log_file, 30, before)
+        if not result["lines"]:
+            break
+        collected = result["lines"] + collected
+        before = result["start"]
+    assert collected == LINES
+
+
+def test_tail_lines_skips_unterminated_last_line(tmp_path):
+    path = tmp_path / "task.log"
+    path.write_bytes(b"a\nb\nc")
+    result = tail_lines(str(path), 5)
+    assert result["lines"] == ["a", "b"]
+    assert result["end"] == 4
+
+
+def test_tail_lines_more_than_file(log_file):
+    result = tail_lines(log_file, 1000)
+    assert result["lines"] == LINES
+    assert result["start"] == 0
+
+
+def test_read_range_walks_whole_file(log_file):
+    collected = []
+    offset = 0
+    while True:
+        result = read_range(log_file, offset, 100)
+        if result["next_offset"] == offset:
+            break
+        collected.extend(result["lines"])
+        offset = result["next_offset"]
+    assert collected == LINES
+    assert offset == os.path.getsize(log_file)
+
+
+def test_read_range_skips_partial_first_line(log_file):
+    raw = open(log_file, "rb").read()
+    second = _offsets(raw)[1]
+    result = read_range(log_file, second - 2, 1000)
+    assert result["start"] == second
+    assert result["lines"][0] == LINES[1]
+
+
+def test_read_range_waits_for_unterminated_line(tmp_path):
+    path = tmp_path / "task.log"
+    path.write_bytes(b"a\nbc")
+    result = read_range(str(path), 2, 100)
+    assert result["lines"] == []
+    assert result["next_offset"] == 2
+
+
+def test_grep_lines_offsets_and_paging(log_file, small_blocks):
+    raw = open(log_file, "rb").read()
+    offsets = _offsets(raw)
+    expected = [(offsets[i], line) for i, line in enumerate(LINES) if "lỗi" in line]
+    pattern = compile_pattern("LỖI")
+    found = []
+    offset = 0
+    while offset is not None:
+        result = grep_lines(log_file, pattern, offset, limit=4)
+        found.extend(zip(result["offsets"], result["lines"]))
+        offset = result["next_offset"]
+    assert found == expected
+
+
+def test_grep_lines_regex(log_file, small_blocks):
+    result = grep_lines(log_file, compile_pattern(r"^dòng 1\d ", regex=True))
+    assert result["lines"] == LINES[10:20]
+
+
+@pytest.mark.parametrize("expression", ["$", "^", r"\Z", "x*"])
+def test_grep_lines_empty_matches_terminate(tmp_path, expression):
+    path = tmp_path / "task.log"
+    path.write_bytes(b"abc\ndef\n")
+    result = grep_lines(str(path), compile_pattern(expression, regex=True))
+    assert all(offset < 8 for offset in result["offsets"])
+    assert len(result["offsets"]) == len(set(result["offsets"])) <= 2
+    assert b"".join(iter_chunks(str(path), compile_pattern(expression, regex=True))) in (b"", b"abc\ndef\n")
+
+
+def test_grep_lines_handles_invalid_utf8(tmp_path):
+    path = tmp_path / "task.log"
+    path.write_bytes(b"\xff\xfe bad\n" + "lỗi here\n".encode("utf-8"))
+    raw = path.read_bytes()
+    result = grep_lines(str(path), compile_pattern("here"))
+    assert result["offsets"] == [raw.index(b"\n") + 1]